@@ -0,0 +1,88 @@
+"""
+bench_dataframe.py
+Compara la acumulación de filas y la construcción del DataFrame (sin contar el
+parseo): un diccionario por item (anterior) contra ConstructorColumnar.
+
+Uso:
+    python benchmarks/bench_dataframe.py [--docs 20000] [--items 5]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from xml_processor import ConstructorColumnar, _parse_documento, serializar_impuestos
+from dte_sintetico import generar_xml_dte
+
+
+def _documentos(xmls: list) -> list:
+    """Parsea cada XML una vez: (encabezado, items) con Impuestos ya serializado."""
+    documentos = []
+    for i, xml in enumerate(xmls):
+        encabezado, items = _parse_documento(io.BytesIO(xml), f"DTE-{i}.xml")
+        for item in items:
+            item["Impuestos"] = serializar_impuestos(item["Impuestos"])
+        documentos.append((encabezado, items))
+    return documentos
+
+
+def con_diccionarios(documentos: list) -> pd.DataFrame:
+    all_rows = []
+    for encabezado, items in documentos:
+        all_rows.extend({**encabezado, **item} for item in items)
+    return pd.DataFrame(all_rows)
+
+
+def con_columnas(documentos: list) -> pd.DataFrame:
+    constructor = ConstructorColumnar()
+    for encabezado, items in documentos:
+        constructor.agregar_documento(encabezado, items)
+    return constructor.to_dataframe()
+
+
+def medir(nombre: str, funcion, documentos: list):
+    """Devuelve (DataFrame, segundos, pico de memoria en bytes) de acumular + construir."""
+    inicio = time.perf_counter()
+    df = funcion(documentos)
+    segundos = time.perf_counter() - inicio
+
+    # La memoria se mide en una segunda corrida: tracemalloc distorsiona los tiempos
+    del df
+    tracemalloc.start()
+    df = funcion(documentos)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"   {nombre:<28} {segundos:7.2f} s   pico {pico / 1e6:8.1f} MB")
+    return df, segundos, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=5, help="Items máximos por documento")
+    args = parser.parse_args()
+
+    xmls = [generar_xml_dte(i, 1 + i % args.items).encode("utf-8") for i in range(args.docs)]
+    documentos = _documentos(xmls)
+
+    print(f"\n📊 DataFrame desde {args.docs} documentos")
+    print("-" * 64)
+    df_antes, t_antes, m_antes = medir("dict por item (anterior)", con_diccionarios, documentos)
+    df_despues, t_despues, m_despues = medir("ConstructorColumnar", con_columnas, documentos)
+    print("-" * 64)
+
+    pd.testing.assert_frame_equal(df_antes, df_despues)
+    print(f"   Filas: {len(df_despues):,}  (resultados idénticos)")
+    print(f"   Tiempo: {t_antes / t_despues:.2f}x   Memoria pico: {m_antes / m_despues:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
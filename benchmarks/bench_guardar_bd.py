@@ -0,0 +1,92 @@
+"""
+bench_guardar_bd.py
+Compara la carga a SQLite: DataFrame.to_sql (camino anterior, tabla ancha) contra
+cargar_masivo (esquema normalizado, una transacción, executemany y PRAGMAs de carga),
+tanto desde un DataFrame como en streaming directo desde el parser.
+
+Uso:
+    python benchmarks/bench_guardar_bd.py [--docs 30000] [--items 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+
+from xml_processor import extraer_productos_de_zip, iterar_filas_de_zip
+from xml_storage import inicializar_bd, cargar_masivo, filas_de_dataframe
+from dte_sintetico import generar_zip
+
+FECHA_CARGA = "2025-01-01 00:00:00"
+
+
+def _engine_nuevo(directorio: str, nombre: str):
+    """Engine sobre una BD vacía (archivo nuevo en el directorio temporal)."""
+    return create_engine(f"sqlite:///{os.path.join(directorio, nombre)}")
+
+
+def medir(nombre: str, funcion) -> float:
+    inicio = time.perf_counter()
+    filas = funcion()
+    segundos = time.perf_counter() - inicio
+    print(f"   {nombre:<44} {segundos:7.2f} s   {filas / segundos:10,.0f} filas/s")
+    return segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=30000)
+    parser.add_argument("--items", type=int, default=5, help="Items máximos por documento")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        zip_path = generar_zip(os.path.join(directorio, "dte.zip"), args.docs, args.items)
+        df, _ = extraer_productos_de_zip(zip_path)
+        df["fecha_carga"] = FECHA_CARGA
+        filas = len(df)
+
+        def con_to_sql():
+            engine = _engine_nuevo(directorio, "to_sql.db")
+            df.to_sql("xml_data", engine, if_exists="append", index=False, chunksize=1000)
+            return filas
+
+        def con_cargar_masivo():
+            engine = _engine_nuevo(directorio, "masivo.db")
+            inicializar_bd(engine)
+            insertadas, _, _ = cargar_masivo(engine, filas_de_dataframe(df))
+            return insertadas
+
+        def zip_con_to_sql():
+            engine = _engine_nuevo(directorio, "zip_to_sql.db")
+            df_zip, _ = extraer_productos_de_zip(zip_path)
+            df_zip["fecha_carga"] = FECHA_CARGA
+            df_zip.to_sql("xml_data", engine, if_exists="append", index=False, chunksize=1000)
+            return len(df_zip)
+
+        def zip_en_streaming():
+            engine = _engine_nuevo(directorio, "zip_stream.db")
+            inicializar_bd(engine)
+            filas_zip = (dict(fila, fecha_carga=FECHA_CARGA) for fila in iterar_filas_de_zip(zip_path, impuestos_json=False))
+            insertadas, _, _ = cargar_masivo(engine, filas_zip)
+            return insertadas
+
+        print(f"\n📊 Carga de {filas:,} filas ({args.docs:,} documentos)")
+        print("-" * 80)
+        print("   Solo inserción (DataFrame ya armado)")
+        antes = medir("to_sql chunksize=1000 (anterior)", con_to_sql)
+        despues = medir("cargar_masivo", con_cargar_masivo)
+        print(f"   → {antes / despues:.2f}x")
+        print("   ZIP completo (parseo + inserción)")
+        antes = medir("extraer_productos_de_zip + to_sql (anterior)", zip_con_to_sql)
+        despues = medir("iterar_filas_de_zip → cargar_masivo", zip_en_streaming)
+        print(f"   → {antes / despues:.2f}x")
+        print("-" * 80)
+
+
+if __name__ == "__main__":
+    main()
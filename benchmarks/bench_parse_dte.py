@@ -0,0 +1,187 @@
+"""
+bench_parse_dte.py
+Compara el tiempo de parseo por documento DTE: extractor anterior (un find() por
+campo) contra el extractor de una sola pasada de xml_processor.
+
+Uso:
+    python benchmarks/bench_parse_dte.py [--docs 2000] [--items 5] [--repeticiones 3]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xml_processor import NS, safe_text, to_float_safe, parse_xml_tree, parse_xml_stream
+from dte_sintetico import generar_xml_dte
+
+
+def _format_address_legacy(addr_elem, ns=NS) -> str:
+    """Versión anterior de format_address (un find() por parte)."""
+    if addr_elem is None:
+        return ""
+    parts = []
+    for t in ("Direccion", "Municipio", "Departamento", "CodigoPostal", "Pais"):
+        v = safe_text(addr_elem, f"dte:{t}", ns)
+        if v:
+            parts.append(v)
+    return ", ".join(parts)
+
+
+def parse_xml_tree_legacy(root: ET.Element, file_name: str):
+    """Versión anterior: una búsqueda .//dte:... por campo (copia para comparar)."""
+    rows = []
+
+    # Emisor / Receptor / DatosGenerales
+    emisor = root.find(".//dte:Emisor", NS)
+    receptor = root.find(".//dte:Receptor", NS)
+    datos_generales = root.find(".//dte:DatosGenerales", NS)
+    certificacion = root.find(".//dte:Certificacion", NS)
+    numero_aut = root.find(".//dte:Certificacion/dte:NumeroAutorizacion", NS)
+    dte_elem = root.find(".//dte:DTE", NS)
+
+    # Emisor datos
+    nombre_emisor = emisor.attrib.get("NombreEmisor") if emisor is not None else ""
+    nombre_comercial = emisor.attrib.get("NombreComercial") if emisor is not None else nombre_emisor
+    nit_emisor = emisor.attrib.get("NITEmisor") if emisor is not None else ""
+    codigo_establecimiento = emisor.attrib.get("CodigoEstablecimiento") if emisor is not None else ""
+
+    direccion_emisor = _format_address_legacy(root.find(".//dte:DireccionEmisor", NS))
+
+    # Receptor datos
+    nombre_receptor = receptor.attrib.get("NombreReceptor") if receptor is not None else ""
+    nit_receptor = receptor.attrib.get("IDReceptor") if receptor is not None else ""
+    direccion_receptor = _format_address_legacy(root.find(".//dte:DireccionReceptor", NS))
+
+    # Datos Generales
+    tipo_documento = datos_generales.attrib.get("Tipo") if datos_generales is not None else ""
+    fecha_emision = datos_generales.attrib.get("FechaHoraEmision") if datos_generales is not None else ""
+    codigo_moneda = datos_generales.attrib.get("CodigoMoneda") if datos_generales is not None else ""
+
+    # Certificacion / NumeroAutorizacion
+    numaut_serie = numero_aut.attrib.get("Serie") if numero_aut is not None else ""
+    numaut_numero = numero_aut.attrib.get("Numero") if numero_aut is not None else ""
+    numaut_text = (numero_aut.text or "").strip() if numero_aut is not None and numero_aut.text else ""
+    fecha_certificacion = safe_text(certificacion, "dte:FechaHoraCertificacion", NS) if certificacion is not None else ""
+    nit_certificador = safe_text(certificacion, "dte:NITCertificador", NS) if certificacion is not None else ""
+    nombre_certificador = safe_text(certificacion, "dte:NombreCertificador", NS) if certificacion is not None else ""
+
+    dte_id = dte_elem.attrib.get("ID") if dte_elem is not None else ""
+
+    # Recorremos cada Item
+    for item in root.findall(".//dte:Item", NS):
+        numero_linea = item.attrib.get("NumeroLinea", "")
+        bien_o_servicio = item.attrib.get("BienOServicio", "")
+        
+        if bien_o_servicio == "B":
+            bof = "Bien"
+        elif bien_o_servicio == "S":
+            bof = "Servicio"
+        else:
+            bof = bien_o_servicio
+
+        cantidad = safe_text(item, "dte:Cantidad", NS)
+        unidad = safe_text(item, "dte:UnidadMedida", NS)
+        descripcion = safe_text(item, "dte:Descripcion", NS)
+        precio_unitario = safe_text(item, "dte:PrecioUnitario", NS)
+        precio = safe_text(item, "dte:Precio", NS)
+        descuento = safe_text(item, "dte:Descuento", NS)
+        total = safe_text(item, "dte:Total", NS)
+
+        # Impuestos por item
+        impuestos_list = []
+        for imp in item.findall(".//dte:Impuesto", NS):
+            nombre = safe_text(imp, "dte:NombreCorto", NS)
+            monto_gravable = safe_text(imp, "dte:MontoGravable", NS)
+            monto_impuesto = safe_text(imp, "dte:MontoImpuesto", NS)
+            impuestos_list.append({
+                "nombre": nombre,
+                "monto_gravable": monto_gravable,
+                "monto_impuesto": monto_impuesto
+            })
+
+        rows.append({
+            "Archivo": file_name,
+            "DTE_ID": dte_id,
+            "TipoDocumento": tipo_documento,
+            "FechaHoraEmision": fecha_emision,
+            "CodigoMoneda": codigo_moneda,
+            "NombreEmisor": nombre_emisor,
+            "NombreComercial": nombre_comercial,
+            "NIT_Emisor": nit_emisor,
+            "CodigoEstablecimiento": codigo_establecimiento,
+            "DireccionEmisor": direccion_emisor,
+            "NombreReceptor": nombre_receptor,
+            "NIT_Receptor": nit_receptor,
+            "DireccionReceptor": direccion_receptor,
+            "NumeroAutorizacion_Serie": numaut_serie,
+            "NumeroAutorizacion_Numero": numaut_numero,
+            "NumeroAutorizacion_Texto": numaut_text,
+            "FechaHoraCertificacion": fecha_certificacion,
+            "NIT_Certificador": nit_certificador,
+            "Nombre_Certificador": nombre_certificador,
+            "Linea_Numero": numero_linea,
+            "BienOServicio": bof,
+            "Descripcion": descripcion,
+            "Cantidad": to_float_safe(cantidad),
+            "UnidadMedida": unidad,
+            "PrecioUnitario": to_float_safe(precio_unitario),
+            "Precio": to_float_safe(precio),
+            "Descuento": to_float_safe(descuento),
+            "Total": to_float_safe(total),
+            "Impuestos": impuestos_list
+        })
+
+    return rows
+
+
+def medir(nombre: str, funcion, documentos: list, repeticiones: int) -> float:
+    """Ejecuta `funcion` sobre todos los documentos y devuelve el mejor tiempo por documento (µs)."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for i, xml in enumerate(documentos):
+            funcion(xml, f"DTE-{i}.xml")
+        mejor = min(mejor, time.perf_counter() - inicio)
+    por_doc = mejor / len(documentos) * 1e6
+    print(f"   {nombre:<42} {por_doc:8.1f} µs/doc")
+    return por_doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=5, help="Items máximos por documento")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    documentos = [generar_xml_dte(i, 1 + i % args.items).encode("utf-8") for i in range(args.docs)]
+
+    # Los tres caminos deben producir exactamente las mismas filas
+    for i, xml in enumerate(documentos[:200]):
+        esperado = parse_xml_tree_legacy(ET.fromstring(xml), "x")
+        assert parse_xml_tree(ET.fromstring(xml), "x") == esperado
+        assert parse_xml_stream(io.BytesIO(xml), "x") == esperado
+
+    print(f"\n📊 Parseo de {args.docs} documentos (mejor de {args.repeticiones})")
+    print("-" * 64)
+    antes = medir("ET.parse + find() por campo (anterior)",
+                  lambda xml, n: parse_xml_tree_legacy(ET.parse(io.BytesIO(xml)).getroot(), n),
+                  documentos, args.repeticiones)
+    arbol = medir("ET.parse + una pasada (parse_xml_tree)",
+                  lambda xml, n: parse_xml_tree(ET.parse(io.BytesIO(xml)).getroot(), n),
+                  documentos, args.repeticiones)
+    stream = medir("iterparse + una pasada (parse_xml_stream)",
+                   lambda xml, n: parse_xml_stream(io.BytesIO(xml), n),
+                   documentos, args.repeticiones)
+    print("-" * 64)
+    print(f"   Mejora parse_xml_tree:   {antes / arbol:.2f}x")
+    print(f"   Mejora parse_xml_stream: {antes / stream:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+dte_sintetico.py
+Genera XMLs DTE (FEL 0.2.0) y ZIPs sintéticos para los benchmarks
+"""
+
+import zipfile
+
+NS_DTE = "http://www.sat.gob.gt/dte/fel/0.2.0"
+
+
+def generar_xml_dte(i: int, items: int = 3) -> str:
+    """Arma un DTE de ejemplo con la estructura real de SAT (emisor, receptor, items, certificación)."""
+    lineas = "".join(
+        f'<dte:Item BienOServicio="{"B" if j % 2 else "S"}" NumeroLinea="{j}">'
+        f'<dte:Cantidad>{j}.00</dte:Cantidad><dte:UnidadMedida>UNI</dte:UnidadMedida>'
+        f'<dte:Descripcion>PRODUCTO {(i * 7 + j) % 500}</dte:Descripcion>'
+        f'<dte:PrecioUnitario>11.20</dte:PrecioUnitario><dte:Precio>{j * 11.2:.2f}</dte:Precio>'
+        f'<dte:Descuento>0.00</dte:Descuento><dte:Impuestos><dte:Impuesto>'
+        f'<dte:NombreCorto>IVA</dte:NombreCorto><dte:CodigoUnidadGravable>1</dte:CodigoUnidadGravable>'
+        f'<dte:MontoGravable>{j * 10:.2f}</dte:MontoGravable><dte:MontoImpuesto>{j * 1.2:.2f}</dte:MontoImpuesto>'
+        f'</dte:Impuesto></dte:Impuestos><dte:Total>{j * 11.2:.2f}</dte:Total></dte:Item>'
+        for j in range(1, items + 1)
+    )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<dte:GTDocumento xmlns:dte="{NS_DTE}" Version="0.1"><dte:SAT ClaseDocumento="dte">'
+        f'<dte:DTE ID="DatosCertificados"><dte:DatosEmision ID="DatosEmision">'
+        f'<dte:DatosGenerales CodigoMoneda="GTQ" FechaHoraEmision="2025-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00-06:00" Tipo="FACT"/>'
+        f'<dte:Emisor AfiliacionIVA="GEN" CodigoEstablecimiento="1" NITEmisor="{1000000 + i % 40}" '
+        f'NombreComercial="COMERCIAL {i % 40}" NombreEmisor="EMISOR {i % 40}, S.A.">'
+        f'<dte:DireccionEmisor><dte:Direccion>CIUDAD</dte:Direccion><dte:CodigoPostal>01001</dte:CodigoPostal>'
+        f'<dte:Municipio>GUATEMALA</dte:Municipio><dte:Departamento>GUATEMALA</dte:Departamento>'
+        f'<dte:Pais>GT</dte:Pais></dte:DireccionEmisor></dte:Emisor>'
+        f'<dte:Receptor IDReceptor="{2000000 + i % 300}" NombreReceptor="RECEPTOR {i % 300}">'
+        f'<dte:DireccionReceptor><dte:Direccion>ZONA 1</dte:Direccion><dte:Pais>GT</dte:Pais>'
+        f'</dte:DireccionReceptor></dte:Receptor>'
+        f'<dte:Items>{lineas}</dte:Items>'
+        f'<dte:Totales><dte:TotalImpuestos><dte:TotalImpuesto NombreCorto="IVA" TotalMontoImpuesto="1.20"/>'
+        f'</dte:TotalImpuestos><dte:GranTotal>11.20</dte:GranTotal></dte:Totales>'
+        f'</dte:DatosEmision><dte:Certificacion><dte:NITCertificador>12521337</dte:NITCertificador>'
+        f'<dte:NombreCertificador>CERTIFICADOR, S.A.</dte:NombreCertificador>'
+        f'<dte:NumeroAutorizacion Numero="{100000 + i}" Serie="A1B2C3D4">A1B2C3D4-{i:08d}</dte:NumeroAutorizacion>'
+        f'<dte:FechaHoraCertificacion>2025-01-01T10:00:05-06:00</dte:FechaHoraCertificacion>'
+        f'</dte:Certificacion></dte:DTE></dte:SAT></dte:GTDocumento>'
+    )
+
+
+def generar_zip(zip_path: str, documentos: int = 1000, items_max: int = 5) -> str:
+    """Escribe un ZIP con `documentos` XMLs de 1 a items_max items cada uno."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(documentos):
+            z.writestr(f"DTE-{i:08d}.xml", generar_xml_dte(i, 1 + i % items_max))
+    return zip_path
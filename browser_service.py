@@ -0,0 +1,194 @@
+"""
+browser_service.py
+Chromium persistente compartido por las sesiones de SATNavigator.
+
+Lanzar Chromium cuesta varios segundos; en vez de lanzarlo y cerrarlo por cada
+cuenta, el servicio lo mantiene abierto en un hilo con su propio event loop y
+entrega contextos nuevos (cookies y storage aislados) a cada sesión. Si el
+navegador se cae o ya se usó demasiadas veces, se relanza solo.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from playwright.async_api import async_playwright
+
+from sat_navigator import lanzar_chromium
+
+# Contextos que se entregan antes de relanzar Chromium (limita la memoria que acumula)
+MAX_USOS_NAVEGADOR = 50
+
+
+class ServicioNavegador:
+    """
+    Un Chromium por proceso, vivo entre corridas de /procesar.
+
+    Playwright queda atado al event loop donde se inició, por eso el servicio
+    tiene su propio loop en un hilo aparte y las corrutinas que usan el
+    navegador se mandan a ese loop con `ejecutar`.
+    """
+
+    def __init__(self, headless: bool = True, max_usos: int = MAX_USOS_NAVEGADOR):
+        """
+        Args:
+            headless: Si True, ejecuta sin interfaz gráfica
+            max_usos: Contextos entregados antes de relanzar Chromium
+        """
+        self.headless = headless
+        self.max_usos = max(1, max_usos)
+        self.loop = None
+        self.hilo = None
+        self.pid = None
+        self.candado = threading.Lock()
+        self._reiniciar_estado()
+
+    def _reiniciar_estado(self):
+        self.playwright = None
+        self.browser = None
+        self.lanzamiento = None  # asyncio.Lock (se crea dentro del loop del servicio)
+        self.usos = 0            # contextos entregados por el navegador actual
+        self.activos = {}        # navegador -> contextos abiertos
+        self.retirados = set()   # navegadores reemplazados que esperan a que cierren sus contextos
+        self.reinicios = 0
+        self.lanzado = None
+
+    def _asegurar_loop(self):
+        """Arranca el hilo del loop (también después de un fork de gunicorn)"""
+        with self.candado:
+            if self.hilo is not None and self.hilo.is_alive() and self.pid == os.getpid():
+                return
+            self._reiniciar_estado()
+            self.loop = asyncio.new_event_loop()
+            self.hilo = threading.Thread(target=self.loop.run_forever, name='navegador', daemon=True)
+            self.hilo.start()
+            self.pid = os.getpid()
+
+    def ejecutar(self, corrutina):
+        """
+        Ejecuta una corrutina en el loop del servicio y espera su resultado
+        (desde código sincrónico, ej: un trabajo de la cola)
+        """
+        self._asegurar_loop()
+        return asyncio.run_coroutine_threadsafe(corrutina, self.loop).result()
+
+    def _sano(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+    async def _lanzar(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+
+        if self.browser is not None:
+            anterior = self.browser
+            if anterior.is_connected() and self.activos.get(anterior):
+                # Todavía hay sesiones usándolo: se cierra cuando terminen
+                self.retirados.add(anterior)
+            else:
+                self.activos.pop(anterior, None)
+                await self._cerrar_navegador(anterior)
+            self.reinicios += 1
+
+        print("🚀 Lanzando Chromium compartido...")
+        browser = await lanzar_chromium(self.playwright, headless=self.headless)
+        browser.on('disconnected', lambda b: print("⚠️ Chromium compartido desconectado"))
+        self.browser = browser
+        self.activos[browser] = 0
+        self.usos = 0
+        self.lanzado = datetime.now()
+        print("✅ Chromium compartido listo")
+
+    async def _cerrar_navegador(self, browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            print(f"⚠️ Error al cerrar Chromium: {str(e)}")
+
+    async def _navegador(self):
+        """Navegador sano con usos disponibles (lo relanza si hace falta)"""
+        if self.lanzamiento is None:
+            self.lanzamiento = asyncio.Lock()
+        async with self.lanzamiento:
+            if not self._sano():
+                if self.browser is not None:
+                    print("⚠️ Chromium no responde, relanzando...")
+                await self._lanzar()
+            elif self.usos >= self.max_usos:
+                print(f"♻️ Chromium llegó a {self.usos} usos, relanzando...")
+                await self._lanzar()
+            self.usos += 1
+            return self.browser
+
+    async def nuevo_contexto(self, **opciones):
+        """
+        Crea un BrowserContext en el navegador compartido.
+
+        Si el navegador se cayó justo al crear el contexto, se relanza y se
+        reintenta una vez. Al cerrar el contexto se libera su lugar.
+
+        Args:
+            **opciones: Opciones de browser.new_context (viewport, user_agent, ...)
+        """
+        for intento in range(2):
+            browser = await self._navegador()
+            try:
+                contexto = await browser.new_context(**opciones)
+                break
+            except Exception:
+                if intento or browser.is_connected():
+                    raise
+                print("⚠️ Chromium se cayó al crear el contexto, reintentando...")
+
+        self.activos[browser] = self.activos.get(browser, 0) + 1
+        contexto.on('close', lambda _: self._contexto_cerrado(browser))
+        return contexto
+
+    def _contexto_cerrado(self, browser):
+        if browser not in self.activos:  # navegador caído que ya se descartó
+            return
+        self.activos[browser] = max(0, self.activos[browser] - 1)
+        if browser in self.retirados and not self.activos[browser]:
+            self.retirados.discard(browser)
+            self.activos.pop(browser, None)
+            asyncio.ensure_future(self._cerrar_navegador(browser))
+
+    def estado(self) -> dict:
+        """Estado del servicio para monitoreo (no lanza el navegador)"""
+        return {
+            'iniciado': self.hilo is not None and self.hilo.is_alive() and self.pid == os.getpid(),
+            'conectado': self._sano(),
+            'usos': self.usos,
+            'max_usos': self.max_usos,
+            'contextos_abiertos': sum(self.activos.values()),
+            'reinicios': self.reinicios,
+            'lanzado': self.lanzado.strftime("%Y-%m-%d %H:%M:%S") if self.lanzado else None,
+        }
+
+    async def _detener(self):
+        for browser in [self.browser, *self.retirados]:
+            if browser is not None and browser.is_connected():
+                await self._cerrar_navegador(browser)
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+    def detener(self):
+        """Cierra Chromium y el loop del servicio (se llama solo al salir del proceso)"""
+        if self.hilo is None or not self.hilo.is_alive() or self.pid != os.getpid():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._detener(), self.loop).result(timeout=30)
+        except Exception as e:
+            print(f"⚠️ Error al detener el navegador: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.hilo.join(timeout=5)
+        self._reiniciar_estado()
+        self.hilo = None
+
+
+def crear_servicio(headless: bool = True, max_usos: int = MAX_USOS_NAVEGADOR) -> ServicioNavegador:
+    """Crea el servicio y lo registra para cerrarse al terminar el proceso"""
+    servicio = ServicioNavegador(headless=headless, max_usos=max_usos)
+    atexit.register(servicio.detener)
+    return servicio
@@ -0,0 +1,260 @@
+"""
+direct_download.py
+Descarga directa de reportes SAT sin pasar por la tabla de Consultar DTE.
+
+La primera descarga de cada tipo (Emitidos/Recibidos) y formato se hace por
+la interfaz mientras se graban las peticiones de la página. La petición que
+trajo el archivo queda como plantilla; para los siguientes períodos se le
+cambian las fechas y se repite con APIRequestContext, que usa las mismas
+cookies de la sesión. Así no hay que buscar, pintar ni seleccionar miles de
+filas por cada período.
+
+Si la plantilla no lleva las fechas, manda los ids o UUIDs de las filas
+seleccionadas (repetirla traería otra vez esas mismas filas), o si el archivo
+que vuelve está vacío o no es del período pedido, se sigue por la interfaz.
+"""
+
+import io
+import re
+import zipfile
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+
+# Peticiones recientes que se guardan para encontrar la de la descarga
+MAX_PETICIONES_GRABADAS = 300
+
+# Tipos de contenido que cuentan como archivo de reporte
+TIPOS_ARCHIVO = (
+    'application/octet-stream',
+    'application/zip',
+    'application/x-zip-compressed',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/pdf',
+    'application/xml',
+    'text/xml',
+    'text/csv',
+)
+
+# Encabezados que no se repiten: los pone APIRequestContext (cookies, largo, host)
+ENCABEZADOS_EXCLUIDOS = frozenset(('cookie', 'content-length', 'host', 'connection', 'accept-encoding'))
+
+# Un filtro por fechas es corto: un cuerpo más grande trae las filas seleccionadas
+MAX_CUERPO_PLANTILLA = 16 * 1024
+
+# Elementos desde los que una lista en la petición se toma como filas seleccionadas
+MIN_ELEMENTOS_LISTA = 10
+
+# UUID (el número de autorización de un DTE tiene este formato)
+PATRON_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+
+# Lista JSON de ids: [1, 2, 3, ...] o ["a", "b", ...]
+PATRON_LISTA = re.compile(
+    r'\[\s*(?:"[^"]*"|\d+)(?:\s*,\s*(?:"[^"]*"|\d+)){%d,}\s*\]' % (MIN_ELEMENTOS_LISTA - 1)
+)
+
+# Bytes que se revisan de un archivo para buscar las fechas del período
+MAX_BYTES_REVISADOS = 50 * 1024 * 1024
+
+# Fecha base de los números de serie de fechas de Excel
+EPOCA_EXCEL = datetime(1899, 12, 30)
+
+
+def es_archivo(headers: dict) -> bool:
+    """Indica si una respuesta (por sus encabezados) es un archivo descargable"""
+    disposicion = headers.get('content-disposition', '').lower()
+    if 'attachment' in disposicion or 'filename' in disposicion:
+        return True
+    tipo = headers.get('content-type', '').split(';')[0].strip().lower()
+    return tipo in TIPOS_ARCHIVO
+
+
+def nombre_de_disposicion(headers: dict):
+    """Nombre sugerido en content-disposition (None si no trae)"""
+    disposicion = headers.get('content-disposition', '')
+    coincidencia = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposicion, re.IGNORECASE)
+    if coincidencia:
+        return unquote(coincidencia.group(1).strip().strip('"'))
+    coincidencia = re.search(r'filename="?([^";]+)"?', disposicion, re.IGNORECASE)
+    return coincidencia.group(1).strip() if coincidencia else None
+
+
+def _variantes_fecha(fecha: str) -> list:
+    """
+    Formas en que el app puede mandar una fecha MM/DD/AAAA (la que se escribe
+    en el formulario), en orden fijo para poder cambiar una por otra
+    """
+    mes, dia, año = fecha.split('/')
+    variantes = [
+        f"{mes}/{dia}/{año}",
+        f"{dia}/{mes}/{año}",
+        f"{año}-{mes}-{dia}",
+        f"{dia}-{mes}-{año}",
+        f"{año}{mes}{dia}",
+        f"{dia}{mes}{año}",
+    ]
+    return variantes + [quote(v, safe='') for v in variantes if '/' in v]
+
+
+def _reemplazos(periodo_grabado: dict, periodo: dict) -> dict:
+    """{texto de fecha grabado: texto de la fecha nueva} para inicio y fin"""
+    reemplazos = {}
+    for campo in ('fecha_inicio', 'fecha_fin'):
+        for vieja, nueva in zip(_variantes_fecha(periodo_grabado[campo]), _variantes_fecha(periodo[campo])):
+            reemplazos.setdefault(vieja, nueva)
+    return reemplazos
+
+
+def _sustituir(texto: str, reemplazos: dict) -> str:
+    """Reemplaza todas las claves a la vez (una fecha nueva no se vuelve a reemplazar)"""
+    if not texto or not reemplazos:
+        return texto
+    patron = re.compile('|'.join(re.escape(k) for k in sorted(reemplazos, key=len, reverse=True)))
+    return patron.sub(lambda m: reemplazos[m.group(0)], texto)
+
+
+def _contiene(texto: str, fecha: str) -> bool:
+    return bool(texto) and any(v in texto for v in _variantes_fecha(fecha))
+
+
+def _lleva_filas(texto: str) -> bool:
+    """Indica si la petición manda filas puntuales (UUIDs o una lista larga de ids)"""
+    if not texto:
+        return False
+    texto = unquote(texto)
+    return bool(PATRON_UUID.search(texto) or PATRON_LISTA.search(texto))
+
+
+def crear_plantilla(request, periodo: dict):
+    """
+    Arma la plantilla de descarga a partir de la petición grabada
+
+    Args:
+        request: Request de Playwright que trajo el archivo
+        periodo: Período (fechas MM/DD/AAAA) con que se hizo esa descarga
+
+    Returns:
+        Diccionario con la petición y el período, o None si no se puede
+        reutilizar: las fechas no aparecen en la URL ni en el cuerpo, o la
+        petición manda las filas seleccionadas
+    """
+    if periodo['fecha_inicio'] == periodo['fecha_fin']:
+        return None  # no se sabría cuál es el inicio y cuál el fin
+
+    url = request.url
+    cuerpo = request.post_data
+    if len(cuerpo or '') > MAX_CUERPO_PLANTILLA or _lleva_filas(url) or _lleva_filas(cuerpo):
+        return None
+    for campo in ('fecha_inicio', 'fecha_fin'):
+        if not (_contiene(url, periodo[campo]) or _contiene(cuerpo, periodo[campo])):
+            return None
+
+    return {
+        'method': request.method,
+        'url': url,
+        'post_data': cuerpo,
+        'headers': {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in ENCABEZADOS_EXCLUIDOS and not k.startswith(':')
+        },
+        'periodo': {'fecha_inicio': periodo['fecha_inicio'], 'fecha_fin': periodo['fecha_fin']},
+    }
+
+
+def aplicar_periodo(plantilla: dict, periodo: dict):
+    """
+    URL y cuerpo de la plantilla con las fechas del nuevo período
+
+    Returns:
+        Tupla (url, cuerpo)
+    """
+    reemplazos = _reemplazos(plantilla['periodo'], periodo)
+    return _sustituir(plantilla['url'], reemplazos), _sustituir(plantilla['post_data'], reemplazos)
+
+
+def _textos_de_archivo(contenido: bytes):
+    """
+    Texto del archivo para buscar fechas. Los ZIP (y los .xlsx, que lo son)
+    se abren y se revisan sus miembros.
+    """
+    if zipfile.is_zipfile(io.BytesIO(contenido)):
+        restantes = MAX_BYTES_REVISADOS
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            for info in zf.infolist():
+                if restantes <= 0:
+                    break
+                yield info.filename
+                with zf.open(info) as miembro:
+                    datos = miembro.read(restantes)
+                restantes -= len(datos)
+                yield datos.decode('utf-8', errors='ignore')
+    else:
+        datos = contenido[:MAX_BYTES_REVISADOS]
+        yield datos.decode('latin-1')
+        yield datos.decode('utf-16-le', errors='ignore')  # texto de los .xls viejos
+
+
+def _patron_periodo(periodo: dict):
+    """Expresión que encuentra cualquier día del período, en cualquiera de sus formas"""
+    inicio = datetime.strptime(periodo['fecha_inicio'], "%m/%d/%Y")
+    fin = datetime.strptime(periodo['fecha_fin'], "%m/%d/%Y")
+    variantes = set()
+    dia = inicio
+    while dia <= fin:
+        variantes.update(_variantes_fecha(dia.strftime("%m/%d/%Y")))
+        # Celda de fecha de un .xlsx: número de serie de Excel
+        variantes.add(f"<v>{(dia - EPOCA_EXCEL).days}<")
+        variantes.add(f"<v>{(dia - EPOCA_EXCEL).days}.")
+        dia += timedelta(days=1)
+    return re.compile('|'.join(re.escape(v) for v in sorted(variantes, key=len, reverse=True)))
+
+
+def archivo_del_periodo(contenido: bytes, nombre: str, periodo: dict) -> bool:
+    """
+    Revisa que el archivo de una descarga directa sea del período pedido: que
+    no esté vacío y que alguna fecha del período aparezca en el nombre o en el
+    contenido (si el servidor ignoró las fechas nuevas, devuelve otro período)
+
+    Args:
+        contenido: Bytes del archivo
+        nombre: Nombre sugerido por el servidor (puede ser None)
+        periodo: Período pedido (fechas MM/DD/AAAA)
+    """
+    if not contenido:
+        return False
+    patron = _patron_periodo(periodo)
+    if nombre and patron.search(nombre):
+        return True
+    try:
+        return any(patron.search(texto) for texto in _textos_de_archivo(contenido))
+    except zipfile.BadZipFile:
+        return False
+
+
+class GrabadorPeticiones:
+    """
+    Guarda las últimas peticiones de la página (incluye las de sus iframes)
+    y las que devolvieron un archivo
+    """
+
+    def __init__(self, page, maximo: int = MAX_PETICIONES_GRABADAS):
+        self.peticiones = deque(maxlen=maximo)
+        self.archivos = deque(maxlen=20)
+        page.on('request', self.peticiones.append)
+        page.on('response', self._respuesta)
+
+    def _respuesta(self, response):
+        if es_archivo(response.headers):
+            self.archivos.append(response.request)
+
+    def peticion_de_descarga(self, url: str):
+        """
+        Petición que trajo la descarga con esa URL. Si el app armó el archivo
+        en el navegador (URL blob:), la última respuesta que fue un archivo.
+        """
+        if url and not url.startswith('blob:'):
+            for request in reversed(self.peticiones):
+                if request.url == url:
+                    return request
+        return self.archivos[-1] if self.archivos else None
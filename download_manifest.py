@@ -0,0 +1,202 @@
+"""
+download_manifest.py
+Manifiesto de descargas SAT ya hechas, para no repetirlas en cada corrida.
+
+Cada archivo descargado (usuario, tipo, fecha_inicio, fecha_fin, formato) se
+guarda en una carpeta de archivo y queda anotado en la tabla `descargas` con
+su tamaño y SHA-256. En la corrida siguiente esos períodos no se vuelven a
+pedir al portal: se entrega el archivo guardado, siempre que siga en disco y
+su checksum coincida. El mes en curso (todavía abierto) se descarga siempre.
+"""
+
+import hashlib
+import os
+import shutil
+from datetime import date, datetime
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, UniqueConstraint, select
+
+# Formato de fecha de los períodos (el del formulario de Consultar DTE)
+FORMATO_FECHA = "%m/%d/%Y"
+
+metadata = MetaData()
+
+descargas_table = Table(
+    'descargas', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('usuario', String(50), nullable=False),
+    Column('tipo', String(20), nullable=False),         # Emitidos / Recibidos
+    Column('fecha_inicio', String(10), nullable=False),  # MM/DD/AAAA
+    Column('fecha_fin', String(10), nullable=False),
+    Column('formato', String(20), nullable=False),
+    Column('archivo', Text, nullable=False),             # ruta dentro de la carpeta de archivo
+    Column('sha256', String(64), nullable=False),
+    Column('tamano', Integer, nullable=False),
+    Column('descargado', String(50)),
+    UniqueConstraint('usuario', 'tipo', 'fecha_inicio', 'fecha_fin', 'formato', name='uq_descarga')
+)
+
+
+def _ahora() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sha256_archivo(ruta: str) -> str:
+    """SHA-256 del archivo leído por bloques"""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def periodo_abierto(periodo: dict, hoy: date = None) -> bool:
+    """
+    Indica si el período llega al mes en curso (o al futuro): todavía pueden
+    aparecer documentos, así que no cuenta como terminado aunque se haya bajado
+    """
+    hoy = hoy or date.today()
+    fin = datetime.strptime(periodo['fecha_fin'], FORMATO_FECHA).date()
+    return fin >= hoy.replace(day=1)
+
+
+def separar_pendientes(periodos: list, buscar):
+    """
+    Separa los períodos que faltan de los que ya tienen archivo
+
+    Un período 'Ambos' del que ya se tiene uno de los dos tipos queda
+    pendiente solo por el otro.
+
+    Args:
+        periodos: Períodos {fecha_inicio, fecha_fin, tipo_operacion, formato} (MM/DD/AAAA)
+        buscar: Callable buscar(tipo, periodo) -> ruta del archivo ya descargado o None
+
+    Returns:
+        Tupla (períodos pendientes, archivos ya descargados)
+    """
+    pendientes = []
+    archivos = []
+    for periodo in periodos:
+        tipo_operacion = periodo.get('tipo_operacion', 'Ambos')
+        tipos = ["Emitidos", "Recibidos"] if tipo_operacion == "Ambos" else [tipo_operacion]
+        faltan = []
+        for tipo in tipos:
+            archivo = buscar(tipo, periodo)
+            if archivo:
+                archivos.append(archivo)
+            else:
+                faltan.append(tipo)
+
+        if len(faltan) == len(tipos):
+            pendientes.append(periodo)
+        elif faltan:
+            pendientes.append({**periodo, 'tipo_operacion': faltan[0]})
+
+    return pendientes, archivos
+
+
+class ManifiestoDescargas:
+    """Qué períodos de cada usuario ya tienen archivo descargado y verificado"""
+
+    def __init__(self, engine, carpeta: str):
+        """
+        Args:
+            engine: Engine de SQLAlchemy donde vive la tabla descargas
+            carpeta: Carpeta donde se guardan los archivos anotados (una subcarpeta por usuario)
+        """
+        self.engine = engine
+        self.carpeta = os.path.abspath(carpeta)
+        os.makedirs(self.carpeta, exist_ok=True)
+        metadata.create_all(engine)
+
+    def _clave(self, usuario: str, tipo: str, periodo: dict):
+        d = descargas_table.c
+        return (
+            d.usuario == usuario,
+            d.tipo == tipo,
+            d.fecha_inicio == periodo['fecha_inicio'],
+            d.fecha_fin == periodo['fecha_fin'],
+            d.formato == periodo.get('formato', 'excel'),
+        )
+
+    def archivo_vigente(self, usuario: str, tipo: str, periodo: dict):
+        """
+        Archivo guardado del período si sigue en disco sin cambios
+
+        Returns:
+            Ruta del archivo o None (no se descargó, se borró o el checksum no coincide)
+        """
+        d = descargas_table.c
+        with self.engine.connect() as conn:
+            fila = conn.execute(
+                select(d.archivo, d.sha256, d.tamano).where(*self._clave(usuario, tipo, periodo))
+            ).first()
+        if fila is None:
+            return None
+
+        archivo, sha256, tamano = fila
+        if not os.path.exists(archivo) or os.path.getsize(archivo) != tamano or sha256_archivo(archivo) != sha256:
+            print(f"⚠️ {os.path.basename(archivo)} falta o cambió: se vuelve a descargar")
+            with self.engine.begin() as conn:
+                conn.execute(descargas_table.delete().where(*self._clave(usuario, tipo, periodo)))
+            return None
+        return archivo
+
+    def pendientes(self, usuario: str, periodos: list, hoy: date = None):
+        """
+        Separa los períodos que hay que descargar de los que ya están en el manifiesto
+        (ver separar_pendientes). Los períodos abiertos siempre quedan pendientes.
+
+        Args:
+            usuario: Usuario SAT
+            periodos: Períodos {fecha_inicio, fecha_fin, tipo_operacion, formato} (MM/DD/AAAA)
+            hoy: Fecha de referencia para el mes en curso (por defecto, hoy)
+
+        Returns:
+            Tupla (períodos pendientes, archivos ya descargados)
+        """
+        abiertos = [periodo for periodo in periodos if periodo_abierto(periodo, hoy)]
+        pendientes, archivos = separar_pendientes(
+            [periodo for periodo in periodos if not periodo_abierto(periodo, hoy)],
+            lambda tipo, periodo: self.archivo_vigente(usuario, tipo, periodo)
+        )
+        return abiertos + pendientes, archivos
+
+    def registrar(self, usuario: str, archivo: str, tipo: str, fecha_inicio: str, fecha_fin: str,
+                  formato: str = 'excel') -> str:
+        """
+        Mueve el archivo descargado a la carpeta de archivo y lo anota en el manifiesto
+        (reemplaza lo anotado antes para el mismo período, ej: el mes en curso)
+
+        Returns:
+            Nueva ruta del archivo
+        """
+        periodo = {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin, 'formato': formato}
+        carpeta = os.path.join(self.carpeta, usuario)
+        os.makedirs(carpeta, exist_ok=True)
+        destino = os.path.join(carpeta, os.path.basename(archivo))
+        shutil.move(archivo, destino)
+
+        d = descargas_table.c
+        with self.engine.begin() as conn:
+            anterior = conn.execute(select(d.archivo).where(*self._clave(usuario, tipo, periodo))).scalar()
+            conn.execute(descargas_table.delete().where(*self._clave(usuario, tipo, periodo)))
+            conn.execute(descargas_table.insert().values(
+                usuario=usuario,
+                tipo=tipo,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin,
+                formato=formato,
+                archivo=destino,
+                sha256=sha256_archivo(destino),
+                tamano=os.path.getsize(destino),
+                descargado=_ahora()
+            ))
+
+        if anterior and anterior != destino and os.path.exists(anterior):
+            os.remove(anterior)
+        return destino
+
+    def archivado(self, ruta: str) -> bool:
+        """Indica si la ruta está en la carpeta de archivo (no se debe borrar al terminar)"""
+        return os.path.abspath(ruta).startswith(self.carpeta + os.sep)
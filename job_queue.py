@@ -0,0 +1,368 @@
+"""
+job_queue.py
+Cola de trabajos en segundo plano guardada en SQLite.
+
+Los endpoints encolan el trabajo y responden de inmediato con su id; un pool
+acotado de hilos lo ejecuta y deja estado, progreso y resultado en la tabla
+`trabajos`, que se consulta desde cualquier proceso del servidor.
+
+Los trabajos reanudables guardan puntos de control (tabla `puntos_control`)
+a medida que avanzan; si se cortan, se vuelven a encolar con `reanudar` y
+siguen desde la última unidad terminada.
+
+Cada cola que arranca tiene un id propio y renueva su latido en la tabla
+`instancias_cola`. Un trabajo en proceso cuya instancia dejó de latir (el
+servidor se reinició o se cayó) se marca como error. No se usa host:pid: en
+Docker el proceso siempre es el PID 1 y en Render cada arranque tiene otro host.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, UniqueConstraint, select
+
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+# Cada cuánto renueva su latido una cola (y revisa trabajos de colas caídas)
+LATIDO_SEGUNDOS = 30
+
+# Latidos que puede saltarse una instancia antes de darla por caída
+LATIDOS_PERDIDOS = 3
+
+ERROR_INTERRUMPIDO = 'Interrumpido: el servidor se reinició'
+
+metadata = MetaData()
+
+trabajos_table = Table(
+    'trabajos', metadata,
+    Column('id', String(32), primary_key=True),
+    Column('tipo', String(50), nullable=False),
+    Column('estado', String(20), nullable=False, index=True),
+    Column('progreso', Integer, nullable=False, server_default='0'),  # 0 a 100
+    Column('mensaje', Text),
+    Column('parametros', Text),  # JSON
+    Column('resultado', Text),   # JSON
+    Column('error', Text),
+    Column('proceso', String(200)),  # id de la instancia de ColaTrabajos que lo está ejecutando
+    Column('creado', String(50)),
+    Column('iniciado', String(50)),
+    Column('terminado', String(50))
+)
+
+# Unidades ya terminadas de un trabajo reanudable (ej: una cuenta, un período)
+puntos_control_table = Table(
+    'puntos_control', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('trabajo_id', String(32), nullable=False, index=True),
+    Column('clave', String(300), nullable=False),
+    Column('datos', Text),  # JSON
+    Column('creado', String(50)),
+    UniqueConstraint('trabajo_id', 'clave', name='uq_punto_control')
+)
+
+# Colas en marcha: un id por arranque y la hora (epoch) de su último latido
+instancias_table = Table(
+    'instancias_cola', metadata,
+    Column('id', String(32), primary_key=True),
+    Column('proceso', String(200)),  # host:pid, solo informativo
+    Column('latido', Float, nullable=False)
+)
+
+# Lo que devuelve el endpoint de estado (sin parámetros ni resultado)
+COLUMNAS_ESTADO = ('id', 'tipo', 'estado', 'progreso', 'mensaje', 'error', 'creado', 'iniciado', 'terminado')
+
+
+def _ahora() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _proceso_actual() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class AvanceTrabajo:
+    """
+    Puntos de control de un trabajo: lo que se guarda acá sobrevive a un corte
+    y está disponible cuando el trabajo se reanuda.
+    """
+
+    def __init__(self, engine, trabajo_id: str):
+        self.engine = engine
+        self.trabajo_id = trabajo_id
+        t = puntos_control_table.c
+        with engine.connect() as conn:
+            filas = conn.execute(select(t.clave, t.datos).where(t.trabajo_id == trabajo_id)).all()
+        self.puntos = {clave: json.loads(datos) for clave, datos in filas}
+
+    def __contains__(self, clave: str) -> bool:
+        return clave in self.puntos
+
+    def get(self, clave: str, defecto=None):
+        """Datos guardados para la clave (de esta corrida o de una anterior)"""
+        return self.puntos.get(clave, defecto)
+
+    def guardar(self, clave: str, datos: dict):
+        """Marca la unidad como terminada (reemplaza lo guardado antes con la misma clave)"""
+        t = puntos_control_table.c
+        contenido = json.dumps(datos, default=str)
+        with self.engine.begin() as conn:
+            conn.execute(puntos_control_table.delete().where(t.trabajo_id == self.trabajo_id, t.clave == clave))
+            conn.execute(puntos_control_table.insert().values(
+                trabajo_id=self.trabajo_id, clave=clave, datos=contenido, creado=_ahora()
+            ))
+        self.puntos[clave] = json.loads(contenido)
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos con pool de hilos acotado.
+
+    Cada tipo de trabajo se registra con una función `funcion(parametros, progreso)`
+    que devuelve un diccionario (el resultado, se guarda como JSON). `progreso` es
+    un callable `progreso(porcentaje, mensaje=None)` para ir informando el avance.
+    Los tipos reanudables reciben además un AvanceTrabajo: `funcion(parametros, progreso, avance)`.
+    """
+
+    def __init__(self, engine, max_workers: int = 2, latido_segundos: float = LATIDO_SEGUNDOS):
+        """
+        Args:
+            engine: Engine de SQLAlchemy donde vive la tabla trabajos (conviene una BD
+                aparte de la de datos, para no esperar a las cargas masivas)
+            max_workers: Trabajos que se ejecutan a la vez (el resto espera en cola)
+            latido_segundos: Cada cuánto se renueva el latido de esta instancia
+        """
+        self.engine = engine
+        self.ejecutores = {}
+        self.reanudables = set()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trabajo')
+        self.instancia = uuid.uuid4().hex  # nuevo en cada arranque
+        self.latido_segundos = latido_segundos
+        self.detenida = threading.Event()
+        metadata.create_all(engine)
+
+        self._latir()
+        threading.Thread(target=self._mantener_latido, name='latido-cola', daemon=True).start()
+
+    def registrar(self, tipo: str, funcion, reanudable: bool = False):
+        """
+        Asocia un tipo de trabajo con la función que lo ejecuta
+
+        Args:
+            tipo: Nombre del tipo de trabajo
+            funcion: Función que lo ejecuta
+            reanudable: Si True, la función recibe un AvanceTrabajo y el trabajo
+                se puede reanudar con `reanudar` si se corta
+        """
+        self.ejecutores[tipo] = funcion
+        if reanudable:
+            self.reanudables.add(tipo)
+
+    def encolar(self, tipo: str, parametros: dict) -> str:
+        """
+        Guarda el trabajo como pendiente y lo manda al pool.
+
+        Los parámetros se guardan en la BD (JSON): no poner contraseñas ni datos
+        sensibles, solo referencias (ej: la ruta del archivo subido).
+
+        Returns:
+            Id del trabajo
+        """
+        if tipo not in self.ejecutores:
+            raise ValueError(f"Tipo de trabajo no registrado: {tipo}")
+
+        trabajo_id = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            conn.execute(trabajos_table.insert().values(
+                id=trabajo_id,
+                tipo=tipo,
+                estado=PENDIENTE,
+                parametros=json.dumps(parametros),
+                creado=_ahora()
+            ))
+
+        self.executor.submit(self._ejecutar, trabajo_id)
+        return trabajo_id
+
+    def reanudar_pendientes(self):
+        """
+        Al arrancar: vuelve a encolar los pendientes y marca como error los que
+        quedaron en proceso en una instancia que dejó de latir (servidor
+        reiniciado). Si la instancia anterior latió hace poco, sus trabajos se
+        marcan en la revisión de un latido siguiente.
+        """
+        self._marcar_interrumpidos()
+
+        t = trabajos_table.c
+        with self.engine.connect() as conn:
+            pendientes = conn.execute(
+                select(t.id).where(t.estado == PENDIENTE).order_by(t.creado)
+            ).scalars().all()
+
+        for trabajo_id in pendientes:
+            self.executor.submit(self._ejecutar, trabajo_id)
+        if pendientes:
+            print(f"🔁 {len(pendientes)} trabajo(s) pendiente(s) reencolado(s)")
+
+    def reanudar(self, trabajo_id: str) -> bool:
+        """
+        Vuelve a encolar un trabajo reanudable que terminó con error o se cortó
+        (ej: el servidor se reinició). Sigue desde sus puntos de control.
+
+        Returns:
+            True si se reencoló; False si no existe, no es reanudable o no terminó con error
+        """
+        t = trabajos_table.c
+        with self.engine.begin() as conn:
+            reanudado = conn.execute(
+                trabajos_table.update()
+                .where(t.id == trabajo_id, t.estado == ERROR, t.tipo.in_(self.reanudables))
+                .values(estado=PENDIENTE, error=None, terminado=None, proceso=None, mensaje='Reanudado')
+            ).rowcount
+        if not reanudado:
+            return False
+
+        self.executor.submit(self._ejecutar, trabajo_id)
+        print(f"🔁 Trabajo {trabajo_id} reanudado")
+        return True
+
+    def _tomar(self, trabajo_id: str):
+        """
+        Pasa el trabajo de pendiente a en proceso. Si otro proceso ya lo tomó
+        (varios workers del servidor comparten la BD), devuelve None.
+        """
+        t = trabajos_table.c
+        with self.engine.begin() as conn:
+            tomado = conn.execute(
+                trabajos_table.update()
+                .where(t.id == trabajo_id, t.estado == PENDIENTE)
+                .values(estado=EN_PROCESO, iniciado=_ahora(), proceso=self.instancia)
+            ).rowcount
+            if not tomado:
+                return None
+            return conn.execute(select(t.tipo, t.parametros).where(t.id == trabajo_id)).one()
+
+    def _latir(self):
+        """Renueva el latido de esta instancia"""
+        with self.engine.begin() as conn:
+            renovado = conn.execute(
+                instancias_table.update().where(instancias_table.c.id == self.instancia).values(latido=time.time())
+            ).rowcount
+            if not renovado:
+                conn.execute(instancias_table.insert().values(
+                    id=self.instancia, proceso=_proceso_actual(), latido=time.time()
+                ))
+
+    def _marcar_interrumpidos(self) -> int:
+        """
+        Marca como error los trabajos en proceso de instancias que dejaron de
+        latir (y borra esas instancias)
+
+        Returns:
+            Cantidad de trabajos marcados
+        """
+        t = trabajos_table.c
+        i = instancias_table.c
+        limite = time.time() - self.latido_segundos * LATIDOS_PERDIDOS
+        with self.engine.begin() as conn:
+            conn.execute(instancias_table.delete().where(i.latido < limite, i.id != self.instancia))
+            vivas = select(i.id)
+            marcados = conn.execute(
+                trabajos_table.update()
+                .where(t.estado == EN_PROCESO, t.proceso.is_(None) | t.proceso.not_in(vivas))
+                .values(estado=ERROR, error=ERROR_INTERRUMPIDO, terminado=_ahora())
+            ).rowcount
+        if marcados:
+            print(f"⚠️ {marcados} trabajo(s) interrumpido(s) marcado(s) con error")
+        return marcados
+
+    def _mantener_latido(self):
+        while not self.detenida.wait(self.latido_segundos):
+            try:
+                self._latir()
+                self._marcar_interrumpidos()
+            except Exception as e:
+                # Ej: BD ocupada; se reintenta en el próximo latido
+                print(f"⚠️ No se pudo renovar el latido de la cola: {str(e)}")
+
+    def detener(self):
+        """Espera a que terminen los trabajos en curso y deja de latir"""
+        self.executor.shutdown(wait=True)
+        self.detenida.set()
+        with self.engine.begin() as conn:
+            conn.execute(instancias_table.delete().where(instancias_table.c.id == self.instancia))
+
+    def _ejecutar(self, trabajo_id: str):
+        trabajo = self._tomar(trabajo_id)
+        if trabajo is None:
+            return
+        tipo, parametros = trabajo
+
+        print(f"⚙️ Trabajo {trabajo_id} ({tipo}) iniciado")
+        try:
+            argumentos = [
+                json.loads(parametros),
+                lambda progreso, mensaje=None: self.actualizar_progreso(trabajo_id, progreso, mensaje)
+            ]
+            if tipo in self.reanudables:
+                argumentos.append(AvanceTrabajo(self.engine, trabajo_id))
+            resultado = self.ejecutores[tipo](*argumentos)
+            self._terminar(trabajo_id, estado=COMPLETADO, progreso=100, resultado=json.dumps(resultado, default=str))
+            self._borrar_avance(trabajo_id)
+            print(f"✅ Trabajo {trabajo_id} ({tipo}) completado")
+        except Exception as e:
+            traceback.print_exc()
+            self._terminar(trabajo_id, estado=ERROR, error=str(e))
+            print(f"❌ Trabajo {trabajo_id} ({tipo}) con error: {str(e)}")
+
+    def _terminar(self, trabajo_id: str, **valores):
+        with self.engine.begin() as conn:
+            conn.execute(
+                trabajos_table.update().where(trabajos_table.c.id == trabajo_id)
+                .values(terminado=_ahora(), **valores)
+            )
+
+    def _borrar_avance(self, trabajo_id: str):
+        """Los puntos de control de un trabajo completado ya no hacen falta"""
+        with self.engine.begin() as conn:
+            conn.execute(puntos_control_table.delete().where(puntos_control_table.c.trabajo_id == trabajo_id))
+
+    def actualizar_progreso(self, trabajo_id: str, progreso: int, mensaje: str = None):
+        """
+        Guarda el avance (0 a 100) y un mensaje opcional del trabajo.
+
+        Si no se puede guardar (ej: BD ocupada) solo se avisa: el progreso es
+        informativo y no debe hacer fallar el trabajo.
+        """
+        valores = {'progreso': max(0, min(100, int(progreso)))}
+        if mensaje is not None:
+            valores['mensaje'] = mensaje
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(trabajos_table.update().where(trabajos_table.c.id == trabajo_id).values(**valores))
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el progreso del trabajo {trabajo_id}: {str(e)}")
+
+    def estado(self, trabajo_id: str):
+        """Estado y progreso del trabajo (None si no existe)"""
+        columnas = [trabajos_table.c[c] for c in COLUMNAS_ESTADO]
+        with self.engine.connect() as conn:
+            fila = conn.execute(select(*columnas).where(trabajos_table.c.id == trabajo_id)).mappings().first()
+        return dict(fila) if fila else None
+
+    def resultado(self, trabajo_id: str):
+        """Resultado del trabajo ya decodificado (None si no existe o todavía no terminó)"""
+        with self.engine.connect() as conn:
+            resultado = conn.execute(
+                select(trabajos_table.c.resultado).where(trabajos_table.c.id == trabajo_id)
+            ).scalar()
+        return json.loads(resultado) if resultado else None
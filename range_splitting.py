@@ -0,0 +1,178 @@
+"""
+range_splitting.py
+División adaptativa de rangos de fechas para consultas SAT muy grandes.
+
+Si una consulta trae demasiadas filas (o tarda demasiado), el rango se parte
+a la mitad y cada mitad se vuelve a consultar (en paralelo si la cuenta tiene
+varias pestañas). Al final las partes de un mismo período se unen en un solo
+archivo cuando el formato lo permite (ZIP y Excel).
+"""
+
+import os
+import re
+import zipfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Filas de la tabla a partir de las cuales se divide el rango
+MAX_FILAS_POR_DESCARGA = 5000
+
+# Segundos que puede tardar Buscar antes de dividir el rango
+MAX_SEGUNDOS_BUSQUEDA = 120
+
+FORMATO_FECHA = "%m/%d/%Y"  # el del formulario de Consultar DTE
+
+
+def contar_filas(texto_paginador: str):
+    """
+    Total de filas del paginador de Material ("1 – 10 of 1,234" / "1 - 10 de 1234")
+
+    Returns:
+        Número de filas o None si el texto no tiene el formato esperado
+    """
+    coincidencia = re.search(r'(?:of|de)\s+([\d.,]+)\s*$', (texto_paginador or '').strip())
+    if not coincidencia:
+        return None
+    return int(re.sub(r'[.,]', '', coincidencia.group(1)))
+
+
+def puede_dividirse(periodo: dict) -> bool:
+    """Un rango se puede dividir mientras tenga más de un día"""
+    return periodo['fecha_inicio'] != periodo['fecha_fin']
+
+
+def dividir_periodo(periodo: dict, tipo: str) -> list:
+    """
+    Parte el rango del período en dos mitades para un solo tipo de operación
+
+    Args:
+        periodo: Período con fecha_inicio/fecha_fin (MM/DD/AAAA)
+        tipo: 'Emitidos' o 'Recibidos' (la otra parte del período ya se descargó aparte)
+
+    Returns:
+        Dos períodos con las mismas opciones y 'origen' = rango original
+    """
+    inicio = datetime.strptime(periodo['fecha_inicio'], FORMATO_FECHA)
+    fin = datetime.strptime(periodo['fecha_fin'], FORMATO_FECHA)
+    mitad = inicio + (fin - inicio) // 2
+    origen = periodo.get('origen') or (periodo['fecha_inicio'], periodo['fecha_fin'])
+
+    mitades = []
+    for desde, hasta in ((inicio, mitad), (mitad + timedelta(days=1), fin)):
+        mitades.append({
+            **periodo,
+            'fecha_inicio': desde.strftime(FORMATO_FECHA),
+            'fecha_fin': hasta.strftime(FORMATO_FECHA),
+            'tipo_operacion': tipo,
+            'origen': origen,
+        })
+    return mitades
+
+
+def huecos(inicio: datetime, fin: datetime, rangos: list) -> list:
+    """
+    Días del período que no cubre ninguna parte (ej: una mitad que falló)
+
+    Args:
+        inicio: Primer día del período
+        fin: Último día del período
+        rangos: (desde, hasta) de cada parte descargada, en orden de fechas
+
+    Returns:
+        Lista de (desde, hasta) sin cubrir; vacía si el período está completo
+    """
+    faltan = []
+    siguiente = inicio
+    for desde, hasta in rangos:
+        if desde > siguiente:
+            faltan.append((siguiente, desde - timedelta(days=1)))
+        siguiente = max(siguiente, hasta + timedelta(days=1))
+    if siguiente <= fin:
+        faltan.append((siguiente, fin))
+    return faltan
+
+
+def _unir_zips(partes: list, destino: str):
+    nombres = set()
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as salida:
+        for parte in partes:
+            with zipfile.ZipFile(parte) as entrada:
+                for info in entrada.infolist():
+                    if info.is_dir() or info.filename in nombres:
+                        continue
+                    nombres.add(info.filename)
+                    with entrada.open(info) as origen, salida.open(info.filename, 'w') as copia:
+                        while True:
+                            bloque = origen.read(1024 * 1024)
+                            if not bloque:
+                                break
+                            copia.write(bloque)
+
+
+def _filas_de_encabezado(tabla) -> int:
+    """
+    Filas antes de los datos (títulos del reporte y fila de encabezados): hasta
+    la primera fila con todas las columnas llenas, que es la de encabezados
+    """
+    llenas = tabla.notna().sum(axis=1)
+    if llenas.empty:
+        return 0
+    return int((llenas == llenas.max()).to_numpy().argmax()) + 1
+
+
+def _unir_excel(partes: list, destino: str):
+    # Sin header: el reporte del SAT trae filas de título arriba de los encabezados
+    tablas = [pd.read_excel(parte, header=None) for parte in partes]
+    inicio = _filas_de_encabezado(tablas[0])
+    encabezado = tablas[0].iloc[inicio - 1].tolist() if inicio else []
+
+    cuerpos = [tablas[0]]  # con sus títulos y encabezados
+    for tabla in tablas[1:]:
+        filas = _filas_de_encabezado(tabla)
+        if tabla.shape[1] != tablas[0].shape[1] or (filas and tabla.iloc[filas - 1].tolist() != encabezado):
+            raise ValueError("Las partes no tienen las mismas columnas")
+        cuerpos.append(tabla.iloc[filas:])
+    pd.concat(cuerpos, ignore_index=True).to_excel(destino, index=False, header=False)
+
+
+# extensión de las partes -> (función que une, extensión del archivo unido)
+UNIONES = {
+    'zip': (_unir_zips, 'zip'),
+    'xlsx': (_unir_excel, 'xlsx'),
+    'xls': (_unir_excel, 'xlsx'),
+}
+
+
+def unir_partes(partes: list, base_destino: str) -> list:
+    """
+    Une las partes de un período dividido en un solo archivo
+
+    Args:
+        partes: Archivos de las partes, en orden de fechas
+        base_destino: Nombre del archivo unido sin extensión
+
+    Returns:
+        [archivo unido], o las mismas partes si el formato no se puede unir
+        (ej: PDF) o la unión falla
+    """
+    extension = partes[0].rsplit('.', 1)[-1].lower()
+    if len(partes) < 2 or extension not in UNIONES or any(
+        not p.lower().endswith('.' + extension) for p in partes
+    ):
+        return partes
+
+    unir, extension_destino = UNIONES[extension]
+    destino = f"{base_destino}.{extension_destino}"
+    try:
+        unir(partes, destino)
+    except Exception as e:
+        print(f"⚠️ No se pudieron unir {len(partes)} partes ({str(e)}), se entregan por separado")
+        if os.path.exists(destino):
+            os.remove(destino)
+        return partes
+
+    for parte in partes:
+        os.remove(parte)
+    print(f"🧩 {len(partes)} partes unidas en {destino}")
+    return [destino]
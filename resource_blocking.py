@@ -0,0 +1,235 @@
+"""
+resource_blocking.py
+Bloqueo de recursos que no hacen falta para descargar reportes (imágenes,
+fuentes, analítica de terceros).
+
+En Chromium se usa la lista de URLs bloqueadas de CDP (Network.setBlockedURLs)
+en vez de page.route: cualquier ruta de Playwright desactiva la caché HTTP del
+navegador y haría volver a bajar los scripts y el CSS del portal en cada
+navegación. Solo si CDP no está disponible se enrutan, por expresión regular,
+las URLs que se bloquean (el resto no pasa por Python).
+
+El app Angular (documentos, scripts y CSS del portal) y sus peticiones XHR,
+fetch y de descarga nunca se bloquean.
+"""
+
+import asyncio
+import re
+from urllib.parse import urlsplit
+
+# Tipos de recurso (request.resource_type) que se abortan por defecto.
+# El CSS no: Playwright decide la visibilidad de los elementos con él.
+TIPOS_BLOQUEADOS = ('image', 'media', 'font')
+
+# Hosts de terceros que se abortan siempre (también coincide con subdominios)
+HOSTS_BLOQUEADOS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'facebook.net',
+    'facebook.com',
+    'hotjar.com',
+    'clarity.ms',
+    'fonts.googleapis.com',
+    'fonts.gstatic.com',
+)
+
+# Tipos que el portal necesita para funcionar y para descargar
+TIPOS_ESENCIALES = frozenset(('document', 'xhr', 'fetch'))
+
+# Sin interceptar no se conoce el tipo de recurso: se bloquea por extensión
+EXTENSIONES_POR_TIPO = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp', 'avif'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': ('mp4', 'webm', 'ogg', 'mp3', 'wav', 'm4a'),
+    'stylesheet': ('css',),
+    'script': ('js',),
+}
+
+# Con lo que Chromium marca una petición que bloqueó el cliente
+ERROR_BLOQUEADA = 'ERR_BLOCKED_BY_CLIENT'
+
+# Tamaño típico por tipo (bytes) para estimar lo que no se descargó:
+# una petición abortada nunca dice cuánto pesaba
+TAMANO_ESTIMADO = {
+    'image': 15 * 1024,
+    'media': 200 * 1024,
+    'font': 40 * 1024,
+    'stylesheet': 20 * 1024,
+    'script': 50 * 1024,
+}
+TAMANO_ESTIMADO_OTROS = 5 * 1024
+
+
+def _lista(texto) -> tuple:
+    """'a, b,c' -> ('a', 'b', 'c')"""
+    return tuple(parte.strip().lower() for parte in (texto or '').split(',') if parte.strip())
+
+
+class PoliticaRecursos:
+    """Qué peticiones se abortan: por tipo de recurso o por host de terceros"""
+
+    def __init__(self, tipos=TIPOS_BLOQUEADOS, hosts=HOSTS_BLOQUEADOS):
+        """
+        Args:
+            tipos: Tipos de recurso a bloquear ('image', 'font', 'media', 'stylesheet', ...)
+            hosts: Hosts a bloquear (incluye sus subdominios)
+        """
+        self.tipos = frozenset(tipos) - TIPOS_ESENCIALES
+        self.hosts = tuple(hosts)
+
+    @classmethod
+    def desde_texto(cls, tipos: str = None, hosts_extra: str = None):
+        """
+        Crea la política desde la configuración (listas separadas por comas)
+
+        Args:
+            tipos: Tipos a bloquear; None = los de TIPOS_BLOQUEADOS, '' = ninguno
+            hosts_extra: Hosts que se suman a HOSTS_BLOQUEADOS
+        """
+        tipos = TIPOS_BLOQUEADOS if tipos is None else _lista(tipos)
+        return cls(tipos=tipos, hosts=HOSTS_BLOQUEADOS + _lista(hosts_extra))
+
+    def _host_bloqueado(self, url: str) -> bool:
+        host = (urlsplit(url).hostname or '').lower()
+        return any(host == bloqueado or host.endswith('.' + bloqueado) for bloqueado in self.hosts)
+
+    def extensiones(self) -> tuple:
+        """Extensiones de archivo de los tipos bloqueados"""
+        return tuple(ext for tipo in sorted(self.tipos) for ext in EXTENSIONES_POR_TIPO.get(tipo, ()))
+
+    def patrones(self) -> list:
+        """Patrones (con *) para Network.setBlockedURLs de CDP"""
+        patrones = []
+        for host in self.hosts:
+            patrones += [f"*://{host}/*", f"*://*.{host}/*"]
+        for ext in self.extensiones():
+            patrones += [f"*.{ext}", f"*.{ext}?*"]
+        return patrones
+
+    def expresion(self):
+        """Expresión regular de las URLs a enrutar cuando no hay CDP (None si no hay nada que bloquear)"""
+        partes = []
+        if self.hosts:
+            hosts = '|'.join(re.escape(h) for h in self.hosts)
+            partes.append(rf'^[a-z][a-z0-9+.-]*://([^/?#]*\.)?({hosts})(:\d+)?([/?#]|$)')
+        if self.extensiones():
+            extensiones = '|'.join(re.escape(e) for e in self.extensiones())
+            partes.append(rf'^[^?#]*\.({extensiones})([?#].*)?$')
+        return re.compile('|'.join(partes), re.IGNORECASE) if partes else None
+
+    def debe_bloquear(self, request) -> bool:
+        # Los hosts de terceros se bloquean siempre (la analítica también manda XHR)
+        if self._host_bloqueado(request.url):
+            return True
+        tipo = request.resource_type
+        return tipo not in TIPOS_ESENCIALES and tipo in self.tipos
+
+
+class ContadorRecursos:
+    """Peticiones bloqueadas y permitidas de una sesión"""
+
+    def __init__(self):
+        self.bloqueadas = {}   # tipo -> cantidad
+        self.permitidas = 0
+        self.bytes_descargados = 0
+
+    def bloqueada(self, tipo: str):
+        self.bloqueadas[tipo] = self.bloqueadas.get(tipo, 0) + 1
+
+    def fallida(self, request):
+        if ERROR_BLOQUEADA in (request.failure or ''):
+            self.bloqueada(request.resource_type)
+
+    def respuesta(self, response):
+        self.permitidas += 1
+        tamano = response.headers.get('content-length')
+        if tamano and tamano.isdigit():
+            self.bytes_descargados += int(tamano)
+
+    def resumen(self) -> dict:
+        """
+        Returns:
+            Peticiones bloqueadas (total y por tipo), bytes ahorrados estimados
+            y lo que sí se descargó (según content-length)
+        """
+        return {
+            'peticiones_bloqueadas': sum(self.bloqueadas.values()),
+            'bloqueadas_por_tipo': dict(self.bloqueadas),
+            'bytes_ahorrados_estimados': sum(
+                cantidad * TAMANO_ESTIMADO.get(tipo, TAMANO_ESTIMADO_OTROS)
+                for tipo, cantidad in self.bloqueadas.items()
+            ),
+            'peticiones_permitidas': self.permitidas,
+            'bytes_descargados': self.bytes_descargados,
+        }
+
+
+class BloqueoRecursos(ContadorRecursos):
+    """
+    Bloqueo instalado en un contexto. Con CDP, cada página necesita su lista
+    de URLs bloqueadas: preparar_pagina la aplica (una vez por página).
+    """
+
+    def __init__(self, context, politica: PoliticaRecursos):
+        super().__init__()
+        self.context = context
+        self.politica = politica
+        self.cdp = True      # False: se enruta por expresión regular
+        self.preparadas = set()
+
+    async def preparar_pagina(self, page):
+        """Aplica la lista de URLs bloqueadas a la página (antes de navegar con ella)"""
+        if not self.cdp or id(page) in self.preparadas:
+            return
+        self.preparadas.add(id(page))
+        try:
+            sesion = await self.context.new_cdp_session(page)
+            await sesion.send('Network.enable')
+            await sesion.send('Network.setBlockedURLs', {'urls': self.politica.patrones()})
+        except Exception as e:
+            print(f"⚠️ No se pudo bloquear recursos en la página: {str(e)}")
+
+    async def _enrutar(self):
+        expresion = self.politica.expresion()
+        if expresion is None:
+            return
+
+        async def interceptar(route):
+            # La expresión solo mira la URL: los tipos esenciales igual pasan
+            if self.politica.debe_bloquear(route.request):
+                await route.abort('blockedbyclient')
+            else:
+                await route.continue_()
+
+        await self.context.route(expresion, interceptar)
+
+
+async def instalar_bloqueo(context, politica: PoliticaRecursos) -> BloqueoRecursos:
+    """
+    Bloquea en el contexto las peticiones que la política no quiere cargar
+
+    En Chromium, las páginas que se abran después se preparan solas (evento
+    'page'); conviene igual llamar a preparar_pagina apenas se crea una página,
+    para que quede lista antes de su primera navegación.
+
+    Args:
+        context: BrowserContext de Playwright
+        politica: PoliticaRecursos a aplicar
+
+    Returns:
+        BloqueoRecursos (cuenta lo bloqueado mientras se navega)
+    """
+    bloqueo = BloqueoRecursos(context, politica)
+    context.on('response', bloqueo.respuesta)
+    context.on('requestfailed', bloqueo.fallida)
+
+    navegador = context.browser
+    if navegador is not None and navegador.browser_type.name == 'chromium':
+        context.on('page', lambda page: asyncio.ensure_future(bloqueo.preparar_pagina(page)))
+        for page in context.pages:
+            await bloqueo.preparar_pagina(page)
+    else:
+        bloqueo.cdp = False
+        await bloqueo._enrutar()
+    return bloqueo
@@ -1,8 +1,60 @@
 import asyncio
+from contextlib import asynccontextmanager
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from datetime import datetime
 from typing import Optional
 import os
+import time
+
+from direct_download import (
+    GrabadorPeticiones, aplicar_periodo, archivo_del_periodo, crear_plantilla, es_archivo, nombre_de_disposicion
+)
+from range_splitting import FORMATO_FECHA, contar_filas, dividir_periodo, huecos, puede_dividirse, unir_partes
+from resource_blocking import instalar_bloqueo
+
+# Opciones de Chromium para correr en servidor (contenedor sin sandbox)
+ARGS_CHROMIUM = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-blink-features=AutomationControlled"
+]
+
+# Tiempos máximos (ms) de las esperas por condición; si se agotan se sigue igual
+ESPERA_LOGIN_MS = 15000
+ESPERA_RESPUESTA_MS = 60000
+ESPERA_CORTA_MS = 3000
+
+# Peticiones del app Angular (las que trae Buscar, Limpiar, etc.)
+TIPOS_XHR = ('xhr', 'fetch')
+
+# Checkbox del header de la tabla de resultados (aparece cuando la tabla ya se pintó)
+SELECTOR_CHECKBOX_HEADER = 'mat-header-row input[type="checkbox"], thead input[type="checkbox"]'
+
+# Texto "1 – 10 of 1234" del paginador de la tabla de resultados
+SELECTOR_PAGINADOR = '.mat-paginator-range-label, .mat-mdc-paginator-range-label'
+
+# La búsqueda terminó de pintarse: hay tabla, o el paginador dice que no hay filas
+# (una búsqueda vacía nunca muestra el checkbox del header)
+JS_TABLA_O_VACIA = """([checkbox, paginador]) => {
+    if (document.querySelector(checkbox)) return true;
+    const rango = document.querySelector(paginador);
+    return !!rango && /(?:of|de)\\s+0\\s*$/.test(rango.textContent.trim());
+}"""
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+async def lanzar_chromium(playwright, headless: bool = False) -> Browser:
+    """
+    Lanza Chromium con las opciones del navegador SAT
+    
+    Args:
+        playwright: Instancia ya iniciada de async_playwright
+        headless: Si True, ejecuta sin interfaz gráfica
+    """
+    return await playwright.chromium.launch(headless=headless, args=ARGS_CHROMIUM)
+
 
 class SATNavigator:
     """
@@ -15,36 +67,71 @@ class SATNavigator:
         self.page: Optional[Page] = None
         self.playwright = None
         self.current_data = {}
+        self.browser_propio = True  # False si el navegador es compartido (solo se cierra el contexto)
+        self.esperas = {}  # paso -> [veces, segundos] que realmente se esperó
+        self.recursos = None  # BloqueoRecursos si hay política de bloqueo
+        self.ultima_descarga_url = None  # URL de la última descarga por la interfaz
+        self.plantillas = {}  # (tipo, formato) -> plantilla de descarga directa
+        self.grabador = None  # GrabadorPeticiones (solo con descarga directa)
+        self.en_consulta = False  # ya está en el iframe de Consultar DTE
+        self.periodos_divididos = []  # mitades de consultas demasiado grandes, pendientes
+        self.incompletos = []  # períodos divididos con días sin descargar (sus partes no se unen)
+        self.partes = {}  # archivo de una mitad -> ((tipo, fecha_inicio, fecha_fin) del período original, inicio, fin y formato de la mitad)
+        self.descargas = {}  # archivo completo de un período -> {tipo, fecha_inicio, fecha_fin, formato}
+        self.al_descargar = None  # async callable(archivo, descarga) por cada período completo (ej: punto de control)
         
-    async def iniciar(self, headless: bool = False):
+    async def iniciar(
+        self,
+        headless: bool = False,
+        browser: Optional[Browser] = None,
+        servicio=None,
+        storage_state: Optional[dict] = None,
+        politica_recursos=None
+    ):
         """
         Inicia el navegador y prepara todo para la navegación
         
         Args:
             headless: Si True, ejecuta sin interfaz gráfica
+            browser: Navegador ya lanzado para compartir entre varias sesiones.
+                Cada sesión usa su propio BrowserContext (cookies y storage aislados),
+                así que varias cuentas pueden navegar a la vez sin mezclarse.
+            servicio: ServicioNavegador (browser_service.py) que entrega el contexto
+                desde un Chromium persistente; tiene prioridad sobre `browser`
+            storage_state: Cookies y storage de una sesión anterior (ver restaurar_sesion)
+            politica_recursos: PoliticaRecursos (resource_blocking.py) para no cargar
+                imágenes, fuentes ni analítica; None = se carga todo
         """
         print("🚀 Iniciando navegador...")
         
-        self.playwright = await async_playwright().start()
-        # self.browser = await self.playwright.chromium.launch(
-        #     headless=headless,
-        #     args=['--disable-blink-features=AutomationControlled']
-        # )
-        self.browser = await self.playwright.chromium.launch(
-        headless=headless,
-        args=[
-            "--no-sandbox",
-            "--disable-setuid-sandbox",
-            "--disable-blink-features=AutomationControlled"
-            ]
-        )
+        opciones_contexto = {
+            'viewport': {'width': 1920, 'height': 1080},
+            'user_agent': USER_AGENT
+        }
+        if storage_state:
+            opciones_contexto['storage_state'] = storage_state
+        
+        if servicio is not None:
+            self.context = await servicio.nuevo_contexto(**opciones_contexto)
+            self.browser = self.context.browser
+            self.browser_propio = False
+        elif browser is not None:
+            self.browser = browser
+            self.browser_propio = False
+        else:
+            self.playwright = await async_playwright().start()
+            self.browser = await lanzar_chromium(self.playwright, headless=headless)
+            self.browser_propio = True
 
-        self.context = await self.browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
+        if self.context is None:
+            self.context = await self.browser.new_context(**opciones_contexto)
+        
+        if politica_recursos is not None:
+            self.recursos = await instalar_bloqueo(self.context, politica_recursos)
         
         self.page = await self.context.new_page()
+        if self.recursos:
+            await self.recursos.preparar_pagina(self.page)
         
         # Configurar listeners para debugging
         self.page.on('console', lambda msg: print(f"📢 Console: {msg.text}"))
@@ -53,6 +140,83 @@ class SATNavigator:
         print("✅ Navegador iniciado correctamente")
 
 
+    @asynccontextmanager
+    async def medir_espera(self, paso: str):
+        """Acumula en self.esperas el tiempo que se pasa esperando en `paso`"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            registro = self.esperas.setdefault(paso, [0, 0.0])
+            registro[0] += 1
+            registro[1] += time.perf_counter() - inicio
+
+    def resumen_esperas(self) -> dict:
+        """
+        Tiempo de espera por paso, de mayor a menor
+        
+        Returns:
+            Diccionario {paso: {'veces': n, 'segundos': total}}
+        """
+        ordenados = sorted(self.esperas.items(), key=lambda item: item[1][1], reverse=True)
+        return {paso: {'veces': veces, 'segundos': round(segundos, 2)} for paso, (veces, segundos) in ordenados}
+
+    def imprimir_esperas(self):
+        """Muestra cuánto se esperó en cada paso"""
+        if not self.esperas:
+            return
+        print("\n⏱️ TIEMPO ESPERANDO POR PASO")
+        print("-" * 40)
+        for paso, datos in self.resumen_esperas().items():
+            print(f"   {paso}: {datos['segundos']:.2f}s ({datos['veces']} vez/veces)")
+
+    async def esperar_condicion(self, paso: str, condicion, timeout: int = ESPERA_CORTA_MS) -> bool:
+        """
+        Espera una condición de Playwright (selector, función, url...) midiendo el tiempo
+        
+        Args:
+            paso: Nombre del paso para el resumen de esperas
+            condicion: Callable que recibe timeout= y devuelve la corrutina a esperar
+                (ej: lambda timeout: page.wait_for_selector(..., timeout=timeout))
+            timeout: Máximo en ms; si se agota no falla, devuelve False y se sigue
+        
+        Returns:
+            True si la condición se cumplió antes del timeout
+        """
+        async with self.medir_espera(paso):
+            try:
+                await condicion(timeout=timeout)
+                return True
+            except PlaywrightTimeoutError:
+                print(f"   ⚠️ Espera '{paso}' agotada ({timeout} ms), continuando...")
+                return False
+
+    async def esperar_respuesta_de(self, paso: str, accion, timeout: int = ESPERA_RESPUESTA_MS) -> bool:
+        """
+        Ejecuta `accion` y espera la respuesta XHR/fetch que dispara en el app Angular
+        
+        Args:
+            paso: Nombre del paso para el resumen de esperas
+            accion: Callable sin argumentos que devuelve la corrutina (ej: el click en Buscar)
+            timeout: Máximo en ms para la respuesta
+        
+        Returns:
+            True si llegó una respuesta antes del timeout
+        """
+        main_page = await self._obtener_pagina_principal()
+        async with self.medir_espera(paso):
+            try:
+                async with main_page.expect_response(
+                    lambda r: r.request.resource_type in TIPOS_XHR,
+                    timeout=timeout
+                ):
+                    await accion()
+                return True
+            except PlaywrightTimeoutError:
+                print(f"   ⚠️ Sin respuesta del servidor en '{paso}' ({timeout} ms), continuando...")
+                return False
+
+
     async def ir_a_login(self):
         """
         Navega a la página de login del SAT
@@ -65,10 +229,52 @@ class SATNavigator:
             timeout=30000
         )
         
-        await self.page.wait_for_timeout(2000)
+        await self.esperar_condicion(
+            'carga_login',
+            lambda timeout: self.page.wait_for_selector('input[type="password"]', state='visible', timeout=timeout),
+            timeout=ESPERA_LOGIN_MS
+        )
         print("✅ Página de login cargada")
         
 
+    async def restaurar_sesion(self, url: str, usuario: str) -> bool:
+        """
+        Abre la URL de una sesión guardada y verifica que el portal la acepte
+        
+        Args:
+            url: Página a la que se llegó después del login en la sesión guardada
+            usuario: Usuario de la sesión (para nombrar los archivos, como hacer_login)
+        
+        Returns:
+            True si la sesión sigue activa; False si el portal pidió login otra vez
+        """
+        print("🔄 Reutilizando sesión guardada...")
+        self.usuario = ''.join(filter(str.isdigit, usuario))
+        try:
+            async with self.medir_espera('restaurar_sesion'):
+                await self.page.goto(url, wait_until='networkidle', timeout=30000)
+        except Exception as e:
+            print(f"   ⚠️ No se pudo abrir la sesión guardada: {str(e)}")
+            return False
+        
+        if 'login' in self.page.url.lower() or await self.page.query_selector('input[type="password"]'):
+            print("   ⚠️ La sesión guardada venció, se hará login")
+            return False
+        
+        print("   ✅ Sesión activa, login omitido")
+        return True
+
+    async def estado_sesion(self) -> dict:
+        """
+        Cookies, storage y URL actual para guardar la sesión (ver restaurar_sesion)
+        """
+        main_page = await self._obtener_pagina_principal()
+        return {
+            'storage_state': await self.context.storage_state(),
+            'url': main_page.url
+        }
+
+
     async def interactuar_con_dropdown_material(self, dropdown_id: str = None, nombre: str = None):
         """
         Abre un dropdown Material Design y permite seleccionar una opción
@@ -102,12 +308,14 @@ class SATNavigator:
             
             # Click para abrir
             await dropdown.click()
-            await asyncio.sleep(0.5)
-            
             print("✅ Dropdown abierto")
             
-            # Esperar a que aparezcan las opciones
-            await self.page.wait_for_selector('mat-option', timeout=3000)
+            # Esperar a que el overlay muestre las opciones
+            await self.esperar_condicion(
+                'dropdown_abrir',
+                lambda timeout: self.page.wait_for_selector('mat-option', state='visible', timeout=timeout),
+                timeout=ESPERA_CORTA_MS
+            )
             
             # Obtener todas las opciones
             opciones = await self.page.query_selector_all('mat-option')
@@ -183,7 +391,12 @@ class SATNavigator:
         try:
             # Hacer click en la opción
             await opcion_seleccionada['element'].click()
-            await asyncio.sleep(0.3)
+            
+            # El overlay de Material se cierra (y saca las opciones) al aplicar la selección
+            await self.esperar_condicion(
+                'dropdown_cerrar',
+                lambda timeout: self.page.wait_for_selector('.cdk-overlay-pane mat-option', state='detached', timeout=timeout)
+            )
             
             print(f"✅ Opción seleccionada: {opcion_seleccionada['text']}")
             return True
@@ -204,6 +417,9 @@ class SATNavigator:
         if hasattr(self.page, 'page'):
             # Es un Frame, obtener la página principal
             return self.page.page
+        elif self.page is not None:
+            # Ya es una página (con varias pestañas, no siempre es la primera del contexto)
+            return self.page
         elif hasattr(self, 'context') and self.context.pages:
             # Obtener la primera página del contexto
             return self.context.pages[0]
@@ -260,15 +476,19 @@ class SATNavigator:
             
             print(f"⏳ Iniciando descarga de {tipo.upper()}...")
             
-            async with main_page.expect_download(timeout=600000) as download_info:
-                await elemento_descarga.click()
-                print(f"✅ Click en botón de descarga {tipo.upper()}")
-            
-            download = await download_info.value
+            async with self.medir_espera('descarga'):
+                async with main_page.expect_download(timeout=600000) as download_info:
+                    await elemento_descarga.click()
+                    print(f"✅ Click en botón de descarga {tipo.upper()}")
+                
+                download = await download_info.value
+            self.ultima_descarga_url = download.url
             
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             suggested_name = download.suggested_filename
-            filename = f"reporte_sat_{tipo}_{timestamp}_{suggested_name}"
+            # El usuario en el nombre evita choques entre cuentas que descargan a la vez
+            usuario = getattr(self, 'usuario', 'unknown')
+            filename = f"reporte_sat_{tipo}_{usuario}_{timestamp}_{suggested_name}"
             
             await download.save_as(filename)
             
@@ -290,6 +510,9 @@ class SATNavigator:
         Args:
             usuario: Nombre de usuario o NIT
             password: Contraseña
+        
+        Returns:
+            True si el portal salió de la página de login
         """
         # limpiar usuario, quitar todo lo que no sea número
         usuario = ''.join(filter(str.isdigit, usuario))
@@ -331,10 +554,7 @@ class SATNavigator:
             
             # Llenar los campos
             await user_field.fill(usuario)
-            await asyncio.sleep(0.5)
-            
             await pass_field.fill(password)
-            await asyncio.sleep(0.5)
             
             print("   ✓ Credenciales ingresadas")
             
@@ -364,22 +584,33 @@ class SATNavigator:
                 await login_button.click()
                 print("   ✓ Botón de login clickeado")
                 
-                # Esperar a que la página cargue
+                # Esperar a salir de la página de login (si no pasa, el login falló)
                 print("   ⏳ Esperando respuesta del servidor...")
-                await self.page.wait_for_load_state('networkidle', timeout=10000)
+                if await self.esperar_condicion(
+                    'login',
+                    lambda timeout: self.page.wait_for_url(lambda url: 'login' not in url.lower(), timeout=timeout),
+                    timeout=ESPERA_LOGIN_MS
+                ):
+                    await self.esperar_condicion(
+                        'carga_menu',
+                        lambda timeout: self.page.wait_for_load_state('networkidle', timeout=timeout),
+                        timeout=ESPERA_LOGIN_MS
+                    )
                 
                 # Verificar si el login fue exitoso
-                await asyncio.sleep(2)
                 new_url = self.page.url
                 
                 if 'login' not in new_url.lower():
                     print("   ✅ LOGIN EXITOSO - Redirigido a nueva página")
                     print(f"   📍 Nueva URL: {new_url}")
+                    return True
                 else:
                     print("   ⚠️ Posible error en login - Verificar manualmente")
                     
             else:
                 print("   ❌ No se encontró el botón de login")
+            
+            return False
                 
         except Exception as e:
             print(f"   ❌ Error durante el login: {str(e)}")
@@ -434,7 +665,7 @@ class SATNavigator:
         
         try:
             # Buscar el checkbox en el header de la tabla
-            header_checkbox = await self.page.query_selector('mat-header-row input[type="checkbox"], thead input[type="checkbox"]')
+            header_checkbox = await self.page.query_selector(SELECTOR_CHECKBOX_HEADER)
             
             if not header_checkbox:
                 print("❌ No se encontró checkbox en el header")
@@ -457,7 +688,15 @@ class SATNavigator:
                 element.dispatchEvent(event);
             }''', header_checkbox)
             
-            await asyncio.sleep(0.5)  # Esperar a que se propaguen los cambios
+            # Esperar a que Angular aplique el cambio de estado
+            await self.esperar_condicion(
+                'checkbox',
+                lambda timeout: self.page.wait_for_function(
+                    '([el, marcar]) => el.checked === marcar',
+                    arg=[header_checkbox, marcar],
+                    timeout=timeout
+                )
+            )
             
             print(f"   ✅ Checkbox del header {'marcado' if marcar else 'desmarcado'} exitosamente")
             print(f"   ℹ️ Esto debería {'seleccionar' if marcar else 'deseleccionar'} todos los registros de la tabla")
@@ -545,9 +784,6 @@ class SATNavigator:
                 await elemento_encontrado.click()
                 print(f"\n   🎯 ¡CLICK EXITOSO!")
                 
-                # Esperar un momento para que la página responda
-                await asyncio.sleep(1)
-                
                 # Verificar si la página cambió
                 await self.page.wait_for_load_state('domcontentloaded', timeout=5000)
                 
@@ -608,30 +844,30 @@ class SATNavigator:
             print(f"   🔄 Intento {intento}/{max_intentos} de encontrar: {identificador}")
             
             # Intentar todas las estrategias
-            for selector, descripcion in estrategias:
-                try:
-                    elemento = await self.page.wait_for_selector(
-                        selector, 
-                        timeout=timeout,
-                        state='visible'
-                    )
-                    
-                    if elemento:
-                        print(f"   ✅ Elemento encontrado con: {descripcion}")
-                        return elemento
+            async with self.medir_espera(f"elemento:{identificador}"):
+                for selector, descripcion in estrategias:
+                    try:
+                        elemento = await self.page.wait_for_selector(
+                            selector, 
+                            timeout=timeout,
+                            state='visible'
+                        )
                         
-                except:
-                    continue
+                        if elemento:
+                            print(f"   ✅ Elemento encontrado con: {descripcion}")
+                            return elemento
+                            
+                    except:
+                        continue
             
-            # Si no se encontró y no es el último intento
+            # Si no se encontró y no es el último intento (cada estrategia ya esperó su timeout)
             if intento < max_intentos:
                 if hacer_refresh:
                     print(f"   ⚠️ Elemento no encontrado, haciendo refresh...")
-                    await self.page.reload(wait_until='networkidle', timeout=30000)
-                    await asyncio.sleep(1)
+                    async with self.medir_espera('recarga'):
+                        await self.page.reload(wait_until='networkidle', timeout=30000)
                 else:
-                    print(f"   ⚠️ Esperando antes de reintentar...")
-                    await asyncio.sleep(1)
+                    print(f"   ⚠️ Reintentando...")
         
         print(f"   ❌ Elemento '{identificador}' no encontrado después de {max_intentos} intentos")
         return None
@@ -659,17 +895,13 @@ class SATNavigator:
             raise Exception(f"No se pudo encontrar elemento: {identificador}")
         
         try:
-            # Scroll al elemento
+            # Scroll al elemento (click ya espera a que esté estable y habilitado)
             await elemento.scroll_into_view_if_needed()
-            await asyncio.sleep(0.5)
             
             # Intentar click normal
             await elemento.click()
             print(f"   ✅ Click exitoso")
             
-            # Esperar a que la página responda
-            await asyncio.sleep(0.5)
-            
             return True
             
         except Exception as e:
@@ -689,6 +921,16 @@ class SATNavigator:
         """
         for intento in range(max_intentos):
             try:
+                # Esperar a que el app pinte contenido (sale antes si ya lo hay)
+                await self.esperar_condicion(
+                    'pagina_con_contenido',
+                    lambda timeout: self.page.wait_for_function(
+                        "() => document.body && document.body.innerText.trim().length > 80",
+                        timeout=timeout
+                    ),
+                    timeout=ESPERA_LOGIN_MS
+                )
+                
                 # Verificar si hay contenido visible
                 body_content = await self.page.evaluate(
                     "() => document.body ? document.body.innerText.trim().length : 0"
@@ -703,13 +945,16 @@ class SATNavigator:
                 
                 if intento < max_intentos - 1:
                     print("   🔄 Recargando página...")
-                    await self.page.reload(wait_until='networkidle', timeout=30000)
-                    await asyncio.sleep(2)
+                    async with self.medir_espera('recarga'):
+                        await self.page.reload(wait_until='networkidle', timeout=30000)
             
             except Exception as e:
                 print(f"   ❌ Error verificando página: {str(e)}")
                 if intento < max_intentos - 1:
-                    await asyncio.sleep(2)
+                    await self.esperar_condicion(
+                        'recarga',
+                        lambda timeout: self.page.wait_for_load_state('load', timeout=timeout)
+                    )
         
         return False
 
@@ -717,18 +962,284 @@ class SATNavigator:
 
 
 
+    async def descargar_directo(self, plantilla: dict, periodo: dict, formato: str):
+        """
+        Repite la petición de descarga grabada con las fechas de otro período,
+        con las cookies de la sesión (APIRequestContext), sin usar la tabla
+        
+        Args:
+            plantilla: Resultado de direct_download.crear_plantilla
+            periodo: Período con fecha_inicio/fecha_fin (MM/DD/AAAA)
+            formato: Formato del reporte (para el nombre del archivo)
+        
+        Returns:
+            Nombre del archivo guardado, o None si la respuesta no fue un
+            archivo, vino vacío o no es del período pedido
+        """
+        url, cuerpo = aplicar_periodo(plantilla, periodo)
+        print(f"⚡ Descarga directa {formato.upper()}: {periodo['fecha_inicio']} - {periodo['fecha_fin']}")
+        
+        try:
+            async with self.medir_espera('descarga_directa'):
+                respuesta = await self.context.request.fetch(
+                    url,
+                    method=plantilla['method'],
+                    headers=plantilla['headers'],
+                    data=cuerpo,
+                    timeout=600000
+                )
+                try:
+                    if not respuesta.ok or not es_archivo(respuesta.headers):
+                        print(f"   ⚠️ La respuesta no es un archivo (HTTP {respuesta.status})")
+                        return None
+                    contenido = await respuesta.body()
+                    nombre_sugerido = nombre_de_disposicion(respuesta.headers) or f"reporte.{formato.lower()}"
+                finally:
+                    await respuesta.dispose()
+        except Exception as e:
+            print(f"   ⚠️ Error en descarga directa: {str(e)}")
+            return None
+        
+        if not await asyncio.to_thread(archivo_del_periodo, contenido, nombre_sugerido, periodo):
+            print(f"   ⚠️ El archivo ({len(contenido):,} bytes) está vacío o no es del período pedido")
+            return None
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        usuario = getattr(self, 'usuario', 'unknown')
+        filename = f"reporte_sat_{formato.lower()}_{usuario}_{timestamp}_{os.path.basename(nombre_sugerido)}"
+        with open(filename, 'wb') as f:
+            f.write(contenido)
+        
+        print(f"   ✅ {len(contenido):,} bytes guardados en {filename}")
+        return filename
+
+
+    async def abrir_pestana(self, url: str) -> 'SATNavigator':
+        """
+        Abre otra pestaña en el mismo contexto (misma sesión, sin otro login)
+        
+        Args:
+            url: Página ya autenticada desde donde empezar a navegar
+        
+        Returns:
+            SATNavigator que comparte navegador y contexto pero usa su propia página;
+            al terminar se cierra solo su página (ver cerrar_pestana)
+        """
+        pestana = SATNavigator()
+        pestana.browser = self.browser
+        pestana.context = self.context
+        pestana.browser_propio = False
+        pestana.usuario = getattr(self, 'usuario', 'unknown')
+        pestana.al_descargar = self.al_descargar
+        pestana.recursos = self.recursos
+        pestana.page = await self.context.new_page()
+        if pestana.recursos:
+            await pestana.recursos.preparar_pagina(pestana.page)
+        pestana.page.on('pageerror', lambda err: print(f"❌ Error en página: {err}"))
+        
+        async with pestana.medir_espera('abrir_pestana'):
+            await pestana.page.goto(url, wait_until='networkidle', timeout=30000)
+        return pestana
+
+    async def cerrar_pestana(self):
+        """Cierra solo la página de esta pestaña (el contexto sigue de la cuenta)"""
+        main_page = await self._obtener_pagina_principal()
+        try:
+            await main_page.close()
+        except Exception as e:
+            print(f"⚠️ Error al cerrar pestaña: {str(e)}")
+
+    async def descargar_periodos_en_paralelo(
+        self,
+        periodos: list,
+        max_pestanas: int = 2,
+        descarga_directa: bool = False,
+        max_filas: int = None,
+        max_segundos_busqueda: float = None
+    ):
+        """
+        Reparte los períodos entre varias pestañas de la misma sesión
+        
+        Cada pestaña navega una vez hasta Consultar DTE y descarga su parte de
+        los períodos con descargar_multiples_periodos; todas comparten las
+        cookies del login, así que no hay logins extra.
+        
+        Si una consulta resulta demasiado grande, sus dos mitades vuelven a
+        repartirse entre las pestañas en una ronda siguiente, hasta que no
+        quede nada pendiente; al final las partes se unen (range_splitting.py).
+        
+        Args:
+            periodos: Lista de períodos (ver descargar_multiples_periodos)
+            max_pestanas: Pestañas trabajando a la vez para esta cuenta
+            descarga_directa: Ver descargar_multiples_periodos
+            max_filas: Ver descargar_multiples_periodos
+            max_segundos_busqueda: Ver descargar_multiples_periodos
+        
+        Returns:
+            Archivos descargados por todas las pestañas
+        """
+        max_pestanas = max(1, max_pestanas)
+        url_inicio = (await self._obtener_pagina_principal()).url
+        pestanas = [self]
+        archivos = []
+        pendientes = list(periodos)
+        ronda = 0
+        
+        try:
+            while pendientes:
+                ronda += 1
+                
+                # La primera parte la hace esta página; el resto, pestañas nuevas desde la misma URL
+                while len(pestanas) < min(max_pestanas, len(pendientes)):
+                    try:
+                        pestanas.append(await self.abrir_pestana(url_inicio))
+                    except Exception as e:
+                        # Con las que haya se sigue (siempre queda al menos esta página)
+                        print(f"⚠️ No se pudo abrir otra pestaña: {str(e)}")
+                        max_pestanas = len(pestanas)
+                
+                activas = pestanas[:min(len(pestanas), len(pendientes))]
+                if len(activas) > 1 or ronda > 1:
+                    print(f"\n🗂️ Ronda {ronda}: {len(pendientes)} período(s) en {len(activas)} pestaña(s)")
+                
+                # Reparto intercalado: cada pestaña recibe períodos de todo el rango
+                resultados = await asyncio.gather(*(
+                    pestana.descargar_multiples_periodos(
+                        periodos=pendientes[i::len(activas)],
+                        navegar_primera_vez=not pestana.en_consulta,
+                        descarga_directa=descarga_directa,
+                        max_filas=max_filas,
+                        max_segundos_busqueda=max_segundos_busqueda
+                    )
+                    for i, pestana in enumerate(activas)
+                ), return_exceptions=True)
+                
+                pendientes = []
+                for pestana_idx, (pestana, resultado) in enumerate(zip(activas, resultados), 1):
+                    if isinstance(resultado, Exception):
+                        print(f"❌ Error en pestaña {pestana_idx}: {str(resultado)}")
+                    else:
+                        archivos.extend(resultado)
+                    pendientes.extend(pestana.periodos_divididos)
+                    pestana.periodos_divididos = []
+        finally:
+            for pestana in pestanas[1:]:
+                await pestana.cerrar_pestana()
+                self.partes.update(pestana.partes)
+                self.descargas.update(pestana.descargas)
+                for paso, (veces, segundos) in pestana.esperas.items():
+                    registro = self.esperas.setdefault(paso, [0, 0.0])
+                    registro[0] += veces
+                    registro[1] += segundos
+        
+        return await self._unir_partes(archivos)
+
+    async def _unir_partes(self, archivos: list) -> list:
+        """
+        Une en un archivo las partes de cada período que se dividió
+        
+        Solo se unen las partes que cubren todo el período; el archivo unido
+        queda anotado en self.descargas como la descarga completa de ese
+        período. Si faltan días, las partes se entregan sin unir.
+        """
+        grupos = {}
+        resultado = []
+        for archivo in archivos:
+            if archivo in self.partes:
+                origen, inicio, fin, formato = self.partes[archivo]
+                grupos.setdefault(origen, []).append((inicio, fin, archivo, formato))
+            else:
+                resultado.append(archivo)
+        
+        usuario = getattr(self, 'usuario', 'unknown')
+        for (tipo, fecha_inicio, fecha_fin), partes in grupos.items():
+            partes.sort()  # por fecha de inicio de cada parte
+            
+            # Si alguna mitad falló, un archivo con el nombre del período completo
+            # parecería completo: se entregan las partes sueltas
+            faltan = huecos(
+                datetime.strptime(fecha_inicio, FORMATO_FECHA),
+                datetime.strptime(fecha_fin, FORMATO_FECHA),
+                [(parte[0], parte[1]) for parte in partes]
+            )
+            if faltan:
+                dias = ", ".join(
+                    f"{desde.strftime(FORMATO_FECHA)} - {hasta.strftime(FORMATO_FECHA)}" for desde, hasta in faltan
+                )
+                print(f"⚠️ {tipo} {fecha_inicio} - {fecha_fin} incompleto (faltan {dias}): "
+                      f"{len(partes)} parte(s) sin unir")
+                self.incompletos.append({
+                    'tipo': tipo, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin,
+                    'faltan': [(desde.strftime(FORMATO_FECHA), hasta.strftime(FORMATO_FECHA)) for desde, hasta in faltan]
+                })
+                resultado.extend(parte[2] for parte in partes)
+                continue
+            
+            # Con timestamp, como las descargas: dos trabajos del mismo período no se pisan
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            base = f"{usuario}_{tipo.lower()}_{fecha_inicio.replace('/', '')}_{fecha_fin.replace('/', '')}_{timestamp}"
+            # Leer y escribir Excel/ZIP grandes no debe frenar el loop del navegador
+            unidos = await asyncio.to_thread(unir_partes, [parte[2] for parte in partes], base)
+            resultado.extend(unidos)
+            if len(unidos) == 1:
+                await self._anotar_descarga(unidos[0], {
+                    'tipo': tipo, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin, 'formato': partes[0][3]
+                })
+        return resultado
+
+    async def _anotar_descarga(self, archivo: str, descarga: dict):
+        """Anota el archivo completo de un período y avisa a al_descargar"""
+        self.descargas[archivo] = descarga
+        if self.al_descargar:
+            try:
+                await self.al_descargar(archivo, descarga)
+            except Exception as e:
+                # El archivo ya está descargado: que falle el aviso no debe repetir la descarga
+                print(f"⚠️ Error al anotar {archivo}: {str(e)}")
+
+
+    async def contar_resultados(self):
+        """Total de filas de la tabla según el paginador (None si no se puede leer)"""
+        paginador = await self.page.query_selector(SELECTOR_PAGINADOR)
+        if not paginador:
+            return None
+        return contar_filas(await paginador.text_content())
+
     async def descargar_multiples_periodos(
         self,
         periodos: list,
-        navegar_primera_vez: bool = True
+        navegar_primera_vez: bool = True,
+        descarga_directa: bool = False,
+        max_filas: int = None,
+        max_segundos_busqueda: float = None
     ):
-        """Descarga múltiples períodos en la misma sesión"""
+        """
+        Descarga múltiples períodos en la misma sesión
+        
+        Args:
+            periodos: Lista de {fecha_inicio, fecha_fin, tipo_operacion, formato} (fechas MM/DD/AAAA)
+            navegar_primera_vez: Si True, navega por el menú hasta Consultar DTE
+            descarga_directa: Si True, la primera descarga de cada tipo/formato se hace
+                por la interfaz y las siguientes repiten esa petición por HTTP
+                (ver direct_download.py); si no se puede, sigue por la interfaz
+            max_filas: Si la consulta trae más filas (o la descarga falla), no se
+                descarga: el rango se parte en dos y las mitades quedan en
+                self.periodos_divididos para otra ronda. None = no dividir
+            max_segundos_busqueda: Igual, si Buscar tarda más que esto
+        """
         
         print("\n" + "="*60)
         print(f"🚀 DESCARGANDO {len(periodos)} PERÍODOS EN MISMA SESIÓN")
         print("="*60)
         
         archivos_descargados = []
+        dividir = max_filas is not None or max_segundos_busqueda is not None
+        
+        # Las plantillas y el grabador duran toda la sesión de la pestaña (varias rondas)
+        plantillas = self.plantillas
+        if descarga_directa and self.grabador is None:
+            self.grabador = GrabadorPeticiones(await self._obtener_pagina_principal())
+        grabador = self.grabador if descarga_directa else None
         
         for idx, periodo in enumerate(periodos, 1):
             print(f"\n📦 PERÍODO {idx}/{len(periodos)}")
@@ -738,34 +1249,33 @@ class SATNavigator:
                 if idx == 1 and navegar_primera_vez:
                     print("\n🍔 NAVEGACIÓN INICIAL...")
                     
+                    # Cada click espera a que su elemento esté visible y estable
+                    # (el menú terminó de animarse), no hace falta pausar entre ellos
+                    
                     # Click en menú con retry
                     await self.click_elemento_con_retry('btnContraerMenu', max_intentos=3)
-                    await asyncio.sleep(1)
                     
                     # Servicios Tributarios
                     await self.click_elemento_con_retry('Servicios Tributarios', max_intentos=2)
-                    await asyncio.sleep(1.1)
-                    
                     await self.click_elemento_con_retry('Servicios Tributarios', max_intentos=2)
-                    await asyncio.sleep(1.1)
                     
                     # FEL
                     await self.click_elemento_con_retry(
                         'Factura Electrónica en Línea (FEL)', 
                         max_intentos=2
                     )
-                    await asyncio.sleep(1.1)
                     
                     # Consultar DTE
                     await self.click_elemento_con_retry('Consultar DTE', max_intentos=2)
-                    await asyncio.sleep(2)
                     
                     # Cambiar a iframe
                     print("\n🖼️ Cambiando a iframe...")
                     iframe_encontrado = False
                     for intento in range(3):
                         try:
-                            await self.cambiar_a_iframe(identificador='iframeContent')
+                            async with self.medir_espera('iframe'):
+                                if not await self.cambiar_a_iframe(identificador='iframeContent'):
+                                    raise Exception("Iframe no disponible")
                             iframe_encontrado = True
                             print("   ✅ Iframe cargado")
                             break
@@ -773,18 +1283,26 @@ class SATNavigator:
                             if intento < 2:
                                 print(f"   ⚠️ Iframe no encontrado, refresh {intento+1}/3...")
                                 # Volver a página principal y reintentar navegación
-                                await self.page.goto(self.page.url)
-                                await asyncio.sleep(2)
+                                async with self.medir_espera('recarga'):
+                                    await self.page.goto(self.page.url)
                             else:
                                 raise Exception("No se pudo acceder al iframe después de 3 intentos")
                     
-                    await asyncio.sleep(1)
+                    self.en_consulta = True
                 
                 
-                if idx > 1:
+                if idx > 1 or not navegar_primera_vez:
                     print(f"\n🧹 Limpiando formulario del período anterior...")
                     await self.click_elemento_con_retry('Limpiar', max_intentos=2, hacer_refresh=False)
-                    await asyncio.sleep(1)
+                    
+                    # El formulario queda limpio cuando la fecha inicial se vacía
+                    await self.esperar_condicion(
+                        'limpiar',
+                        lambda timeout: self.page.wait_for_function(
+                            "() => { const el = document.querySelector('#mat-input-7'); return !el || !el.value; }",
+                            timeout=timeout
+                        )
+                    )
                 
                 # Actualizar fechas con verificación
                 print(f"\n📝 Actualizando fechas del período {idx}...")
@@ -800,10 +1318,7 @@ class SATNavigator:
                     raise Exception("Campo fecha_inicio no disponible")
                 
                 await self.llenar_campo_texto('mat-input-7', periodo['fecha_inicio'])
-                await asyncio.sleep(0.5)
-                
                 await self.llenar_campo_texto('mat-input-8', periodo['fecha_fin'])
-                await asyncio.sleep(0.5)
                 
                 # Resto del flujo...
                 tipos_a_descargar = []
@@ -815,24 +1330,60 @@ class SATNavigator:
                 for tipo_idx, tipo in enumerate(tipos_a_descargar, 1):
                     print(f"\n📦 Procesando: {tipo} ({tipo_idx}/{len(tipos_a_descargar)})")
                     
+                    clave_plantilla = (tipo, periodo['formato'])
+                    if clave_plantilla in plantillas:
+                        archivo = await self.descargar_directo(plantillas[clave_plantilla], periodo, periodo['formato'])
+                        if archivo:
+                            archivos_descargados.append(await self._guardar_descarga(archivo, periodo, tipo))
+                            continue
+                        # No funcionó: este tipo/formato sigue por la interfaz
+                        print("   ↩️ Volviendo a la descarga por la interfaz")
+                        del plantillas[clave_plantilla]
                     
                     print(f"🔄 Seleccion de tipo: {tipo}...")
                     opciones = await self.interactuar_con_dropdown_material(nombre='tipoOperacion')
                     if opciones:
                         await self.seleccionar_opcion_dropdown_material(opciones, texto=tipo)
-                        await asyncio.sleep(0.5)
                     else:
                         print(f"⚠️ No se pudo cambiar a {tipo}, usando el actual")
 
                     # Buscar con retry
                     print(f"🔍 Buscando {tipo}...")
-                    await self.click_elemento_con_retry('Buscar', max_intentos=2, hacer_refresh=False)
-                    await asyncio.sleep(1)
+                    inicio_busqueda = time.perf_counter()
+                    respondio = await self.esperar_respuesta_de(
+                        'buscar',
+                        lambda: self.click_elemento_con_retry('Buscar', max_intentos=2, hacer_refresh=False)
+                    )
+                    
+                    # La respuesta llegó: esperar a que Angular pinte la tabla (o el paginador vacío)
+                    await self.esperar_condicion(
+                        'tabla',
+                        lambda timeout: self.page.wait_for_function(
+                            JS_TABLA_O_VACIA, arg=[SELECTOR_CHECKBOX_HEADER, SELECTOR_PAGINADOR], timeout=timeout
+                        ),
+                        timeout=ESPERA_RESPUESTA_MS
+                    )
+                    segundos_busqueda = time.perf_counter() - inicio_busqueda
+                    
+                    filas = await self.contar_resultados() if dividir else None
+                    if filas == 0:
+                        # Nada que descargar: partir el rango solo repetiría búsquedas vacías
+                        print(f"ℹ️ {tipo} sin resultados en {periodo['fecha_inicio']} - {periodo['fecha_fin']}")
+                        continue
+                    
+                    if dividir and puede_dividirse(periodo):
+                        motivo = None
+                        if max_filas is not None and filas is not None and filas > max_filas:
+                            motivo = f"{filas:,} filas"
+                        elif max_segundos_busqueda is not None and (not respondio or segundos_busqueda > max_segundos_busqueda):
+                            motivo = f"búsqueda de {segundos_busqueda:.0f}s"
+                        if motivo:
+                            self._dividir(periodo, tipo, motivo)
+                            continue
                     
                     # Seleccionar todos
                     print(f"☑️ Seleccionando todos...")
                     await self.marcar_checkbox_header_tabla(marcar=True)
-                    await asyncio.sleep(1)
                     
                     # Descargar
                     print(f"📥 Descargando {periodo['formato']}...")
@@ -840,46 +1391,24 @@ class SATNavigator:
                     #archivo = await self.descargar_reporte(tipo="xml")
                     
                     if archivo:
-                        timestamp = datetime.now().strftime("%Y%m%d")
-                        fi_str = periodo['fecha_inicio'].replace("/", "")
-                        ff_str = periodo['fecha_fin'].replace("/", "")
-                        
-                        usuario = getattr(self, 'usuario', 'unknown')
-                        extension = archivo.split('.')[-1]
-                        nuevo_nombre = f"{usuario}_{tipo.lower()}_{fi_str}_{ff_str}.{extension}"
+                        if grabador is not None:
+                            # Grabar la petición de esta descarga para los siguientes períodos
+                            peticion = grabador.peticion_de_descarga(self.ultima_descarga_url)
+                            plantilla = crear_plantilla(peticion, periodo) if peticion else None
+                            if plantilla:
+                                plantillas[clave_plantilla] = plantilla
+                                print(f"⚡ Descarga directa lista para {tipo} ({periodo['formato']})")
+                            else:
+                                print(f"ℹ️ La descarga de {tipo} no se puede repetir por HTTP, se sigue por la interfaz")
                         
-                        try:
-                            # Verificar que el archivo existe
-                            if not os.path.exists(archivo):
-                                print(f"⚠️ Archivo no encontrado: {archivo}")
-                                archivos_descargados.append(archivo)
-                                continue
-                            
-                            # Verificar que el nuevo nombre no existe ya
-                            if os.path.exists(nuevo_nombre):
-                                print(f"⚠️ Archivo destino ya existe: {nuevo_nombre}")
-                                # Agregar timestamp para hacerlo único
-                                ts = datetime.now().strftime("%H%M%S")
-                                base, ext = os.path.splitext(nuevo_nombre)
-                                nuevo_nombre = f"{base}_{ts}{ext}"
-                                print(f"   → Renombrando a: {nuevo_nombre}")
-                            
-                            # Renombrar
-                            os.rename(archivo, nuevo_nombre)
-                            archivos_descargados.append(nuevo_nombre)
-                            print(f"✅ Descargado: {nuevo_nombre}")
-                            
-                        except Exception as e:
-                            # Mostrar el error específico
-                            print(f"❌ Error al renombrar archivo: {str(e)}")
-                            print(f"   Archivo original: {archivo}")
-                            print(f"   Nuevo nombre intentado: {nuevo_nombre}")
-                            # Guardar con nombre original si el renombrado falla
-                            archivos_descargados.append(archivo)                    
+                        archivos_descargados.append(await self._guardar_descarga(archivo, periodo, tipo))
+                    elif dividir and puede_dividirse(periodo):
+                        # La descarga no llegó (ej: se agotó el tiempo) y hay filas (o no se
+                        # pudieron contar): probar con rangos más chicos
+                        self._dividir(periodo, tipo, "descarga fallida")
                     
                     print(f"☐ Deseleccionando...")
                     await self.marcar_checkbox_header_tabla(marcar=False)
-                    await asyncio.sleep(1)
                 
                 print(f"\n✅ Período {idx} completado")
                 
@@ -892,8 +1421,8 @@ class SATNavigator:
                 if idx < len(periodos):
                     print("   🔄 Intentando recuperar sesión para siguiente período...")
                     try:
-                        await self.page.reload(wait_until='networkidle')
-                        await asyncio.sleep(3)
+                        async with self.medir_espera('recarga'):
+                            await self.page.reload(wait_until='networkidle')
                     except:
                         print("   ❌ No se pudo recuperar, saltando períodos restantes")
                         break
@@ -902,10 +1431,78 @@ class SATNavigator:
         print(f"✅ PROCESAMIENTO COMPLETADO")
         print(f"📁 Total archivos: {len(archivos_descargados)}")
         print("="*60)
+        self.imprimir_esperas()
         
         return archivos_descargados
 
 
+    def _dividir(self, periodo: dict, tipo: str, motivo: str):
+        """Deja las dos mitades del período pendientes para la siguiente ronda"""
+        mitades = dividir_periodo(periodo, tipo)
+        print(f"✂️ {tipo} {periodo['fecha_inicio']} - {periodo['fecha_fin']} demasiado grande ({motivo}): "
+              f"se divide en {mitades[0]['fecha_inicio']} - {mitades[0]['fecha_fin']} "
+              f"y {mitades[1]['fecha_inicio']} - {mitades[1]['fecha_fin']}")
+        self.periodos_divididos.extend(mitades)
+
+    async def _guardar_descarga(self, archivo: str, periodo: dict, tipo: str) -> str:
+        """Renombra la descarga y la anota (si es parte de un período dividido, para unirla)"""
+        archivo = self._renombrar_descarga(archivo, periodo, tipo)
+        if periodo.get('origen'):
+            inicio = datetime.strptime(periodo['fecha_inicio'], FORMATO_FECHA)
+            fin = datetime.strptime(periodo['fecha_fin'], FORMATO_FECHA)
+            self.partes[archivo] = ((tipo, *periodo['origen']), inicio, fin, periodo.get('formato', 'excel'))
+        else:
+            await self._anotar_descarga(archivo, {
+                'tipo': tipo,
+                'fecha_inicio': periodo['fecha_inicio'],
+                'fecha_fin': periodo['fecha_fin'],
+                'formato': periodo.get('formato', 'excel')
+            })
+        return archivo
+
+    def _renombrar_descarga(self, archivo: str, periodo: dict, tipo: str) -> str:
+        """
+        Renombra la descarga a usuario_tipo_fechainicio_fechafin.ext
+        
+        Returns:
+            Nombre final (el original si no se pudo renombrar)
+        """
+        fi_str = periodo['fecha_inicio'].replace("/", "")
+        ff_str = periodo['fecha_fin'].replace("/", "")
+        
+        usuario = getattr(self, 'usuario', 'unknown')
+        extension = archivo.split('.')[-1]
+        nuevo_nombre = f"{usuario}_{tipo.lower()}_{fi_str}_{ff_str}.{extension}"
+        
+        try:
+            # Verificar que el archivo existe
+            if not os.path.exists(archivo):
+                print(f"⚠️ Archivo no encontrado: {archivo}")
+                return archivo
+            
+            # Verificar que el nuevo nombre no existe ya
+            if os.path.exists(nuevo_nombre):
+                print(f"⚠️ Archivo destino ya existe: {nuevo_nombre}")
+                # Agregar timestamp para hacerlo único
+                ts = datetime.now().strftime("%H%M%S")
+                base, ext = os.path.splitext(nuevo_nombre)
+                nuevo_nombre = f"{base}_{ts}{ext}"
+                print(f"   → Renombrando a: {nuevo_nombre}")
+            
+            # Renombrar
+            os.rename(archivo, nuevo_nombre)
+            print(f"✅ Descargado: {nuevo_nombre}")
+            return nuevo_nombre
+            
+        except Exception as e:
+            # Mostrar el error específico
+            print(f"❌ Error al renombrar archivo: {str(e)}")
+            print(f"   Archivo original: {archivo}")
+            print(f"   Nuevo nombre intentado: {nuevo_nombre}")
+            # Guardar con nombre original si el renombrado falla
+            return archivo
+
+
     async def llenar_campo_texto(self, identificador: str, texto: str):
         """
         Llena un campo de texto (input, textarea) con el valor especificado
@@ -1016,12 +1613,24 @@ class SATNavigator:
         await asyncio.sleep(segundos)
     
 
+    def resumen_recursos(self):
+        """Peticiones bloqueadas y bytes ahorrados en la sesión (None si no hay bloqueo)"""
+        return self.recursos.resumen() if self.recursos else None
+
     async def cerrar(self):
-        """Cierra el navegador y limpia recursos"""
+        """Cierra el navegador y limpia recursos (si es compartido, solo el contexto)"""
+        recursos = self.resumen_recursos()
+        if recursos:
+            print(f"\n🚫 Peticiones bloqueadas: {recursos['peticiones_bloqueadas']} "
+                  f"(~{recursos['bytes_ahorrados_estimados'] / 1024:,.0f} KB ahorrados)")
         print("\n🔄 Cerrando navegador...")
+        if not self.browser_propio:
+            if self.context:
+                await self.context.close()
+            print("✅ Contexto cerrado")
+            return
         if self.browser:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
         print("✅ Navegador cerrado")
-    
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, url_for
 from werkzeug.utils import secure_filename
 import pandas as pd
 import asyncio
@@ -11,20 +11,55 @@ import multiprocessing as mp
 from concurrent.futures import ProcessPoolExecutor
 import traceback
 import calendar
+import itertools
+import base64
+import click
+import uuid
 
 
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, MetaData, Table, Text
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
 
 # IMPORTAR EL NUEVO MÓDULO
-from xml_processor import extraer_productos_de_zip
+from xml_processor import iterar_filas_de_zip, claves_de_zip
+from xml_export import EXPORTADORES, MIMETYPES_EXPORTACION, TAMANO_LOTE_EXPORTACION
+from xml_parquet import sincronizar_parquet
+from job_queue import ColaTrabajos, COMPLETADO, ERROR
+from browser_service import crear_servicio, MAX_USOS_NAVEGADOR
+from download_manifest import ManifiestoDescargas, separar_pendientes
+from range_splitting import MAX_FILAS_POR_DESCARGA, MAX_SEGUNDOS_BUSQUEDA
+from resource_blocking import PoliticaRecursos
+from session_cache import CacheSesiones, cache_disponible, generar_clave, TTL_SESION_MINUTOS
+from xml_storage import (
+    xml_table, inicializar_bd, cargar_masivo, filas_de_dataframe, estadisticas, reconstruir_resumen,
+    miembros_ya_procesados, registrar_miembros,
+    plan_de_consulta, escanea_tabla_completa
+)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['DOWNLOAD_FOLDER'] = 'downloads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 app.config['DATABASE'] = 'sqlite:///sat_data.db'
+app.config['JOBS_DATABASE'] = 'sqlite:///trabajos.db'  # aparte: no espera a las cargas masivas
+app.config['MANIFIESTO_DATABASE'] = 'sqlite:///descargas.db'  # períodos SAT ya descargados (con checksum)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # trabajos en segundo plano a la vez
+app.config['XML_WORKERS'] = int(os.environ.get('XML_WORKERS', 1))  # >1 = parseo de ZIPs en paralelo
+app.config['PARQUET_DIR'] = os.environ.get('PARQUET_DIR')  # si se define, archivo Parquet (requiere pyarrow)
+app.config['SCRAPER_CONCURRENCIA'] = int(os.environ.get('SCRAPER_CONCURRENCIA', 3))  # cuentas SAT descargando a la vez
+app.config['NAVEGADOR_MAX_USOS'] = int(os.environ.get('NAVEGADOR_MAX_USOS', MAX_USOS_NAVEGADOR))  # relanzar Chromium cada N cuentas
+app.config['SESIONES_KEY'] = os.environ.get('SESIONES_KEY')  # clave Fernet: si se define, se reutilizan sesiones SAT (requiere cryptography)
+app.config['SESIONES_FOLDER'] = os.environ.get('SESIONES_FOLDER', 'sesiones')
+app.config['SESION_TTL_MINUTOS'] = int(os.environ.get('SESION_TTL_MINUTOS', TTL_SESION_MINUTOS))
+app.config['BLOQUEAR_RECURSOS'] = os.environ.get('BLOQUEAR_RECURSOS')  # tipos a no cargar (coma); vacío = sin bloqueo
+app.config['BLOQUEAR_HOSTS'] = os.environ.get('BLOQUEAR_HOSTS')  # hosts de terceros extra a bloquear (coma)
+app.config['DESCARGA_DIRECTA'] = os.environ.get('DESCARGA_DIRECTA', '0') == '1'  # repetir descargas por HTTP sin la tabla
+app.config['PESTANAS_POR_CUENTA'] = int(os.environ.get('PESTANAS_POR_CUENTA', 2))  # períodos de una cuenta descargando a la vez
+app.config['MAX_FILAS_POR_DESCARGA'] = int(os.environ.get('MAX_FILAS_POR_DESCARGA', MAX_FILAS_POR_DESCARGA))  # más filas: se divide el rango (0 = nunca)
+app.config['MAX_SEGUNDOS_BUSQUEDA'] = float(os.environ.get('MAX_SEGUNDOS_BUSQUEDA', MAX_SEGUNDOS_BUSQUEDA))  # búsqueda más lenta: se divide el rango (0 = nunca)
+app.config['DESCARGAS_INCREMENTALES'] = os.environ.get('DESCARGAS_INCREMENTALES', '1') == '1'  # no repetir períodos cerrados ya descargados
+app.config['ARCHIVO_DESCARGAS'] = os.environ.get('ARCHIVO_DESCARGAS', 'archivo_descargas')  # donde quedan guardados esos archivos
 
 # Crear carpetas si no existen
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -40,58 +75,40 @@ COLUMNAS_REQUERIDAS = [
 
 
 # --- Configuración de la base de datos ---
-engine = create_engine(app.config['DATABASE'], echo=False)
-metadata = MetaData()
-
-# Definir tabla para almacenar datos de los XML
-xml_table = Table(
-    'xml_data', metadata,
-    Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('Archivo', String(500)),
-    Column('DTE_ID', String(200)),
-    Column('TipoDocumento', String(50)),
-    Column('FechaHoraEmision', String(50)),
-    Column('CodigoMoneda', String(10)),
-    Column('NombreEmisor', String(500)),
-    Column('NombreComercial', String(500)),
-    Column('NIT_Emisor', String(50)),
-    Column('CodigoEstablecimiento', String(50)),
-    Column('DireccionEmisor', Text),
-    Column('NombreReceptor', String(500)),
-    Column('NIT_Receptor', String(50)),
-    Column('DireccionReceptor', Text),
-    Column('NumeroAutorizacion_Serie', String(50)),
-    Column('NumeroAutorizacion_Numero', String(50)),
-    Column('NumeroAutorizacion_Texto', String(200)),
-    Column('FechaHoraCertificacion', String(50)),
-    Column('NIT_Certificador', String(50)),
-    Column('Nombre_Certificador', String(500)),
-    Column('Linea_Numero', String(10)),
-    Column('BienOServicio', String(50)),
-    Column('Descripcion', Text),
-    Column('Cantidad', Float),
-    Column('UnidadMedida', String(50)),
-    Column('PrecioUnitario', Float),
-    Column('Precio', Float),
-    Column('Descuento', Float),
-    Column('Total', Float),
-    Column('Impuestos', Text),
-    Column('fecha_carga', String(50))  # Timestamp de cuándo se cargó
-)
+# SQLite admite un solo escritor: con la cola pueden coincidir dos cargas, así que
+# la segunda espera a que termine la primera en vez de fallar a los 5 s por defecto
+engine = create_engine(app.config['DATABASE'], echo=False, connect_args={'timeout': 600})
 
-# Crear la tabla si no existe
-metadata.create_all(engine)
+# Tablas normalizadas (documentos / líneas / impuestos) + vista de compatibilidad xml_data
+inicializar_bd(engine)
 Session = sessionmaker(bind=engine)
 
+# Ids por lote al leer una página de /consultar-xml
+TAMANO_LOTE_PAGINA = 500
+
 
 # ==========================================
 # NUEVOS ENDPOINTS PARA PROCESAMIENTO XML
 # ==========================================
 
+def respuesta_trabajo(trabajo_id: str):
+    """Respuesta 202 de un endpoint que encoló un trabajo en segundo plano"""
+    return jsonify({
+        'success': True,
+        'job_id': trabajo_id,
+        'estado': 'pendiente',
+        'estado_url': url_for('estado_trabajo', trabajo_id=trabajo_id),
+        'resultado_url': url_for('resultado_trabajo', trabajo_id=trabajo_id)
+    }), 202
+
+
 @app.route('/procesar-xml', methods=['POST'])
 def procesar_xml():
     """
-    Endpoint para subir un ZIP con XMLs, procesarlos y guardarlos en la BD
+    Endpoint para subir un ZIP con XMLs y encolar su carga a la BD
+    
+    Responde de inmediato (202) con el id del trabajo; el avance se consulta en
+    /trabajos/<id> y el resumen de la carga en /trabajos/<id>/resultado.
     """
     if 'archivo' not in request.files:
         return jsonify({'error': 'No se subió ningún archivo'}), 400
@@ -105,76 +122,141 @@ def procesar_xml():
         return jsonify({'error': 'Solo se permiten archivos ZIP'}), 400
     
     try:
-        # Guardar archivo temporalmente
+        # Guardar archivo (con prefijo único: puede haber otro igual esperando en la cola)
         filename = secure_filename(archivo.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
         archivo.save(filepath)
         
-        print(f"\n📦 Procesando ZIP: {filename}")
-        
-        # Extraer datos del ZIP
-        df, errores = extraer_productos_de_zip(filepath)
-        
-        if df.empty:
-            return jsonify({
-                'error': 'No se encontraron datos válidos en el ZIP',
-                'errores': errores
-            }), 400
+        trabajo_id = cola.encolar('procesar-xml', {'filepath': filepath, 'filename': filename})
+        print(f"\n📥 ZIP {filename} encolado (trabajo {trabajo_id})")
+        return respuesta_trabajo(trabajo_id)
         
-        # Agregar timestamp de carga
-        df['fecha_carga'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f'Error al procesar XML: {str(e)}'}), 500
+
+
+def ejecutar_procesar_xml(parametros: dict, progreso) -> dict:
+    """
+    Trabajo 'procesar-xml': procesa el ZIP subido y lo guarda en la BD
+    
+    Args:
+        parametros: {'filepath': ruta del ZIP guardado, 'filename': nombre original}
+        progreso: Callable progreso(porcentaje, mensaje) de la cola de trabajos
+    
+    Returns:
+        El mismo resumen que devolvía /procesar-xml
+    """
+    filepath = parametros['filepath']
+    print(f"\n📦 Procesando ZIP: {parametros['filename']}")
+    
+    try:
+        # Los XML que ya se cargaron en subidas anteriores ni se abren
+        claves = claves_de_zip(filepath)
+        ya_procesados = miembros_ya_procesados(engine, claves)
+        print(f"🗂️ Caché: {len(ya_procesados)} XML ya cargados, {len(claves) - len(ya_procesados)} nuevos")
+        progreso(5, f"{len(claves) - len(ya_procesados)} XML nuevos de {len(claves)}")
         
-        # Guardar en base de datos
-        registros_insertados = guardar_en_bd(df)
+        # Las filas van del parser a la BD por lotes, sin armar un DataFrame
+        errores = []
+        resumen = {}
+        procesados = []
+        fecha_carga = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        filas = resumir_filas(
+            iterar_filas_de_zip(filepath, errores=errores, workers=app.config['XML_WORKERS'], impuestos_json=False,
+                                omitir=ya_procesados, procesados=procesados),
+            fecha_carga,
+            resumen
+        )
         
+        # Guardar en base de datos (y recién entonces marcar los XML como cargados)
+        registros_insertados, registros_omitidos, registros_ignorados = guardar_en_bd(filas)
+        registrar_miembros(engine, procesados, fecha_carga)
+        progreso(90, f"{registros_insertados} registros guardados")
+        registros_parquet = archivar_parquet()
+    finally:
         # Limpiar archivo temporal
         try:
             os.remove(filepath)
         except:
             pass
-        
-        return jsonify({
-            'success': True,
-            'registros_procesados': len(df),
-            'registros_insertados': registros_insertados,
-            'archivos_xml': df['Archivo'].nunique(),
-            'errores': errores if errores else None,
-            'resumen': {
-                'total_items': len(df),
-                'emisores_unicos': df['NIT_Emisor'].nunique(),
-                'receptores_unicos': df['NIT_Receptor'].nunique(),
-                'monto_total': float(df['Total'].sum()),
-                'moneda': df['CodigoMoneda'].mode()[0] if len(df) > 0 else 'N/A'
-            }
-        })
-        
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({'error': f'Error al procesar XML: {str(e)}'}), 500
+    
+    if not resumen['total_items'] and not ya_procesados:
+        return {
+            'error': 'No se encontraron datos válidos en el ZIP',
+            'errores': errores
+        }
+    
+    return {
+        'success': True,
+        'registros_procesados': resumen['total_items'],
+        'registros_insertados': registros_insertados,
+        'registros_omitidos': registros_omitidos,  # ya estaban en la BD
+        'registros_ignorados': registros_ignorados,  # la BD los rechazó por clave repetida (no debería pasar)
+        'registros_parquet': registros_parquet,
+        'archivos_xml': resumen.pop('archivos_xml'),
+        'cache': {
+            'aciertos': len(ya_procesados),  # XML ya cargados antes, no se parsearon
+            'fallos': len(claves) - len(ya_procesados)
+        },
+        'errores': errores if errores else None,
+        'resumen': resumen
+    }
 
 
-def guardar_en_bd(df: pd.DataFrame) -> int:
+def resumir_filas(filas, fecha_carga: str, resumen: dict):
     """
-    Guarda el DataFrame en la base de datos SQLite
+    Deja pasar las filas agregando fecha_carga y va armando el resumen de /procesar-xml
+    
+    El diccionario `resumen` se completa cuando el generador termina de consumirse.
+    """
+    archivos, emisores, receptores = set(), set(), set()
+    monedas = {}
+    total_items = 0
+    monto_total = 0.0
+    
+    for fila in filas:
+        fila['fecha_carga'] = fecha_carga
+        archivos.add(fila['Archivo'])
+        emisores.add(fila['NIT_Emisor'])
+        receptores.add(fila['NIT_Receptor'])
+        monedas[fila['CodigoMoneda']] = monedas.get(fila['CodigoMoneda'], 0) + 1
+        total_items += 1
+        monto_total += fila['Total']
+        yield fila
+    
+    monedas.pop(None, None)
+    resumen.update({
+        'archivos_xml': len(archivos),
+        'total_items': total_items,
+        'emisores_unicos': len(emisores - {None}),
+        'receptores_unicos': len(receptores - {None}),
+        'monto_total': monto_total,
+        # Igual que mode(): la más frecuente y, si empatan, la menor
+        'moneda': min(monedas, key=lambda m: (-monedas[m], m)) if monedas else 'N/A'
+    })
+
+
+def guardar_en_bd(datos):
+    """
+    Guarda los datos en la base de datos SQLite (esquema normalizado)
+    
+    Usa la carga masiva (una transacción, executemany y PRAGMAs de carga). Los DTE
+    que ya estaban guardados se omiten, así que subir el mismo ZIP dos veces no
+    duplica registros.
     
     Args:
-        df: DataFrame con los datos procesados
+        datos: DataFrame o iterable de filas (ej: iterar_filas_de_zip) con fecha_carga
         
     Returns:
-        Número de registros insertados
+        Tupla (registros insertados, omitidos por duplicados, ignorados por la BD)
     """
     try:
-        # Usar to_sql de pandas para insertar
-        registros = df.to_sql(
-            'xml_data',
-            engine,
-            if_exists='append',  # agregar a registros existentes
-            index=False,
-            chunksize=1000  # insertar en lotes para mejor performance
-        )
+        filas = filas_de_dataframe(datos) if isinstance(datos, pd.DataFrame) else datos
+        insertados, omitidos, ignorados = cargar_masivo(engine, filas)
         
-        print(f"✅ {len(df)} registros guardados en la BD")
-        return len(df)
+        print(f"✅ {insertados} registros guardados en la BD ({omitidos} duplicados omitidos)")
+        return insertados, omitidos, ignorados
         
     except Exception as e:
         print(f"❌ Error guardando en BD: {str(e)}")
@@ -182,6 +264,170 @@ def guardar_en_bd(df: pd.DataFrame) -> int:
         raise
 
 
+def archivar_parquet():
+    """
+    Si PARQUET_DIR está configurado, agrega al archivo Parquet lo nuevo de la BD
+    
+    Un error acá no invalida la carga: la BD ya quedó guardada y la próxima
+    sincronización retoma desde el último id archivado.
+    
+    Returns:
+        Registros agregados al archivo (None si el archivo Parquet no está activo)
+    """
+    if not app.config['PARQUET_DIR']:
+        return None
+    try:
+        agregados = sincronizar_parquet(engine, app.config['PARQUET_DIR'])
+        print(f"📦 {agregados} registros agregados al archivo Parquet")
+        return agregados
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el archivo Parquet: {str(e)}")
+        return None
+
+
+def aplicar_filtros_xml(query, args):
+    """
+    Aplica los filtros de /consultar-xml y /exportar-xml a una query sobre xml_table
+    
+    Args:
+        query: Query de SQLAlchemy sobre xml_table
+        args: Parámetros (nit_emisor, nit_receptor, fecha_desde, fecha_hasta)
+        
+    Returns:
+        Query con los filtros aplicados
+    """
+    nit_emisor = args.get('nit_emisor')
+    if nit_emisor:
+        query = query.filter(xml_table.c.NIT_Emisor == nit_emisor)
+    
+    nit_receptor = args.get('nit_receptor')
+    if nit_receptor:
+        query = query.filter(xml_table.c.NIT_Receptor == nit_receptor)
+    
+    fecha_desde = args.get('fecha_desde')
+    if fecha_desde:
+        query = query.filter(xml_table.c.FechaHoraEmision >= fecha_desde)
+    
+    fecha_hasta = args.get('fecha_hasta')
+    if fecha_hasta:
+        query = query.filter(xml_table.c.FechaHoraEmision <= fecha_hasta)
+    
+    return query
+
+
+def _codificar_cursor(ultimo_id: int) -> str:
+    """Token opaco para next_cursor a partir del último id de la página"""
+    return base64.urlsafe_b64encode(str(ultimo_id).encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    """
+    Devuelve el id desde el que sigue la página (None si no hay cursor)
+    
+    Raises:
+        ValueError: Si el cursor no es un token válido
+    """
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor}")
+
+
+def query_ids_pagina(session, args, despues_de, limit: int):
+    """
+    Query de los ids de una página de /consultar-xml (filtros + keyset sobre id)
+    
+    Trae limit + 1 ids: si llega el extra, hay otra página.
+    """
+    query = aplicar_filtros_xml(session.query(xml_table.c.id), args)
+    if despues_de is not None:
+        query = query.filter(xml_table.c.id > despues_de)
+    return query.order_by(xml_table.c.id).limit(limit + 1)
+
+
+def _lotes_de_pagina(statement_ids, tamano_lote: int):
+    """
+    Lee una página en dos pasos: primero solo los ids (ordenados, sin armar el
+    JSON de Impuestos de la vista) y luego las filas completas de cada lote de ids
+    
+    Así, con filtros, el ORDER BY id solo ordena enteros y las filas completas se
+    arman únicamente para la página pedida.
+    
+    Returns:
+        Tupla (nombres de columnas, generador de listas de filas en orden de id)
+    """
+    conn = engine.connect()
+    try:
+        ids_result = conn.execution_options(stream_results=True).execute(statement_ids)
+    except Exception:
+        conn.close()
+        raise
+    
+    def lotes():
+        try:
+            for porcion in ids_result.partitions(tamano_lote):
+                ids = [fila[0] for fila in porcion]
+                yield conn.execute(
+                    select(xml_table).where(xml_table.c.id.in_(ids)).order_by(xml_table.c.id)
+                ).all()
+        finally:
+            ids_result.close()
+            conn.close()
+    
+    return [columna.name for columna in xml_table.columns], lotes()
+
+
+def _paginar(columnas, lotes, limit: int, pagina: dict):
+    """
+    Deja pasar hasta `limit` filas (como diccionarios, por lotes) y completa `pagina`
+    
+    La consulta trae limit + 1 filas: si llega la fila extra hay otra página y
+    next_cursor apunta al último id entregado. `pagina` queda completo cuando el
+    generador termina de consumirse.
+    """
+    total = 0
+    ultimo_id = None
+    hay_mas = False
+    
+    for lote in lotes:
+        if total + len(lote) > limit:
+            lote = lote[:limit - total]
+            hay_mas = True
+        if lote:
+            total += len(lote)
+            ultimo_id = lote[-1].id
+            yield [dict(zip(columnas, fila)) for fila in lote]
+        if hay_mas:
+            break
+    
+    pagina.update({
+        'total_registros': total,
+        'next_cursor': _codificar_cursor(ultimo_id) if hay_mas else None
+    })
+
+
+def _pagina_json(lotes, pagina: dict):
+    """Arma la respuesta JSON de /consultar-xml por partes (un pedazo por lote)"""
+    yield '{"success": true, "registros": ['
+    separador = ''
+    for lote in lotes:
+        yield separador + ', '.join(app.json.dumps(fila) for fila in lote)
+        separador = ', '
+    yield '], "total_registros": %d, "next_cursor": %s}' % (
+        pagina['total_registros'], app.json.dumps(pagina['next_cursor'])
+    )
+
+
+def _pagina_ndjson(lotes, pagina: dict):
+    """Un registro por línea; si hay otra página, la última línea es {"next_cursor": ...}"""
+    for lote in lotes:
+        yield ''.join(app.json.dumps(fila) + '\n' for fila in lote)
+    if pagina['next_cursor']:
+        yield app.json.dumps({'next_cursor': pagina['next_cursor']}) + '\n'
+
+
 @app.route('/consultar-xml', methods=['GET'])
 def consultar_xml():
     """
@@ -191,107 +437,109 @@ def consultar_xml():
     - nit_receptor: filtrar por NIT receptor
     - fecha_desde: filtrar desde fecha (YYYY-MM-DD)
     - fecha_hasta: filtrar hasta fecha (YYYY-MM-DD)
-    - limit: número máximo de registros (default 100)
+    - limit: número máximo de registros por página (default 100)
+    - cursor: next_cursor de la página anterior (paginación por id)
+    - formato: json (default) o ndjson
+    
+    Los registros salen ordenados por id y la respuesta se manda por partes,
+    así que páginas grandes no se arman completas en memoria.
     """
+    formato = request.args.get('formato', 'json').lower()
+    if formato not in ('json', 'ndjson'):
+        return jsonify({'error': f'Formato no soportado: {formato}. Use json o ndjson'}), 400
+    
     try:
-        session = Session()
-        
-        # Construir query base
-        query = session.query(xml_table)
-        
-        # Aplicar filtros opcionales
-        nit_emisor = request.args.get('nit_emisor')
-        if nit_emisor:
-            query = query.filter(xml_table.c.NIT_Emisor == nit_emisor)
-        
-        nit_receptor = request.args.get('nit_receptor')
-        if nit_receptor:
-            query = query.filter(xml_table.c.NIT_Receptor == nit_receptor)
-        
-        fecha_desde = request.args.get('fecha_desde')
-        if fecha_desde:
-            query = query.filter(xml_table.c.FechaHoraEmision >= fecha_desde)
-        
-        fecha_hasta = request.args.get('fecha_hasta')
-        if fecha_hasta:
-            query = query.filter(xml_table.c.FechaHoraEmision <= fecha_hasta)
-        
-        # Límite de registros
         limit = int(request.args.get('limit', 100))
-        query = query.limit(limit)
-        
-        # Ejecutar query
-        resultados = query.all()
+        if limit < 1:
+            raise ValueError(f"limit debe ser mayor que 0: {limit}")
+        despues_de = _decodificar_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        session = Session()
         
-        # Convertir a lista de diccionarios
-        data = []
-        for row in resultados:
-            data.append(dict(row._mapping))
+        query = query_ids_pagina(session, request.args, despues_de, limit)
+        columnas, lotes = _lotes_de_pagina(query.statement, TAMANO_LOTE_PAGINA)
         
         session.close()
         
-        return jsonify({
-            'success': True,
-            'total_registros': len(data),
-            'registros': data
-        })
+        pagina = {}
+        filas = _paginar(columnas, lotes, limit, pagina)
+        
+        if formato == 'ndjson':
+            return Response(_pagina_ndjson(filas, pagina), mimetype='application/x-ndjson')
+        return Response(_pagina_json(filas, pagina), mimetype='application/json')
         
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': f'Error al consultar: {str(e)}'}), 500
 
 
+def _lotes_de_consulta(statement, tamano_lote: int):
+    """
+    Ejecuta la consulta y la va leyendo por lotes desde el cursor
+    
+    La conexión queda abierta mientras se consume el generador y se cierra al
+    terminar (o si el cliente corta la descarga y el generador se cierra).
+    
+    Returns:
+        Tupla (nombres de columnas, generador de listas de filas)
+    """
+    conn = engine.connect()
+    try:
+        result = conn.execution_options(stream_results=True).execute(statement)
+    except Exception:
+        conn.close()
+        raise
+    
+    def lotes():
+        try:
+            yield from result.partitions(tamano_lote)
+        finally:
+            result.close()
+            conn.close()
+    
+    return list(result.keys()), lotes()
+
+
 @app.route('/exportar-xml', methods=['GET'])
 def exportar_xml():
     """
-    Exporta los datos de la BD a Excel
-    Acepta los mismos filtros que /consultar-xml
+    Exporta los datos de la BD a Excel, CSV o NDJSON
+    Acepta los mismos filtros que /consultar-xml, más:
+    - formato: xlsx (default), csv o ndjson
+    
+    Las filas se leen por lotes y la respuesta se manda por partes (chunked),
+    así la memoria no crece con la cantidad de registros exportados.
     """
+    formato = request.args.get('formato', 'xlsx').lower()
+    if formato not in EXPORTADORES:
+        return jsonify({'error': f'Formato no soportado: {formato}. Use xlsx, csv o ndjson'}), 400
+    
     try:
         session = Session()
         
         # Construir query (misma lógica que consultar_xml)
-        query = session.query(xml_table)
-        
-        nit_emisor = request.args.get('nit_emisor')
-        if nit_emisor:
-            query = query.filter(xml_table.c.NIT_Emisor == nit_emisor)
-        
-        nit_receptor = request.args.get('nit_receptor')
-        if nit_receptor:
-            query = query.filter(xml_table.c.NIT_Receptor == nit_receptor)
-        
-        fecha_desde = request.args.get('fecha_desde')
-        if fecha_desde:
-            query = query.filter(xml_table.c.FechaHoraEmision >= fecha_desde)
-        
-        fecha_hasta = request.args.get('fecha_hasta')
-        if fecha_hasta:
-            query = query.filter(xml_table.c.FechaHoraEmision <= fecha_hasta)
-        
-        # Ejecutar query
-        resultados = query.all()
-        
-        # Convertir a DataFrame
-        data = [dict(row._mapping) for row in resultados]
-        df = pd.DataFrame(data)
+        query = aplicar_filtros_xml(session.query(xml_table), request.args)
+        columnas, lotes = _lotes_de_consulta(query.statement, TAMANO_LOTE_EXPORTACION)
         
         session.close()
         
-        if df.empty:
+        # Leer el primer lote antes de responder para poder devolver 404 si no hay datos
+        primer_lote = next(lotes, None)
+        if primer_lote is None:
             return jsonify({'error': 'No hay datos para exportar'}), 404
         
-        # Guardar Excel
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        excel_filename = f"datos_xml_{timestamp}.xlsx"
-        excel_path = os.path.join(app.config['DOWNLOAD_FOLDER'], excel_filename)
+        nombre_archivo = f"datos_xml_{timestamp}.{formato}"
         
-        df.to_excel(excel_path, index=False, engine='openpyxl')
+        contenido = EXPORTADORES[formato](columnas, itertools.chain([primer_lote], lotes))
         
-        return send_file(
-            excel_path,
-            as_attachment=True,
-            download_name=excel_filename
+        return Response(
+            contenido,
+            mimetype=MIMETYPES_EXPORTACION[formato],
+            headers={'Content-Disposition': f'attachment; filename={nombre_archivo}'}
         )
         
     except Exception as e:
@@ -305,40 +553,17 @@ def estadisticas_xml():
     Devuelve estadísticas generales de los datos en la BD
     """
     try:
-        session = Session()
+        with engine.connect() as conn:
+            stats = estadisticas(conn)
         
-        # Contar registros totales
-        total_registros = session.query(xml_table).count()
-        
-        # Obtener datos para estadísticas
-        query = session.query(xml_table)
-        df = pd.read_sql(query.statement, engine)
-        
-        session.close()
-        
-        if df.empty:
+        if stats is None:
             return jsonify({
                 'success': True,
                 'total_registros': 0,
                 'mensaje': 'No hay datos en la base de datos'
             })
         
-        stats = {
-            'success': True,
-            'total_registros': total_registros,
-            'total_facturas': df['DTE_ID'].nunique(),
-            'emisores_unicos': int(df['NIT_Emisor'].nunique()),
-            'receptores_unicos': int(df['NIT_Receptor'].nunique()),
-            'monto_total': float(df['Total'].sum()),
-            'monto_promedio': float(df['Total'].mean()),
-            'cantidad_total_items': float(df['Cantidad'].sum()),
-            'rango_fechas': {
-                'desde': df['FechaHoraEmision'].min(),
-                'hasta': df['FechaHoraEmision'].max()
-            },
-            'top_emisores': df.groupby('NombreComercial')['Total'].sum().nlargest(5).to_dict(),
-            'top_productos': df.groupby('Descripcion')['Cantidad'].sum().nlargest(10).to_dict()
-        }
+        stats = {'success': True, **stats}
         
         return jsonify(stats)
         
@@ -350,6 +575,87 @@ def estadisticas_xml():
 
 
 
+@app.cli.command('verificar-indices')
+def verificar_indices():
+    """
+    Revisa con EXPLAIN QUERY PLAN que los filtros de /consultar-xml y /exportar-xml usen índices
+    
+    Uso: flask --app server verificar-indices
+    """
+    combinaciones = [
+        {'nit_emisor': '1'},
+        {'nit_receptor': '1'},
+        {'fecha_desde': '2025-01-01', 'fecha_hasta': '2025-01-31'},
+        {'nit_emisor': '1', 'fecha_desde': '2025-01-01', 'fecha_hasta': '2025-01-31'},
+        {'nit_receptor': '1', 'fecha_desde': '2025-01-01', 'fecha_hasta': '2025-01-31'},
+        {'nit_emisor': '1', 'nit_receptor': '1'},
+    ]
+    
+    session = Session()
+    fallidas = 0
+    try:
+        for filtros in combinaciones:
+            consultas = {
+                'exportar': aplicar_filtros_xml(session.query(xml_table), filtros),
+                'página': query_ids_pagina(session, filtros, despues_de=1, limit=100),
+            }
+            for nombre, query in consultas.items():
+                plan = plan_de_consulta(session.connection(), query.limit(100).statement)
+                ok = not escanea_tabla_completa(plan)
+                fallidas += 0 if ok else 1
+                
+                print(f"{'✅' if ok else '❌'} {', '.join(filtros)} ({nombre})")
+                for paso in plan:
+                    print(f"      {paso}")
+    finally:
+        session.close()
+    
+    if fallidas:
+        raise SystemExit(f"❌ {fallidas} consulta(s) recorren la tabla completa")
+    print("✅ Todas las consultas filtradas usan índices")
+
+
+@app.cli.command('sincronizar-parquet')
+@click.argument('carpeta', required=False)
+def sincronizar_parquet_cli(carpeta):
+    """
+    Agrega al archivo Parquet las filas de la BD que todavía no están (o lo crea)
+    
+    Uso: flask --app server sincronizar-parquet [CARPETA]  (default: PARQUET_DIR)
+    """
+    carpeta = carpeta or app.config['PARQUET_DIR']
+    if not carpeta:
+        raise SystemExit("❌ Indique la carpeta o configure PARQUET_DIR")
+    
+    agregados = sincronizar_parquet(engine, carpeta)
+    print(f"✅ {agregados} registros agregados al archivo Parquet en {carpeta}")
+
+
+@app.cli.command('reconstruir-estadisticas')
+def reconstruir_estadisticas():
+    """
+    Recalcula desde cero el resumen que usa /estadisticas-xml
+    
+    Uso: flask --app server reconstruir-estadisticas
+    """
+    with engine.begin() as conn:
+        reconstruir_resumen(conn)
+        stats = estadisticas(conn)
+    
+    total = stats['total_registros'] if stats else 0
+    print(f"✅ Resumen de estadísticas reconstruido ({total} registros)")
+
+
+@app.cli.command('generar-clave-sesiones')
+def generar_clave_sesiones():
+    """
+    Imprime una clave nueva para SESIONES_KEY (cache cifrado de sesiones SAT)
+    
+    Uso: flask --app server generar-clave-sesiones
+    """
+    print(generar_clave())
+
+
 def calcular_fechas_del_mes(mes, año):
     """
     Calcula el primer y último día de un mes dado, considerando años bisiestos
@@ -516,7 +822,6 @@ async def procesar_empresa_async(datos):
         # Login
         await nav.ir_a_login()
         await nav.hacer_login(datos['usuario'], datos['password'])
-        await asyncio.sleep(2)
         
         # Procesar fechas
         fecha_inicio = procesar_fechas(datos['fecha_inicio'])
@@ -611,9 +916,44 @@ def agrupar_por_usuario(empresas_data):
     return resultado
 
 
-async def procesar_empresa_optimizado_async(datos):
-    """Procesa una empresa con múltiples períodos en una sola sesión"""
+def _clave_periodo(usuario: str, tipo: str, periodo: dict) -> str:
+    """Clave del punto de control de un período descargado"""
+    return f"periodo:{usuario}:{tipo}:{periodo['fecha_inicio']}:{periodo['fecha_fin']}:{periodo.get('formato', 'excel')}"
+
+
+def _archivo_de_punto(avance, clave: str):
+    """Archivo guardado en el punto de control si sigue en disco (None si no)"""
+    punto = avance.get(clave)
+    if punto and os.path.exists(punto['archivo']):
+        return punto['archivo']
+    return None
+
+
+def _resultado_guardado(avance, usuario: str):
+    """Resultado de un usuario terminado antes de que se cortara el trabajo (si sus archivos siguen en disco)"""
+    resultado = avance.get(f"usuario:{usuario}") if avance else None
+    if resultado and all(os.path.exists(archivo) for archivo in resultado['archivos']):
+        return resultado
+    return None
+
+
+async def procesar_empresa_optimizado_async(datos, servicio=None, forzar=False, avance=None):
+    """
+    Procesa una empresa con múltiples períodos en una sola sesión
+    
+    Con el manifiesto de descargas activo, los períodos cerrados que ya se
+    descargaron no se vuelven a pedir (se entregan los archivos guardados); si
+    no queda ninguno pendiente, ni siquiera se abre el navegador.
+    
+    Args:
+        datos: Grupo de agrupar_por_usuario ({usuario, password, periodos})
+        servicio: ServicioNavegador opcional (la sesión usa un contexto de su Chromium)
+        forzar: Si True, descarga todos los períodos aunque ya estén en el manifiesto
+        avance: AvanceTrabajo opcional: cada período descargado queda como punto de
+            control y, si el trabajo se reanuda, no se vuelve a descargar
+    """
     nav = None
+    sesion = None
     try:
         usuario = datos['usuario']
         periodos = datos['periodos']
@@ -623,19 +963,6 @@ async def procesar_empresa_optimizado_async(datos):
         print(f"📅 Períodos a procesar: {len(periodos)}")
         print(f"{'='*60}")
         
-        # Crear navegador
-        nav = SATNavigator()
-        await nav.iniciar(headless=True)
-        
-        # Login UNA SOLA VEZ
-        await nav.ir_a_login()
-        await nav.hacer_login(usuario, datos['password'])
-        await asyncio.sleep(2)
-        
-
-        if not await nav.verificar_pagina_cargada():
-            raise Exception("La página no cargó correctamente después del login")        
-        
         # Convertir fechas a formato SAT
         periodos_procesados = []
         for periodo in periodos:
@@ -649,17 +976,100 @@ async def procesar_empresa_optimizado_async(datos):
                 'formato': periodo.get('formato', 'excel')
             })
         
-        # Descargar TODOS los períodos en una sola sesión
-        archivos = await nav.descargar_multiples_periodos(
-            periodos=periodos_procesados,
-            navegar_primera_vez=True
+        # Períodos que este mismo trabajo ya descargó antes de cortarse
+        archivos_previos = []
+        if avance:
+            periodos_procesados, archivos_previos = separar_pendientes(
+                periodos_procesados,
+                lambda tipo, periodo: _archivo_de_punto(avance, _clave_periodo(usuario, tipo, periodo))
+            )
+        
+        # Períodos cerrados que ya se descargaron en otra corrida (los verifica por checksum)
+        if manifiesto and not forzar:
+            periodos_procesados, archivados = await asyncio.to_thread(
+                manifiesto.pendientes, usuario, periodos_procesados
+            )
+            archivos_previos += archivados
+        if archivos_previos:
+            print(f"📚 {len(archivos_previos)} archivo(s) ya descargado(s), {len(periodos_procesados)} período(s) pendiente(s)")
+        
+        if not periodos_procesados:
+            print(f"✅ {usuario}: nada nuevo que descargar")
+            return {
+                'usuario': usuario,
+                'status': 'success',
+                'archivos': archivos_previos,
+                'archivos_previos': len(archivos_previos),
+                'periodos_procesados': len(periodos),
+                'sesion_reutilizada': False,
+                'mensaje': f"✅ {len(periodos)} período(s) ya descargado(s) - {len(archivos_previos)} archivo(s)"
+            }
+        
+        # Sesión guardada de una corrida anterior (si el cache está activo)
+        sesion = sesiones.cargar(usuario, datos['password']) if sesiones else None
+        
+        # Cada período completo se anota apenas termina (manifiesto y punto de control)
+        archivos_finales = {}  # nombre de la descarga -> ruta final (en el archivo del manifiesto)
+        
+        def anotar(archivo, descarga):
+            final = manifiesto.registrar(usuario, archivo, **descarga) if manifiesto else archivo
+            archivos_finales[archivo] = final
+            if avance:
+                avance.guardar(_clave_periodo(usuario, descarga['tipo'], descarga), {'archivo': final})
+        
+        async def al_descargar(archivo, descarga):
+            # SHA-256, mover el archivo y escribir en SQLite: fuera del loop del navegador compartido
+            await asyncio.to_thread(anotar, archivo, descarga)
+        
+        # Crear navegador
+        nav = SATNavigator()
+        nav.al_descargar = al_descargar
+        await nav.iniciar(
+            headless=True,
+            servicio=servicio,
+            storage_state=sesion['storage_state'] if sesion else None,
+            politica_recursos=politica_recursos
+        )
+        
+        sesion_reutilizada = bool(sesion) and await nav.restaurar_sesion(sesion['url'], usuario)
+        
+        if not sesion_reutilizada:
+            if sesion:
+                sesiones.invalidar(usuario, datos['password'])
+                await nav.context.clear_cookies()
+            
+            # Login UNA SOLA VEZ
+            await nav.ir_a_login()
+            login_ok = await nav.hacer_login(usuario, datos['password'])
+        
+
+        if not await nav.verificar_pagina_cargada():
+            raise Exception("La página no cargó correctamente después del login")        
+        
+        if sesiones and not sesion_reutilizada and login_ok:
+            sesiones.guardar(usuario, datos['password'], **await nav.estado_sesion())
+        
+        # Descargar TODOS los períodos en una sola sesión (varias pestañas, un solo login)
+        archivos = await nav.descargar_periodos_en_paralelo(
+            periodos_procesados,
+            max_pestanas=app.config['PESTANAS_POR_CUENTA'],
+            descarga_directa=app.config['DESCARGA_DIRECTA'],
+            max_filas=app.config['MAX_FILAS_POR_DESCARGA'] or None,
+            max_segundos_busqueda=app.config['MAX_SEGUNDOS_BUSQUEDA'] or None
         )
         
+        archivos = archivos_previos + [archivos_finales.get(archivo, archivo) for archivo in archivos]
+        
         resultado = {
             'usuario': usuario,
             'status': 'success',
             'archivos': archivos or [],
+            'archivos_previos': len(archivos_previos),
             'periodos_procesados': len(periodos),
+            'sesion_reutilizada': sesion_reutilizada,
+            'esperas': nav.resumen_esperas(),
+            'recursos': nav.resumen_recursos(),
+            'periodos_incompletos': nav.incompletos,
             'mensaje': f"✅ {len(periodos)} período(s) procesado(s) - {len(archivos or [])} archivo(s)"
         }
         
@@ -671,6 +1081,10 @@ async def procesar_empresa_optimizado_async(datos):
         print(f"❌ {usuario}: {error_msg}")
         traceback.print_exc()
         
+        # Si falló con una sesión reutilizada, la próxima vez se hace login completo
+        if sesiones and sesion:
+            sesiones.invalidar(datos['usuario'], datos['password'])
+        
         return {
             'usuario': datos['usuario'],
             'status': 'error',
@@ -687,18 +1101,77 @@ async def procesar_empresa_optimizado_async(datos):
                 pass
 
 
-async def procesar_secuencial_optimizado(empresas_agrupadas):
-    """Procesa empresas agrupadas una por una"""
+async def procesar_secuencial_optimizado(empresas_agrupadas, progreso=None):
+    """
+    Procesa empresas agrupadas una por una
+    
+    Args:
+        empresas_agrupadas: Resultado de agrupar_por_usuario
+        progreso: Callable opcional progreso(porcentaje, mensaje) (cola de trabajos)
+    """
     resultados = []
     
     for idx, datos in enumerate(empresas_agrupadas, 1):
         print(f"\n📊 Procesando usuario {idx}/{len(empresas_agrupadas)}")
         resultado = await procesar_empresa_optimizado_async(datos)
         resultados.append(resultado)
+        if progreso:
+            progreso(100 * idx // (len(empresas_agrupadas) + 1), f"{idx}/{len(empresas_agrupadas)} usuarios procesados")
     
     return resultados
 
 
+async def procesar_concurrente(empresas_agrupadas, servicio, max_concurrencia: int = 3, progreso=None, forzar=False,
+                               avance=None):
+    """
+    Procesa empresas agrupadas a la vez con el Chromium compartido del servicio
+    
+    Cada usuario navega en su propio BrowserContext (cookies y sesión aisladas)
+    y un semáforo limita cuántos están abiertos al mismo tiempo. Abrir un
+    contexto es mucho más barato que un proceso con su propio navegador
+    (lo que hacía procesar_paralelo). Debe correr en el loop del servicio
+    (servicio.ejecutar).
+    
+    Args:
+        empresas_agrupadas: Resultado de agrupar_por_usuario
+        servicio: ServicioNavegador que entrega los contextos
+        max_concurrencia: Usuarios procesándose a la vez
+        progreso: Callable opcional progreso(porcentaje, mensaje) (cola de trabajos)
+        forzar: Ver procesar_empresa_optimizado_async
+        avance: AvanceTrabajo opcional: cada usuario terminado queda como punto de
+            control y, si el trabajo se reanuda, no se vuelve a procesar
+    
+    Returns:
+        Resultados por usuario, en el mismo orden que empresas_agrupadas
+    """
+    total = len(empresas_agrupadas)
+    max_concurrencia = max(1, max_concurrencia)
+    semaforo = asyncio.Semaphore(max_concurrencia)
+    terminados = 0
+    
+    print(f"\n🚀 MODO CONCURRENTE: {total} usuario(s), hasta {max_concurrencia} a la vez")
+    
+    async def procesar_uno(datos):
+        nonlocal terminados
+        resultado = _resultado_guardado(avance, datos['usuario'])
+        if resultado:
+            print(f"⏭️ {datos['usuario']}: ya procesado antes del corte")
+        else:
+            async with semaforo:
+                resultado = await procesar_empresa_optimizado_async(
+                    datos, servicio=servicio, forzar=forzar, avance=avance
+                )
+            if avance and resultado['status'] == 'success':
+                avance.guardar(f"usuario:{datos['usuario']}", resultado)
+        terminados += 1
+        print(f"\n📊 Usuarios terminados: {terminados}/{total}")
+        if progreso:
+            progreso(100 * terminados // (total + 1), f"{terminados}/{total} usuarios procesados")
+        return resultado
+    
+    return await asyncio.gather(*(procesar_uno(datos) for datos in empresas_agrupadas))
+
+
 def procesar_paralelo(empresas_data, max_workers=3):
     """Procesa empresas en paralelo usando multiprocessing"""
     print(f"\n🚀 MODO PARALELO: {max_workers} procesos simultáneos")
@@ -794,13 +1267,20 @@ def descargar_plantilla():
 
 @app.route('/procesar', methods=['POST'])
 def procesar():
-    """Endpoint principal para procesar el archivo"""
+    """
+    Endpoint principal: valida el Excel y encola la descarga de reportes
+    
+    El Excel se valida en el momento (los errores se devuelven con 400); la
+    descarga corre en segundo plano y se sigue con /trabajos/<id>.
+    
+    Con forzar=1 en el formulario se vuelven a descargar también los períodos
+    que ya están en el manifiesto de descargas.
+    """
     
     if 'archivo' not in request.files:
         return jsonify({'error': 'No se subió ningún archivo'}), 400
     
     archivo = request.files['archivo']
-    modo = request.form.get('modo', 'secuencial')
     
     if archivo.filename == '':
         return jsonify({'error': 'Nombre de archivo vacío'}), 400
@@ -810,7 +1290,7 @@ def procesar():
     
     try:
         filename = secure_filename(archivo.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
         archivo.save(filepath)
         
         valido, resultado = validar_excel(filepath)
@@ -818,57 +1298,148 @@ def procesar():
         if not valido:
             return jsonify({'error': resultado}), 400
         
-        df = resultado
-        empresas_data = df.to_dict('records')
-        
-        # AGRUPAR POR USUARIO/PASSWORD
-        empresas_agrupadas = agrupar_por_usuario(empresas_data)
-        
-        print(f"\n📋 Registros originales: {len(empresas_data)}")
-        print(f"👥 Usuarios únicos: {len(empresas_agrupadas)}")
-        
-        # Mostrar agrupación
-        for grupo in empresas_agrupadas:
-            print(f"   • {grupo['usuario']}: {len(grupo['periodos'])} período(s)")
-        
-        # Procesar (solo secuencial por ahora, paralelo con sesiones es complejo)
-        resultados = asyncio.run(procesar_secuencial_optimizado(empresas_agrupadas))
-        
-        # Comprimir archivos
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"sat_reportes_{timestamp}.zip"
-        zip_path = os.path.join(app.config['DOWNLOAD_FOLDER'], zip_filename)
-        
-        archivos_totales = []
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for resultado in resultados:
-                if resultado['archivos']:
-                    for archivo in resultado['archivos']:
-                        if os.path.exists(archivo):
-                            zipf.write(archivo, os.path.basename(archivo))
-                            archivos_totales.append(archivo)
-        
-        # Limpiar
-        for archivo in archivos_totales:
-            try:
-                os.remove(archivo)
-            except:
-                pass
-        
-        return jsonify({
-            'success': True,
-            'resultados': resultados,
-            'zip_file': zip_filename,
-            'total_usuarios': len(empresas_agrupadas),
-            'total_periodos': sum(r.get('periodos_procesados', 0) for r in resultados),
-            'exitosos': sum(1 for r in resultados if r['status'] == 'success'),
-            'errores': sum(1 for r in resultados if r['status'] == 'error')
+        # Solo la ruta del Excel va a la cola: las contraseñas no se guardan en la BD
+        trabajo_id = cola.encolar('procesar', {
+            'filepath': filepath,
+            'forzar': request.form.get('forzar') == '1'
         })
+        print(f"\n📥 Descarga encolada (trabajo {trabajo_id})")
+        return respuesta_trabajo(trabajo_id)
         
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': f'Error al procesar: {str(e)}'}), 500
 
+
+def ejecutar_procesar(parametros: dict, progreso, avance=None) -> dict:
+    """
+    Trabajo 'procesar': descarga los reportes de todas las empresas del Excel
+    
+    Es reanudable: los usuarios y períodos terminados quedan como puntos de
+    control, y al reanudarlo (POST /trabajos/<id>/reanudar) se sigue desde ahí
+    con los archivos que ya se habían descargado.
+    
+    Args:
+        parametros: {'filepath': ruta del Excel ya validado, 'forzar': ignorar el manifiesto}
+        progreso: Callable progreso(porcentaje, mensaje) de la cola de trabajos
+        avance: AvanceTrabajo con los puntos de control del trabajo
+    
+    Returns:
+        El mismo resultado que devolvía /procesar (resultados por usuario y ZIP)
+    """
+    valido, resultado = validar_excel(parametros['filepath'])
+    if not valido:
+        raise ValueError(resultado)
+    
+    df = resultado
+    empresas_data = df.to_dict('records')
+    
+    # AGRUPAR POR USUARIO/PASSWORD
+    empresas_agrupadas = agrupar_por_usuario(empresas_data)
+    
+    print(f"\n📋 Registros originales: {len(empresas_data)}")
+    print(f"👥 Usuarios únicos: {len(empresas_agrupadas)}")
+    
+    # Mostrar agrupación
+    for grupo in empresas_agrupadas:
+        print(f"   • {grupo['usuario']}: {len(grupo['periodos'])} período(s)")
+    
+    # Procesar varias cuentas a la vez (un contexto por usuario en el mismo navegador)
+    resultados = navegador.ejecutar(procesar_concurrente(
+        empresas_agrupadas, navegador, app.config['SCRAPER_CONCURRENCIA'], progreso,
+        forzar=parametros.get('forzar', False), avance=avance
+    ))
+    
+    # Comprimir archivos
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"sat_reportes_{timestamp}.zip"
+    zip_path = os.path.join(app.config['DOWNLOAD_FOLDER'], zip_filename)
+    
+    archivos_totales = []
+    with zipfile.ZipFile(zip_path, 'w') as zipf:
+        for resultado in resultados:
+            if resultado['archivos']:
+                for archivo in resultado['archivos']:
+                    if os.path.exists(archivo):
+                        zipf.write(archivo, os.path.basename(archivo))
+                        archivos_totales.append(archivo)
+    
+    # Limpiar (los archivos del manifiesto se conservan para las próximas corridas)
+    for archivo in archivos_totales:
+        if manifiesto and manifiesto.archivado(archivo):
+            continue
+        try:
+            os.remove(archivo)
+        except:
+            pass
+    
+    return {
+        'success': True,
+        'resultados': resultados,
+        'zip_file': zip_filename,
+        'total_usuarios': len(empresas_agrupadas),
+        'total_periodos': sum(r.get('periodos_procesados', 0) for r in resultados),
+        'exitosos': sum(1 for r in resultados if r['status'] == 'success'),
+        'errores': sum(1 for r in resultados if r['status'] == 'error')
+    }
+
+
+@app.route('/trabajos/<trabajo_id>')
+def estado_trabajo(trabajo_id):
+    """Estado y progreso de un trabajo encolado por /procesar o /procesar-xml"""
+    estado = cola.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(estado)
+
+
+@app.route('/trabajos/<trabajo_id>/resultado')
+def resultado_trabajo(trabajo_id):
+    """
+    Resultado de un trabajo terminado (la misma respuesta que antes daba el endpoint)
+    
+    Mientras el trabajo no termina devuelve 202 con su estado.
+    """
+    estado = cola.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    if estado['estado'] == ERROR:
+        return jsonify({'error': estado['error'], 'job_id': trabajo_id}), 500
+    
+    if estado['estado'] != COMPLETADO:
+        return jsonify(estado), 202
+    
+    resultado = cola.resultado(trabajo_id)
+    return jsonify(resultado), 400 if 'error' in resultado else 200
+
+
+@app.route('/trabajos/<trabajo_id>/reanudar', methods=['POST'])
+def reanudar_trabajo(trabajo_id):
+    """
+    Reanuda un /procesar que terminó con error o se cortó (ej: reinicio del servidor)
+    
+    Los usuarios y períodos que ya se habían descargado no se repiten.
+    """
+    estado = cola.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    if not cola.reanudar(trabajo_id):
+        return jsonify({
+            'error': f"El trabajo no se puede reanudar (tipo: {estado['tipo']}, estado: {estado['estado']})",
+            'job_id': trabajo_id
+        }), 409
+    
+    return respuesta_trabajo(trabajo_id)
+
+
+@app.route('/navegador/estado')
+def estado_navegador():
+    """Salud del Chromium compartido (conectado, usos, contextos abiertos, reinicios)"""
+    return jsonify(navegador.estado())
+
+
 @app.route('/descargar/<filename>')
 def descargar(filename):
     """Descarga el archivo ZIP con los reportes"""
@@ -880,6 +1451,40 @@ def descargar(filename):
     return send_file(filepath, as_attachment=True)
 
 
+# --- Chromium persistente para /procesar (se lanza con la primera descarga) ---
+navegador = crear_servicio(headless=True, max_usos=app.config['NAVEGADOR_MAX_USOS'])
+
+
+# --- Recursos que no se cargan al navegar el portal (imágenes, fuentes, analítica) ---
+politica_recursos = None
+if app.config['BLOQUEAR_RECURSOS'] != '':
+    politica_recursos = PoliticaRecursos.desde_texto(app.config['BLOQUEAR_RECURSOS'], app.config['BLOQUEAR_HOSTS'])
+
+
+# --- Sesiones SAT cifradas para saltar el login en corridas repetidas ---
+sesiones = None
+if app.config['SESIONES_KEY']:
+    if cache_disponible():
+        sesiones = CacheSesiones(
+            app.config['SESIONES_FOLDER'], app.config['SESIONES_KEY'], app.config['SESION_TTL_MINUTOS']
+        )
+    else:
+        print("⚠️ SESIONES_KEY definida pero falta cryptography: cache de sesiones desactivado")
+
+
+# --- Manifiesto de descargas: períodos cerrados que no se vuelven a descargar ---
+manifiesto = None
+if app.config['DESCARGAS_INCREMENTALES']:
+    manifiesto = ManifiestoDescargas(create_engine(app.config['MANIFIESTO_DATABASE']), app.config['ARCHIVO_DESCARGAS'])
+
+
+# --- Cola de trabajos en segundo plano (/procesar y /procesar-xml) ---
+cola = ColaTrabajos(create_engine(app.config['JOBS_DATABASE']), max_workers=app.config['JOB_WORKERS'])
+cola.registrar('procesar-xml', ejecutar_procesar_xml)
+cola.registrar('procesar', ejecutar_procesar, reanudable=True)
+cola.reanudar_pendientes()
+
+
 # if __name__ == '__main__':
 #     # Para desarrollo
 #     app.run(host='0.0.0.0', port=5000, debug=True)
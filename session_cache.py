@@ -0,0 +1,111 @@
+"""
+session_cache.py
+Sesiones del portal SAT guardadas cifradas (storage_state de Playwright) para
+no repetir el login de una cuenta que entró hace poco.
+
+Requiere cryptography y una clave Fernet en SESIONES_KEY. Sin alguna de las
+dos el cache queda desactivado y cada corrida hace el login completo.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # cryptography es opcional
+    Fernet = InvalidToken = None
+
+# Minutos que se reutiliza una sesión guardada (el portal las vence por inactividad)
+TTL_SESION_MINUTOS = 30
+
+# Etiqueta para derivar, de la clave Fernet, la clave aparte de los nombres de archivo
+ETIQUETA_CLAVE_NOMBRES = b'sat-sesiones/nombres-de-archivo/v1'
+
+
+def cache_disponible() -> bool:
+    """Indica si cryptography está instalado"""
+    return Fernet is not None
+
+
+def generar_clave() -> str:
+    """Clave nueva para SESIONES_KEY"""
+    if Fernet is None:
+        raise RuntimeError("El cache de sesiones necesita cryptography (pip install cryptography)")
+    return Fernet.generate_key().decode('ascii')
+
+
+class CacheSesiones:
+    """
+    Un archivo cifrado por usuario con el storage_state (cookies y localStorage)
+    y la URL a la que llegó después del login.
+
+    El nombre del archivo es un HMAC del usuario y la contraseña con una clave
+    derivada de la clave Fernet (no la misma): el NIT no queda a la vista en el
+    disco y una fila del Excel con la contraseña equivocada no puede aprovechar
+    la sesión de otra corrida.
+    """
+
+    def __init__(self, carpeta: str, clave: str, ttl_minutos: int = TTL_SESION_MINUTOS):
+        """
+        Args:
+            carpeta: Carpeta donde se guardan las sesiones
+            clave: Clave Fernet (ver generar_clave)
+            ttl_minutos: Minutos que una sesión se considera vigente
+        """
+        if Fernet is None:
+            raise RuntimeError("El cache de sesiones necesita cryptography (pip install cryptography)")
+        self.carpeta = carpeta
+        self.clave = clave.encode('ascii') if isinstance(clave, str) else clave
+        self.fernet = Fernet(self.clave)
+        self.clave_nombres = hmac.new(self.clave, ETIQUETA_CLAVE_NOMBRES, hashlib.sha256).digest()
+        self.ttl = ttl_minutos * 60
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _ruta(self, usuario: str, password: str) -> str:
+        cuenta = f"{usuario}\0{password}".encode('utf-8')
+        nombre = hmac.new(self.clave_nombres, cuenta, hashlib.sha256).hexdigest()
+        return os.path.join(self.carpeta, f"{nombre}.sesion")
+
+    def cargar(self, usuario: str, password: str):
+        """
+        Sesión guardada del usuario si sigue vigente
+
+        Returns:
+            Diccionario {'storage_state', 'url'} o None (no hay, venció o no se pudo descifrar)
+        """
+        ruta = self._ruta(usuario, password)
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with open(ruta, 'rb') as f:
+                datos = json.loads(self.fernet.decrypt(f.read(), ttl=self.ttl))
+        except InvalidToken:
+            # Vencida o cifrada con otra clave
+            self.invalidar(usuario, password)
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Sesión guardada ilegible para {usuario}: {str(e)}")
+            self.invalidar(usuario, password)
+            return None
+        return datos
+
+    def guardar(self, usuario: str, password: str, storage_state: dict, url: str):
+        """Guarda (cifrada) la sesión del usuario"""
+        contenido = self.fernet.encrypt(
+            json.dumps({'storage_state': storage_state, 'url': url, 'guardado': time.time()}).encode('utf-8')
+        )
+        ruta = self._ruta(usuario, password)
+        fd = os.open(ruta + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(ruta + '.tmp', ruta)
+
+    def invalidar(self, usuario: str, password: str):
+        """Borra la sesión guardada del usuario (ej: el portal la rechazó)"""
+        try:
+            os.remove(self._ruta(usuario, password))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,75 @@
+"""Pruebas de las plantillas de descarga directa (direct_download)"""
+
+import io
+import json
+import zipfile
+from types import SimpleNamespace
+
+from direct_download import aplicar_periodo, archivo_del_periodo, crear_plantilla
+
+ENERO = {'fecha_inicio': '01/01/2024', 'fecha_fin': '01/31/2024'}
+FEBRERO = {'fecha_inicio': '02/01/2024', 'fecha_fin': '02/29/2024'}
+
+
+def peticion(url='https://fel.sat.gob.gt/api/reporte', cuerpo=None, metodo='POST'):
+    return SimpleNamespace(
+        url=url,
+        method=metodo,
+        post_data=cuerpo,
+        headers={'content-type': 'application/json', 'cookie': 'sesion=1', 'x-token': 'abc'},
+    )
+
+
+def test_plantilla_con_fechas_en_el_cuerpo():
+    cuerpo = json.dumps({'fechaInicio': '2024-01-01', 'fechaFin': '2024-01-31', 'tipo': 'E'})
+    plantilla = crear_plantilla(peticion(cuerpo=cuerpo), ENERO)
+
+    assert plantilla['headers'] == {'content-type': 'application/json', 'x-token': 'abc'}
+    url, nuevo = aplicar_periodo(plantilla, FEBRERO)
+    assert url == 'https://fel.sat.gob.gt/api/reporte'
+    assert json.loads(nuevo) == {'fechaInicio': '2024-02-01', 'fechaFin': '2024-02-29', 'tipo': 'E'}
+
+
+def test_plantilla_con_fechas_en_la_url():
+    url = 'https://fel.sat.gob.gt/api/reporte?inicio=01%2F01%2F2024&fin=01%2F31%2F2024'
+    plantilla = crear_plantilla(peticion(url=url, metodo='GET'), ENERO)
+
+    assert aplicar_periodo(plantilla, FEBRERO) == (
+        'https://fel.sat.gob.gt/api/reporte?inicio=02%2F01%2F2024&fin=02%2F29%2F2024', None
+    )
+
+
+def test_sin_fechas_o_mismo_dia_no_hay_plantilla():
+    assert crear_plantilla(peticion(cuerpo='{"tipo": "E"}'), ENERO) is None
+    dia = {'fecha_inicio': '01/05/2024', 'fecha_fin': '01/05/2024'}
+    assert crear_plantilla(peticion(cuerpo='{"desde": "01/05/2024", "hasta": "01/05/2024"}'), dia) is None
+
+
+def test_peticion_con_filas_seleccionadas_no_hay_plantilla():
+    con_uuids = json.dumps({
+        'fechaInicio': '2024-01-01', 'fechaFin': '2024-01-31',
+        'autorizaciones': ['3F2504E0-4F89-11D3-9A0C-0305E82C3301'],
+    })
+    con_ids = json.dumps({'fechaInicio': '2024-01-01', 'fechaFin': '2024-01-31', 'ids': list(range(50))})
+    grande = json.dumps({'fechaInicio': '2024-01-01', 'fechaFin': '2024-01-31', 'relleno': 'x' * 20000})
+
+    assert crear_plantilla(peticion(cuerpo=con_uuids), ENERO) is None
+    assert crear_plantilla(peticion(cuerpo=con_ids), ENERO) is None
+    assert crear_plantilla(peticion(cuerpo=grande), ENERO) is None
+
+
+def test_archivo_del_periodo():
+    csv = b'Fecha,Total\n2024-02-10,100\n'
+    assert archivo_del_periodo(csv, 'reporte.csv', FEBRERO)
+    assert not archivo_del_periodo(csv, 'reporte.csv', ENERO)
+    assert not archivo_del_periodo(b'', 'reporte_20240201.csv', FEBRERO)
+    assert archivo_del_periodo(b'sin fechas', 'reporte_20240201_20240229.csv', FEBRERO)
+
+
+def test_archivo_del_periodo_en_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('dte.xml', '<DTE FechaHoraEmision="2024-01-15T10:00:00"/>')
+
+    assert archivo_del_periodo(buffer.getvalue(), None, ENERO)
+    assert not archivo_del_periodo(buffer.getvalue(), None, FEBRERO)
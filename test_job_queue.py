@@ -0,0 +1,114 @@
+"""Pruebas de la cola de trabajos: trabajos cortados por un reinicio y su reanudación"""
+
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from job_queue import (
+    COMPLETADO, EN_PROCESO, ERROR, ERROR_INTERRUMPIDO, PENDIENTE,
+    AvanceTrabajo, ColaTrabajos, instancias_table, trabajos_table,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'trabajos.db'}")
+
+
+@pytest.fixture
+def colas():
+    creadas = []
+    yield creadas
+    for cola in creadas:
+        cola.detener()
+
+
+def procesar_cuentas(vistas):
+    """Trabajo reanudable: procesa cuentas y se salta las que ya tienen punto de control"""
+    def ejecutar(parametros, progreso, avance):
+        for cuenta in parametros['cuentas']:
+            if cuenta in avance:
+                continue
+            vistas.append(cuenta)
+            avance.guardar(cuenta, {'ok': True})
+        return {'cuentas': len(parametros['cuentas'])}
+    return ejecutar
+
+
+def nueva_cola(engine, colas, vistas):
+    cola = ColaTrabajos(engine, max_workers=1, latido_segundos=60)
+    cola.registrar('procesar', procesar_cuentas(vistas), reanudable=True)
+    colas.append(cola)
+    return cola
+
+
+def trabajo_en_curso(engine, cola, cuentas, terminadas):
+    """Deja un trabajo tomado por `cola` con algunas cuentas ya terminadas (como si se cortara ahí)"""
+    with engine.begin() as conn:
+        conn.execute(trabajos_table.insert().values(
+            id='t1', tipo='procesar', estado=PENDIENTE, parametros=json.dumps({'cuentas': cuentas})
+        ))
+    assert cola._tomar('t1') is not None
+    avance = AvanceTrabajo(engine, 't1')
+    for cuenta in terminadas:
+        avance.guardar(cuenta, {'ok': True})
+
+
+def estado(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(trabajos_table.c.estado, trabajos_table.c.error)).one()
+
+
+def caida(engine, cola):
+    """La instancia deja de latir sin avisar (proceso muerto)"""
+    cola.detenida.set()
+    with engine.begin() as conn:
+        conn.execute(instancias_table.update().where(instancias_table.c.id == cola.instancia).values(latido=0))
+
+
+def test_reinicio_marca_error_y_se_reanuda(engine, colas):
+    vistas = []
+    anterior = nueva_cola(engine, colas, vistas)
+    trabajo_en_curso(engine, anterior, ['a', 'b', 'c'], terminadas=['a'])
+    caida(engine, anterior)
+
+    # Arranca el servidor otra vez (mismo host y PID, como en Docker)
+    cola = nueva_cola(engine, colas, vistas)
+    cola.reanudar_pendientes()
+    assert estado(engine) == (ERROR, ERROR_INTERRUMPIDO)
+
+    assert cola.reanudar('t1')
+    cola.executor.shutdown(wait=True)
+
+    assert estado(engine) == (COMPLETADO, None)
+    assert vistas == ['b', 'c']
+    assert AvanceTrabajo(engine, 't1').puntos == {}
+
+
+def test_instancia_que_late_conserva_sus_trabajos(engine, colas):
+    otra = nueva_cola(engine, colas, [])
+    trabajo_en_curso(engine, otra, ['a'], terminadas=[])
+
+    cola = nueva_cola(engine, colas, [])
+    cola.reanudar_pendientes()
+    assert estado(engine) == (EN_PROCESO, None)
+    assert not cola.reanudar('t1')
+
+    # Reinicio rápido: al arrancar la instancia anterior todavía parecía viva;
+    # cuando vence su latido, la revisión periódica marca el trabajo
+    caida(engine, otra)
+    assert cola._marcar_interrumpidos() == 1
+    assert estado(engine) == (ERROR, ERROR_INTERRUMPIDO)
+
+
+def test_trabajos_de_antes_del_latido_se_marcan(engine, colas):
+    # Filas viejas con host:pid en `proceso`
+    cola = nueva_cola(engine, colas, [])
+    with engine.begin() as conn:
+        conn.execute(trabajos_table.insert().values(
+            id='t1', tipo='procesar', estado=EN_PROCESO, parametros='{}', proceso='servidor:1'
+        ))
+
+    cola.reanudar_pendientes()
+    assert estado(engine) == (ERROR, ERROR_INTERRUMPIDO)
@@ -0,0 +1,100 @@
+"""Pruebas de la división de rangos y la unión de partes (range_splitting)"""
+
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+
+from range_splitting import contar_filas, dividir_periodo, huecos, puede_dividirse, unir_partes
+
+
+def test_contar_filas():
+    assert contar_filas("1 – 10 of 1,234") == 1234
+    assert contar_filas("1 - 10 de 1.234") == 1234
+    assert contar_filas("0 of 0") == 0
+    assert contar_filas("Cargando...") is None
+    assert contar_filas(None) is None
+
+
+def test_dividir_periodo():
+    periodo = {'fecha_inicio': '01/01/2024', 'fecha_fin': '01/31/2024', 'tipo_operacion': 'Ambos', 'formato': 'excel'}
+
+    primera, segunda = dividir_periodo(periodo, 'Emitidos')
+
+    assert (primera['fecha_inicio'], primera['fecha_fin']) == ('01/01/2024', '01/16/2024')
+    assert (segunda['fecha_inicio'], segunda['fecha_fin']) == ('01/17/2024', '01/31/2024')
+    assert primera['tipo_operacion'] == segunda['tipo_operacion'] == 'Emitidos'
+    assert primera['formato'] == 'excel'
+
+    # Las mitades de una mitad siguen apuntando al rango original
+    cuarto, _ = dividir_periodo(primera, 'Emitidos')
+    assert cuarto['origen'] == primera['origen'] == ('01/01/2024', '01/31/2024')
+
+
+def test_un_dia_no_se_divide():
+    assert not puede_dividirse({'fecha_inicio': '01/05/2024', 'fecha_fin': '01/05/2024'})
+    assert puede_dividirse({'fecha_inicio': '01/05/2024', 'fecha_fin': '01/06/2024'})
+
+
+def reporte_sat(ruta, titulo, filas):
+    """Excel con el formato del SAT: filas de título arriba de los encabezados"""
+    datos = [[titulo, None, None], [None, None, None], ['Fecha', 'Autorizacion', 'Total']] + filas
+    pd.DataFrame(datos).to_excel(ruta, index=False, header=False)
+    return str(ruta)
+
+
+def test_unir_excel_con_titulos(tmp_path):
+    partes = [
+        reporte_sat(tmp_path / 'a.xlsx', 'Reporte del 01/01/2024 al 01/16/2024', [['2024-01-02', 'A', 10], ['2024-01-03', 'B', 20]]),
+        reporte_sat(tmp_path / 'b.xlsx', 'Reporte del 01/17/2024 al 01/31/2024', [['2024-01-20', 'C', 30]]),
+    ]
+
+    unidos = unir_partes(partes, str(tmp_path / 'enero'))
+
+    assert unidos == [str(tmp_path / 'enero.xlsx')]
+    tabla = pd.read_excel(unidos[0], header=None)
+    assert tabla.iloc[2].tolist() == ['Fecha', 'Autorizacion', 'Total']
+    assert tabla.iloc[3:, 1].tolist() == ['A', 'B', 'C']
+    assert tabla.iloc[3:, 2].tolist() == [10, 20, 30]
+    assert not any((tmp_path / p).exists() for p in ('a.xlsx', 'b.xlsx'))
+
+
+def test_excel_con_otras_columnas_no_se_une(tmp_path):
+    partes = [
+        reporte_sat(tmp_path / 'a.xlsx', 'Reporte', [['2024-01-02', 'A', 10]]),
+        str(tmp_path / 'b.xlsx'),
+    ]
+    pd.DataFrame([['Fecha', 'Serie', 'Monto'], ['2024-01-20', 'C', 30]]).to_excel(partes[1], index=False, header=False)
+
+    assert unir_partes(partes, str(tmp_path / 'enero')) == partes
+    assert not (tmp_path / 'enero.xlsx').exists()
+
+
+def test_unir_zips_sin_repetir_miembros(tmp_path):
+    partes = []
+    for nombre, miembros in (('a.zip', ['1.xml', '2.xml']), ('b.zip', ['2.xml', '3.xml'])):
+        ruta = str(tmp_path / nombre)
+        with zipfile.ZipFile(ruta, 'w') as zf:
+            for miembro in miembros:
+                zf.writestr(miembro, f'<DTE id="{miembro}"/>')
+        partes.append(ruta)
+
+    unidos = unir_partes(partes, str(tmp_path / 'enero'))
+
+    with zipfile.ZipFile(unidos[0]) as zf:
+        assert sorted(zf.namelist()) == ['1.xml', '2.xml', '3.xml']
+
+
+def test_formato_que_no_se_une(tmp_path):
+    partes = [str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')]
+    assert unir_partes(partes, str(tmp_path / 'enero')) == partes
+
+
+def dia(numero):
+    return datetime(2024, 1, numero)
+
+
+def test_huecos():
+    assert huecos(dia(1), dia(31), [(dia(1), dia(16)), (dia(17), dia(31))]) == []
+    assert huecos(dia(1), dia(31), [(dia(1), dia(8)), (dia(17), dia(31))]) == [(dia(9), dia(16))]
+    assert huecos(dia(1), dia(31), [(dia(17), dia(24))]) == [(dia(1), dia(16)), (dia(25), dia(31))]
@@ -0,0 +1,54 @@
+"""Pruebas del cache cifrado de sesiones SAT (session_cache.CacheSesiones)"""
+
+import hashlib
+import hmac
+import os
+
+import pytest
+
+import session_cache
+from session_cache import CacheSesiones, generar_clave
+
+pytestmark = pytest.mark.skipif(not session_cache.cache_disponible(), reason="requiere cryptography")
+
+ESTADO = {'cookies': [{'name': 'JSESSIONID', 'value': 'abc'}], 'origins': []}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheSesiones(str(tmp_path), generar_clave(), ttl_minutos=30)
+
+
+def test_guardar_y_cargar(cache):
+    cache.guardar('1234567', 'secreto', ESTADO, 'https://farm3.sat.gob.gt/menu')
+
+    datos = cache.cargar('1234567', 'secreto')
+
+    assert datos['storage_state'] == ESTADO
+    assert datos['url'] == 'https://farm3.sat.gob.gt/menu'
+
+
+def test_otra_contrasena_u_otra_clave_no_cargan(cache, tmp_path):
+    cache.guardar('1234567', 'secreto', ESTADO, 'https://farm3.sat.gob.gt/menu')
+
+    assert cache.cargar('1234567', 'otra') is None
+    assert CacheSesiones(str(tmp_path), generar_clave()).cargar('1234567', 'secreto') is None
+
+
+def test_sesion_vencida(cache, monkeypatch):
+    cache.guardar('1234567', 'secreto', ESTADO, 'https://farm3.sat.gob.gt/menu')
+    ahora = session_cache.time.time()
+    monkeypatch.setattr('cryptography.fernet.time.time', lambda: ahora + 31 * 60)
+
+    assert cache.cargar('1234567', 'secreto') is None
+    assert os.listdir(cache.carpeta) == []
+
+
+def test_nombre_de_archivo_sin_nit_ni_clave_fernet(cache):
+    cache.guardar('1234567', 'secreto', ESTADO, 'https://farm3.sat.gob.gt/menu')
+    (nombre,) = os.listdir(cache.carpeta)
+
+    assert '1234567' not in nombre
+    con_clave_fernet = hmac.new(cache.clave, b'1234567\0secreto', hashlib.sha256).hexdigest()
+    assert nombre != f"{con_clave_fernet}.sesion"
+    assert oct(os.stat(os.path.join(cache.carpeta, nombre)).st_mode & 0o777) == '0o600'
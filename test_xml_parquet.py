@@ -0,0 +1,53 @@
+"""Pruebas del archivo Parquet particionado (xml_parquet)"""
+
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+from xml_processor import COLUMNAS_DTE
+from xml_storage import cargar_masivo, inicializar_bd
+
+pytest.importorskip('pyarrow')
+
+from xml_parquet import leer_parquet, sincronizar_parquet  # noqa: E402
+
+
+def fila(numero, nit):
+    valores = dict.fromkeys(COLUMNAS_DTE, '')
+    valores.update(
+        Archivo=f'{numero}.xml',
+        DTE_ID='DatosCertificados',
+        NumeroAutorizacion_Texto=f'UUID-{numero}',
+        NIT_Emisor=nit,
+        FechaHoraEmision='2025-01-15T10:00:00',
+        Linea_Numero='1',
+        Cantidad=1.0,
+        PrecioUnitario=10.0,
+        Precio=10.0,
+        Descuento=0.0,
+        Total=10.0,
+        Impuestos=[],
+        fecha_carga='2025-01-01 00:00:00',
+    )
+    return valores
+
+
+def test_lote_con_mas_de_1024_emisores(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'datos.db'}")
+    inicializar_bd(engine)
+    cargar_masivo(engine, [fila(n, f'{n:08d}') for n in range(1500)])
+    base_dir = str(tmp_path / 'parquet')
+
+    assert sincronizar_parquet(engine, base_dir) == 1500
+
+    # Un archivo por partición
+    carpetas = os.listdir(os.path.join(base_dir, 'mes_emision=2025-01'))
+    assert len(carpetas) == 1500
+    assert all(len(os.listdir(os.path.join(base_dir, 'mes_emision=2025-01', c))) == 1 for c in carpetas)
+
+    datos = leer_parquet(base_dir, ['NIT_Emisor', 'Total'], {'NIT_Emisor': '00001234'})
+    assert datos['Total'].tolist() == [10.0]
+
+    # Sincronizar de nuevo no agrega nada
+    assert sincronizar_parquet(engine, base_dir) == 0
@@ -0,0 +1,50 @@
+"""Pruebas del parseo paralelo de ZIPs (xml_processor.iterar_lotes_paralelo)"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import xml_processor
+from benchmarks.dte_sintetico import generar_zip
+
+
+class PoolContado(ThreadPoolExecutor):
+    """Pool de hilos que registra cuántas porciones hay en vuelo a la vez"""
+
+    en_vuelo = 0
+    maximo = 0
+    candado = threading.Lock()
+
+    def submit(self, *args, **kwargs):
+        with PoolContado.candado:
+            PoolContado.en_vuelo += 1
+            PoolContado.maximo = max(PoolContado.maximo, PoolContado.en_vuelo)
+        futuro = super().submit(*args, **kwargs)
+        resultado_original = futuro.result
+
+        def result(*a, **k):
+            with PoolContado.candado:
+                PoolContado.en_vuelo -= 1
+            return resultado_original(*a, **k)
+
+        futuro.result = result
+        return futuro
+
+
+def test_paralelo_igual_al_secuencial(tmp_path):
+    zip_path = generar_zip(str(tmp_path / "dte.zip"), documentos=60)
+
+    secuencial = [tuple(f.values()) for f in xml_processor.iterar_filas_de_zip(zip_path, impuestos_json=True)]
+    paralelo = [tuple(f.values()) for f in xml_processor.iterar_filas_de_zip(zip_path, workers=2)]
+
+    assert paralelo == secuencial
+
+
+def test_paralelo_con_ventana_acotada(tmp_path, monkeypatch):
+    zip_path = generar_zip(str(tmp_path / "dte.zip"), documentos=50)
+    monkeypatch.setattr(xml_processor, "ProcessPoolExecutor", PoolContado)
+    PoolContado.en_vuelo = PoolContado.maximo = 0
+
+    lotes = list(xml_processor.iterar_lotes_paralelo(zip_path, workers=2, miembros_por_tarea=2))
+
+    assert len(lotes) == 25
+    assert PoolContado.maximo <= 2 * xml_processor.TAREAS_POR_WORKER
@@ -0,0 +1,105 @@
+"""Pruebas de la carga idempotente (claves únicas de documentos y líneas) de xml_storage"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from xml_processor import COLUMNAS_DTE
+from xml_storage import cargar_masivo, inicializar_bd, vista_metadata, xml_table
+
+
+def fila(archivo, autorizacion, linea, total=10.0):
+    valores = dict.fromkeys(COLUMNAS_DTE, '')
+    valores.update(
+        Archivo=archivo,
+        DTE_ID='DatosCertificados',
+        NumeroAutorizacion_Texto=autorizacion,
+        NombreComercial='EMISOR',
+        Linea_Numero=linea,
+        Descripcion='PRODUCTO',
+        Cantidad=1.0,
+        Total=total,
+        Impuestos=[{'nombre': 'IVA', 'monto_gravable': '8.93', 'monto_impuesto': '1.07'}],
+        fecha_carga='2025-01-01 00:00:00',
+    )
+    return valores
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'datos.db'}")
+    inicializar_bd(engine)
+    return engine
+
+
+def contar(engine, tabla):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar()
+
+
+def test_misma_carga_dos_veces_no_duplica(engine):
+    filas = [fila('a.xml', 'UUID-A', '1'), fila('a.xml', 'UUID-A', '2'), fila('b.xml', 'UUID-B', '1')]
+
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (3, 0, 0)
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (0, 3, 0)
+    assert contar(engine, 'dte_documentos') == 2
+    assert contar(engine, 'dte_lineas') == 3
+    assert contar(engine, 'dte_impuestos') == 3
+
+
+def test_documentos_sin_autorizacion_no_se_juntan(engine):
+    filas = [fila('a.xml', '', '1'), fila('a.xml', '', '2'), fila('b.xml', '', '1'), fila('c.xml', None, '1')]
+
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (4, 0, 0)
+    assert contar(engine, 'dte_documentos') == 3
+    assert contar(engine, 'dte_lineas') == 4
+
+    # Se reconocen por el XML de origen al volver a subirlos
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (0, 4, 0)
+    assert contar(engine, 'dte_documentos') == 3
+
+
+def test_lineas_sin_numero_se_conservan(engine):
+    filas = [fila('a.xml', 'UUID-A', ''), fila('a.xml', 'UUID-A', '', total=5.0), fila('a.xml', 'UUID-A', None)]
+
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (3, 0, 0)
+    assert contar(engine, 'dte_lineas') == 3
+
+    # El documento ya estaba: sus líneas sin número se omiten en vez de duplicarse
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (0, 3, 0)
+    assert contar(engine, 'dte_lineas') == 3
+
+
+def test_documento_repartido_entre_lotes(engine):
+    filas = [fila('a.xml', '', '')] * 5
+
+    assert cargar_masivo(engine, [dict(f) for f in filas], tamano_lote=2) == (5, 0, 0)
+    assert contar(engine, 'dte_documentos') == 1
+    assert contar(engine, 'dte_lineas') == 5
+
+
+def test_migracion_de_tabla_ancha_sin_autorizacion(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'vieja.db'}")
+    vista_metadata.create_all(engine)  # la antigua tabla ancha xml_data
+    filas = [fila(archivo, '', linea) for archivo in ('a.xml', 'b.xml') for linea in ('1', '2', '')]
+    with engine.begin() as conn:
+        # Las versiones anteriores guardaban las claves vacías como ''
+        conn.execute(xml_table.insert(), [
+            {k: None if v == '' and k not in ('NumeroAutorizacion_Texto', 'Linea_Numero') else v
+             for k, v in dict(f, Impuestos='[]').items()}
+            for f in filas
+        ])
+
+    inicializar_bd(engine)
+
+    assert contar(engine, 'dte_documentos') == 2
+    assert contar(engine, 'dte_lineas') == 6
+    with engine.connect() as conn:
+        assert conn.execute(text(
+            "SELECT COUNT(*) FROM dte_documentos WHERE NumeroAutorizacion_Texto IS NULL"
+        )).scalar() == 2
+        assert conn.execute(text("SELECT COUNT(*) FROM dte_lineas WHERE Linea_Numero IS NULL")).scalar() == 2
+        por_archivo = dict(conn.execute(text("SELECT Archivo, COUNT(*) FROM xml_data GROUP BY Archivo")).all())
+    assert por_archivo == {'a.xml': 3, 'b.xml': 3}
+
+    # Volver a subir los mismos XML no los duplica
+    assert cargar_masivo(engine, [dict(f) for f in filas]) == (0, 6, 0)
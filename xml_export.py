@@ -0,0 +1,117 @@
+"""
+xml_export.py
+Escritores de exportación (XLSX, CSV, NDJSON) que trabajan por lotes de filas,
+para que /exportar-xml pueda ir mandando los bytes sin cargar toda la consulta
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+# Filas que se leen de la BD por cada lote
+TAMANO_LOTE_EXPORTACION = 2000
+
+# Tamaño de cada pedazo al mandar el XLSX ya armado
+TAMANO_PARTE = 64 * 1024
+
+# formato (también es la extensión del archivo) -> mimetype
+MIMETYPES_EXPORTACION = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def exportar_csv(columnas, lotes):
+    """
+    Genera el CSV por partes (una por lote).
+
+    Empieza con BOM para que Excel reconozca el UTF-8 (tildes, ñ).
+
+    Args:
+        columnas: Nombres de las columnas (encabezado)
+        lotes: Iterable de listas de filas (tuplas en el orden de `columnas`)
+
+    Yields:
+        Bytes del CSV
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow(columnas)
+    for lote in lotes:
+        writer.writerows(lote)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def exportar_ndjson(columnas, lotes):
+    """
+    Genera un objeto JSON por línea (una línea por fila).
+
+    Args:
+        columnas: Nombres de las columnas (claves de cada objeto)
+        lotes: Iterable de listas de filas (tuplas en el orden de `columnas`)
+
+    Yields:
+        Bytes del NDJSON, una parte por lote
+    """
+    columnas = list(columnas)
+    for lote in lotes:
+        yield ''.join(
+            json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + '\n' for fila in lote
+        ).encode('utf-8')
+
+
+def exportar_xlsx(columnas, lotes, tamano_parte: int = TAMANO_PARTE):
+    """
+    Genera el XLSX con el modo write_only de openpyxl y lo manda por partes.
+
+    En write_only las filas se van escribiendo a disco, así que la memoria no
+    crece con la cantidad de filas. Un XLSX es un ZIP que solo se puede cerrar
+    al final, por eso se arma en un archivo temporal y después se lee en partes.
+
+    Args:
+        columnas: Nombres de las columnas (encabezado)
+        lotes: Iterable de listas de filas (tuplas en el orden de `columnas`)
+        tamano_parte: Bytes por parte al leer el archivo terminado
+
+    Yields:
+        Bytes del XLSX
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append(list(columnas))
+    for lote in lotes:
+        for fila in lote:
+            ws.append(list(fila))
+
+    fd, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb.save(ruta)
+        with open(ruta, 'rb') as f:
+            while True:
+                parte = f.read(tamano_parte)
+                if not parte:
+                    break
+                yield parte
+    finally:
+        os.remove(ruta)
+
+
+# formato -> generador de bytes (columnas, lotes)
+EXPORTADORES = {
+    'xlsx': exportar_xlsx,
+    'csv': exportar_csv,
+    'ndjson': exportar_ndjson,
+}
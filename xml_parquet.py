@@ -0,0 +1,179 @@
+"""
+xml_parquet.py
+Archivo Parquet (opcional) con los mismos registros que la vista xml_data,
+particionado por mes de emisión y NIT_Emisor para análisis fuera de SQLite.
+
+Requiere pyarrow. Si no está instalado, el resto de la aplicación funciona
+igual y solo estas funciones fallan con un mensaje claro.
+"""
+
+import json
+import os
+
+from sqlalchemy import Float, Integer, select
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pyarrow es opcional
+    pa = ds = None
+
+from xml_storage import xml_table
+
+# Carpetas del dataset: mes_emision=2025-01/NIT_Emisor=12345678/parte-....parquet
+COLUMNAS_PARTICION = ('mes_emision', 'NIT_Emisor')
+
+# Guarda el último id de xml_data ya archivado (los archivos con "_" no se leen como datos)
+ARCHIVO_ESTADO = '_estado.json'
+
+# Filas de xml_data por archivo escrito al sincronizar
+TAMANO_LOTE_PARQUET = 50000
+
+
+def parquet_disponible() -> bool:
+    """Indica si pyarrow está instalado"""
+    return pa is not None
+
+
+def _requerir_pyarrow():
+    if pa is None:
+        raise RuntimeError("El archivo Parquet necesita pyarrow (pip install pyarrow)")
+
+
+def _tipo_arrow(columna):
+    if isinstance(columna.type, Integer):
+        return pa.int64()
+    if isinstance(columna.type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+def _esquema():
+    """Esquema del dataset: columnas de xml_data más mes_emision"""
+    campos = [pa.field(columna.name, _tipo_arrow(columna)) for columna in xml_table.columns]
+    return pa.schema(campos + [pa.field('mes_emision', pa.string())])
+
+
+def _particionado():
+    # Tipos fijos: si no, pyarrow infiere NIT_Emisor numérico y pierde los que llevan K
+    return ds.partitioning(
+        pa.schema([pa.field(columna, pa.string()) for columna in COLUMNAS_PARTICION]),
+        flavor='hive'
+    )
+
+
+def _leer_estado(base_dir: str) -> int:
+    ruta = os.path.join(base_dir, ARCHIVO_ESTADO)
+    if not os.path.exists(ruta):
+        return 0
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)['ultimo_id']
+
+
+def _guardar_estado(base_dir: str, ultimo_id: int):
+    ruta = os.path.join(base_dir, ARCHIVO_ESTADO)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'ultimo_id': ultimo_id}, f)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def _escribir_lote(base_dir: str, columnas: list, lote: list):
+    """Escribe un lote de filas de xml_data (ordenadas por id) en el dataset"""
+    valores = dict(zip(columnas, zip(*lote)))
+    valores['mes_emision'] = [fecha[:7] if fecha else None for fecha in valores['FechaHoraEmision']]
+
+    esquema = _esquema()
+    tabla = pa.table({campo.name: pa.array(valores[campo.name], type=campo.type) for campo in esquema})
+
+    # Un lote de recibidos puede tocar miles de emisores: el límite de particiones
+    # (1024 por defecto) se ajusta al lote, o el lote fallaría en cada sincronización.
+    # Ordenado por partición, cada archivo se termina antes de abrir el siguiente y
+    # el límite de archivos abiertos no parte una partición en varios archivos.
+    particiones = len(set(zip(*(valores[columna] for columna in COLUMNAS_PARTICION))))
+    tabla = tabla.sort_by([(columna, 'ascending') for columna in COLUMNAS_PARTICION] + [('id', 'ascending')])
+
+    # El nombre depende del primer id del lote: si se repite una sincronización
+    # cortada a la mitad, el archivo se reescribe en vez de duplicarse
+    ds.write_dataset(
+        tabla, base_dir,
+        format='parquet',
+        partitioning=_particionado(),
+        basename_template=f"parte-{lote[0].id:012d}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+        max_partitions=max(particiones, 1)
+    )
+
+
+def sincronizar_parquet(engine, base_dir: str, tamano_lote: int = TAMANO_LOTE_PARQUET) -> int:
+    """
+    Agrega al archivo Parquet las filas de xml_data que todavía no están.
+
+    Los ids de las líneas solo crecen, así que basta con recordar el último id
+    archivado y leer desde ahí (por lotes, sin cargar toda la tabla).
+
+    Args:
+        engine: Engine de SQLAlchemy
+        base_dir: Carpeta del dataset Parquet
+        tamano_lote: Filas por lote (y como máximo por archivo de cada partición)
+
+    Returns:
+        Cantidad de filas agregadas al archivo
+    """
+    _requerir_pyarrow()
+    os.makedirs(base_dir, exist_ok=True)
+
+    ultimo_id = _leer_estado(base_dir)
+    agregadas = 0
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(
+            select(xml_table).where(xml_table.c.id > ultimo_id).order_by(xml_table.c.id)
+        )
+        columnas = list(result.keys())
+        for lote in result.partitions(tamano_lote):
+            _escribir_lote(base_dir, columnas, lote)
+            _guardar_estado(base_dir, lote[-1].id)
+            agregadas += len(lote)
+
+    return agregadas
+
+
+def _expresion_filtros(filtros: dict):
+    """Convierte {columna: valor o lista de valores} en una expresión de pyarrow"""
+    expresion = None
+    for columna, valor in filtros.items():
+        if isinstance(valor, (list, tuple, set)):
+            condicion = ds.field(columna).isin(list(valor))
+        else:
+            condicion = ds.field(columna) == valor
+        expresion = condicion if expresion is None else expresion & condicion
+    return expresion
+
+
+def leer_parquet(base_dir: str, columnas=None, filtros=None):
+    """
+    Lee el archivo Parquet como DataFrame, leyendo solo lo necesario.
+
+    Las columnas no pedidas no se leen de disco y los filtros sobre mes_emision
+    o NIT_Emisor descartan carpetas completas sin abrirlas; el resto de filtros
+    usa las estadísticas de cada archivo Parquet.
+
+    Args:
+        base_dir: Carpeta del dataset Parquet
+        columnas: Lista de columnas a leer (None = todas)
+        filtros: Diccionario {columna: valor o lista de valores}, o una expresión
+            de pyarrow.dataset (ej: ds.field('FechaHoraEmision') >= '2025-01')
+
+    Returns:
+        DataFrame con las filas que cumplen los filtros
+
+    Ejemplo:
+        leer_parquet('parquet', ['mes_emision', 'Total'], {'NIT_Emisor': '12345678'})
+    """
+    _requerir_pyarrow()
+    dataset = ds.dataset(base_dir, format='parquet', schema=_esquema(), partitioning=_particionado())
+
+    if isinstance(filtros, dict):
+        filtros = _expresion_filtros(filtros)
+
+    return dataset.to_table(columns=columnas, filter=filtros).to_pandas()
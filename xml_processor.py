@@ -274,9 +274,15 @@ xml_processor.py
 Procesa archivos ZIP con XMLs de DTE guatemaltecos y los convierte a DataFrame
 """
 
+import os
 import zipfile
 import xml.etree.ElementTree as ET
+from array import array
+import numpy as np
 import pandas as pd
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
 # --- Namespaces usados en los XML DTE ---
@@ -284,6 +290,26 @@ NS = {
     "dte": "http://www.sat.gob.gt/dte/fel/0.2.0"
 }
 
+# Orden de columnas de cada fila (mismo esquema que la tabla xml_data)
+COLUMNAS_DTE = (
+    "Archivo", "DTE_ID", "TipoDocumento", "FechaHoraEmision", "CodigoMoneda",
+    "NombreEmisor", "NombreComercial", "NIT_Emisor", "CodigoEstablecimiento", "DireccionEmisor",
+    "NombreReceptor", "NIT_Receptor", "DireccionReceptor",
+    "NumeroAutorizacion_Serie", "NumeroAutorizacion_Numero", "NumeroAutorizacion_Texto",
+    "FechaHoraCertificacion", "NIT_Certificador", "Nombre_Certificador",
+    "Linea_Numero", "BienOServicio", "Descripcion", "Cantidad", "UnidadMedida",
+    "PrecioUnitario", "Precio", "Descuento", "Total", "Impuestos",
+)
+COLUMNAS_ENCABEZADO = COLUMNAS_DTE[:19]  # una vez por documento
+COLUMNAS_ITEM = COLUMNAS_DTE[19:]  # una vez por item
+COLUMNAS_NUMERICAS = ("Cantidad", "PrecioUnitario", "Precio", "Descuento", "Total")
+
+# Miembros del ZIP que procesa cada tarea del pool en modo paralelo
+MIEMBROS_POR_TAREA = 200
+
+# Porciones en vuelo por proceso (las que ya terminaron esperan al consumidor)
+TAREAS_POR_WORKER = 2
+
 def safe_text(parent: Optional[ET.Element], tag: str, ns=NS) -> str:
     """Devuelve el texto del tag (con namespace) o cadena vacía si no existe."""
     if parent is None:
@@ -291,16 +317,70 @@ def safe_text(parent: Optional[ET.Element], tag: str, ns=NS) -> str:
     el = parent.find(tag, ns)
     return (el.text or "").strip() if el is not None and el.text is not None else ""
 
+# --- Tags con namespace ya resuelto (se comparan directo contra elem.tag) ---
+_DTE = "{%s}" % NS["dte"]
+
+T_DTE = _DTE + "DTE"
+T_DATOS_GENERALES = _DTE + "DatosGenerales"
+T_EMISOR = _DTE + "Emisor"
+T_RECEPTOR = _DTE + "Receptor"
+T_DIRECCION_EMISOR = _DTE + "DireccionEmisor"
+T_DIRECCION_RECEPTOR = _DTE + "DireccionReceptor"
+T_CERTIFICACION = _DTE + "Certificacion"
+T_NUMERO_AUTORIZACION = _DTE + "NumeroAutorizacion"
+T_ITEM = _DTE + "Item"
+T_IMPUESTOS = _DTE + "Impuestos"
+T_IMPUESTO = _DTE + "Impuesto"
+
+_PARTES_DIRECCION = ("Direccion", "Municipio", "Departamento", "CodigoPostal", "Pais")
+_T_PARTES_DIRECCION = tuple(_DTE + t for t in _PARTES_DIRECCION)
+
+# Hijos de Certificacion / Item / Impuesto que se leen como texto
+_T_CAMPOS_CERTIFICACION = {
+    _DTE + "FechaHoraCertificacion": "FechaHoraCertificacion",
+    _DTE + "NITCertificador": "NIT_Certificador",
+    _DTE + "NombreCertificador": "Nombre_Certificador",
+}
+_T_CAMPOS_ITEM = {
+    _DTE + "Cantidad": "Cantidad",
+    _DTE + "UnidadMedida": "UnidadMedida",
+    _DTE + "Descripcion": "Descripcion",
+    _DTE + "PrecioUnitario": "PrecioUnitario",
+    _DTE + "Precio": "Precio",
+    _DTE + "Descuento": "Descuento",
+    _DTE + "Total": "Total",
+}
+_T_CAMPOS_IMPUESTO = {
+    _DTE + "NombreCorto": "nombre",
+    _DTE + "MontoGravable": "monto_gravable",
+    _DTE + "MontoImpuesto": "monto_impuesto",
+}
+
+# Nodos del encabezado: solo cuenta la primera aparición, igual que root.find(".//...")
+_T_ENCABEZADO = frozenset((
+    T_DTE, T_DATOS_GENERALES, T_EMISOR, T_RECEPTOR,
+    T_DIRECCION_EMISOR, T_DIRECCION_RECEPTOR, T_CERTIFICACION,
+))
+
+_BIEN_O_SERVICIO = {"B": "Bien", "S": "Servicio"}
+
+
+def _textos_hijos(elem: ET.Element, campos: dict) -> dict:
+    """Lee en una pasada el texto del primer hijo de cada tag de `campos`."""
+    valores = {}
+    for child in elem:
+        nombre = campos.get(child.tag)
+        if nombre is not None and nombre not in valores:
+            valores[nombre] = (child.text or "").strip()
+    return valores
+
 def format_address(addr_elem: Optional[ET.Element], ns=NS) -> str:
     """Construye una dirección legible a partir de DireccionEmisor/DireccionReceptor."""
     if addr_elem is None:
         return ""
-    parts = []
-    for t in ("Direccion", "Municipio", "Departamento", "CodigoPostal", "Pais"):
-        v = safe_text(addr_elem, f"dte:{t}", ns)
-        if v:
-            parts.append(v)
-    return ", ".join(parts)
+    tags = _T_PARTES_DIRECCION if ns is NS else tuple("{%s}%s" % (ns["dte"], t) for t in _PARTES_DIRECCION)
+    textos = _textos_hijos(addr_elem, dict(zip(tags, tags)))
+    return ", ".join(v for v in (textos.get(t, "") for t in tags) if v)
 
 def to_float_safe(value: str) -> float:
     """Convierte a float manejando cadenas vacías o comas como separador decimal."""
@@ -315,145 +395,422 @@ def to_float_safe(value: str) -> float:
     except Exception:
         return 0.0
 
-def parse_xml_tree(root: ET.Element, file_name: str):
-    """Extrae filas (una por item) desde un XML (ElementTree root)."""
-    rows = []
-
-    # Emisor / Receptor / DatosGenerales
-    emisor = root.find(".//dte:Emisor", NS)
-    receptor = root.find(".//dte:Receptor", NS)
-    datos_generales = root.find(".//dte:DatosGenerales", NS)
-    certificacion = root.find(".//dte:Certificacion", NS)
-    numero_aut = root.find(".//dte:Certificacion/dte:NumeroAutorizacion", NS)
-    dte_elem = root.find(".//dte:DTE", NS)
-
-    # Emisor datos
-    nombre_emisor = emisor.attrib.get("NombreEmisor") if emisor is not None else ""
-    nombre_comercial = emisor.attrib.get("NombreComercial") if emisor is not None else nombre_emisor
-    nit_emisor = emisor.attrib.get("NITEmisor") if emisor is not None else ""
-    codigo_establecimiento = emisor.attrib.get("CodigoEstablecimiento") if emisor is not None else ""
-
-    direccion_emisor = format_address(root.find(".//dte:DireccionEmisor", NS), NS)
-
-    # Receptor datos
-    nombre_receptor = receptor.attrib.get("NombreReceptor") if receptor is not None else ""
-    nit_receptor = receptor.attrib.get("IDReceptor") if receptor is not None else ""
-    direccion_receptor = format_address(root.find(".//dte:DireccionReceptor", NS), NS)
-
-    # Datos Generales
-    tipo_documento = datos_generales.attrib.get("Tipo") if datos_generales is not None else ""
-    fecha_emision = datos_generales.attrib.get("FechaHoraEmision") if datos_generales is not None else ""
-    codigo_moneda = datos_generales.attrib.get("CodigoMoneda") if datos_generales is not None else ""
-
-    # Certificacion / NumeroAutorizacion
-    numaut_serie = numero_aut.attrib.get("Serie") if numero_aut is not None else ""
-    numaut_numero = numero_aut.attrib.get("Numero") if numero_aut is not None else ""
-    numaut_text = (numero_aut.text or "").strip() if numero_aut is not None and numero_aut.text else ""
-    fecha_certificacion = safe_text(certificacion, "dte:FechaHoraCertificacion", NS) if certificacion is not None else ""
-    nit_certificador = safe_text(certificacion, "dte:NITCertificador", NS) if certificacion is not None else ""
-    nombre_certificador = safe_text(certificacion, "dte:NombreCertificador", NS) if certificacion is not None else ""
-
-    dte_id = dte_elem.attrib.get("ID") if dte_elem is not None else ""
-
-    # Recorremos cada Item
-    for item in root.findall(".//dte:Item", NS):
-        numero_linea = item.attrib.get("NumeroLinea", "")
-        bien_o_servicio = item.attrib.get("BienOServicio", "")
-        
-        if bien_o_servicio == "B":
-            bof = "Bien"
-        elif bien_o_servicio == "S":
-            bof = "Servicio"
-        else:
-            bof = bien_o_servicio
-
-        cantidad = safe_text(item, "dte:Cantidad", NS)
-        unidad = safe_text(item, "dte:UnidadMedida", NS)
-        descripcion = safe_text(item, "dte:Descripcion", NS)
-        precio_unitario = safe_text(item, "dte:PrecioUnitario", NS)
-        precio = safe_text(item, "dte:Precio", NS)
-        descuento = safe_text(item, "dte:Descuento", NS)
-        total = safe_text(item, "dte:Total", NS)
-
-        # Impuestos por item
-        impuestos_list = []
-        for imp in item.findall(".//dte:Impuesto", NS):
-            nombre = safe_text(imp, "dte:NombreCorto", NS)
-            monto_gravable = safe_text(imp, "dte:MontoGravable", NS)
-            monto_impuesto = safe_text(imp, "dte:MontoImpuesto", NS)
-            impuestos_list.append({
-                "nombre": nombre,
-                "monto_gravable": monto_gravable,
-                "monto_impuesto": monto_impuesto
-            })
-
-        rows.append({
+def _leer_item(item: ET.Element) -> dict:
+    """Extrae los campos de un Item ya completo (sin datos de encabezado)."""
+    textos = {}
+    impuestos_list = []
+    for child in item:
+        tag = child.tag
+        if tag == T_IMPUESTOS:
+            for imp in child.iter(T_IMPUESTO):
+                valores = _textos_hijos(imp, _T_CAMPOS_IMPUESTO)
+                impuestos_list.append({
+                    "nombre": valores.get("nombre", ""),
+                    "monto_gravable": valores.get("monto_gravable", ""),
+                    "monto_impuesto": valores.get("monto_impuesto", "")
+                })
+            continue
+        nombre = _T_CAMPOS_ITEM.get(tag)
+        if nombre is not None and nombre not in textos:
+            textos[nombre] = (child.text or "").strip()
+
+    bien_o_servicio = item.attrib.get("BienOServicio", "")
+
+    return {
+        "Linea_Numero": item.attrib.get("NumeroLinea", ""),
+        "BienOServicio": _BIEN_O_SERVICIO.get(bien_o_servicio, bien_o_servicio),
+        "Descripcion": textos.get("Descripcion", ""),
+        "Cantidad": to_float_safe(textos.get("Cantidad")),
+        "UnidadMedida": textos.get("UnidadMedida", ""),
+        "PrecioUnitario": to_float_safe(textos.get("PrecioUnitario")),
+        "Precio": to_float_safe(textos.get("Precio")),
+        "Descuento": to_float_safe(textos.get("Descuento")),
+        "Total": to_float_safe(textos.get("Total")),
+        "Impuestos": impuestos_list
+    }
+
+class _ExtractorDTE:
+    """
+    Extractor de una sola pasada: recibe los elementos de un documento (en cualquier
+    recorrido) y despacha por tag, sin búsquedas .// repetidas sobre el árbol.
+    """
+
+    __slots__ = ("items", "nodos")
+
+    def __init__(self):
+        self.items = []
+        self.nodos = {}
+
+    def procesar(self, elem: ET.Element) -> bool:
+        """Procesa un elemento ya completo. Devuelve True si era un Item."""
+        tag = elem.tag
+        if tag == T_ITEM:
+            self.items.append(_leer_item(elem))
+            return True
+        if tag in _T_ENCABEZADO and tag not in self.nodos:
+            self.nodos[tag] = elem
+        return False
+
+    def encabezado(self, file_name: str) -> dict:
+        """Arma los campos de encabezado que se repiten en cada fila del documento."""
+        nodos = self.nodos
+        emisor = nodos.get(T_EMISOR)
+        receptor = nodos.get(T_RECEPTOR)
+        datos_generales = nodos.get(T_DATOS_GENERALES)
+        certificacion = nodos.get(T_CERTIFICACION)
+        dte_elem = nodos.get(T_DTE)
+
+        numero_aut = None
+        cert = {}
+        if certificacion is not None:
+            for child in certificacion:
+                if child.tag == T_NUMERO_AUTORIZACION and numero_aut is None:
+                    numero_aut = child
+            cert = _textos_hijos(certificacion, _T_CAMPOS_CERTIFICACION)
+
+        nombre_emisor = emisor.attrib.get("NombreEmisor") if emisor is not None else ""
+
+        return {
             "Archivo": file_name,
-            "DTE_ID": dte_id,
-            "TipoDocumento": tipo_documento,
-            "FechaHoraEmision": fecha_emision,
-            "CodigoMoneda": codigo_moneda,
+            "DTE_ID": dte_elem.attrib.get("ID") if dte_elem is not None else "",
+            "TipoDocumento": datos_generales.attrib.get("Tipo") if datos_generales is not None else "",
+            "FechaHoraEmision": datos_generales.attrib.get("FechaHoraEmision") if datos_generales is not None else "",
+            "CodigoMoneda": datos_generales.attrib.get("CodigoMoneda") if datos_generales is not None else "",
             "NombreEmisor": nombre_emisor,
-            "NombreComercial": nombre_comercial,
-            "NIT_Emisor": nit_emisor,
-            "CodigoEstablecimiento": codigo_establecimiento,
-            "DireccionEmisor": direccion_emisor,
-            "NombreReceptor": nombre_receptor,
-            "NIT_Receptor": nit_receptor,
-            "DireccionReceptor": direccion_receptor,
-            "NumeroAutorizacion_Serie": numaut_serie,
-            "NumeroAutorizacion_Numero": numaut_numero,
-            "NumeroAutorizacion_Texto": numaut_text,
-            "FechaHoraCertificacion": fecha_certificacion,
-            "NIT_Certificador": nit_certificador,
-            "Nombre_Certificador": nombre_certificador,
-            "Linea_Numero": numero_linea,
-            "BienOServicio": bof,
-            "Descripcion": descripcion,
-            "Cantidad": to_float_safe(cantidad),
-            "UnidadMedida": unidad,
-            "PrecioUnitario": to_float_safe(precio_unitario),
-            "Precio": to_float_safe(precio),
-            "Descuento": to_float_safe(descuento),
-            "Total": to_float_safe(total),
-            "Impuestos": impuestos_list
-        })
-
-    return rows
-
-def extraer_productos_de_zip(zip_path: str) -> pd.DataFrame:
+            "NombreComercial": emisor.attrib.get("NombreComercial") if emisor is not None else nombre_emisor,
+            "NIT_Emisor": emisor.attrib.get("NITEmisor") if emisor is not None else "",
+            "CodigoEstablecimiento": emisor.attrib.get("CodigoEstablecimiento") if emisor is not None else "",
+            "DireccionEmisor": format_address(nodos.get(T_DIRECCION_EMISOR)),
+            "NombreReceptor": receptor.attrib.get("NombreReceptor") if receptor is not None else "",
+            "NIT_Receptor": receptor.attrib.get("IDReceptor") if receptor is not None else "",
+            "DireccionReceptor": format_address(nodos.get(T_DIRECCION_RECEPTOR)),
+            "NumeroAutorizacion_Serie": numero_aut.attrib.get("Serie") if numero_aut is not None else "",
+            "NumeroAutorizacion_Numero": numero_aut.attrib.get("Numero") if numero_aut is not None else "",
+            "NumeroAutorizacion_Texto": (numero_aut.text or "").strip() if numero_aut is not None else "",
+            "FechaHoraCertificacion": cert.get("FechaHoraCertificacion", ""),
+            "NIT_Certificador": cert.get("NIT_Certificador", ""),
+            "Nombre_Certificador": cert.get("Nombre_Certificador", ""),
+        }
+
+    def filas(self, file_name: str) -> list:
+        """Combina el encabezado con cada item (una fila por item)."""
+        encabezado = self.encabezado(file_name)
+        return [{**encabezado, **item} for item in self.items]
+
+def parse_xml_tree(root: ET.Element, file_name: str):
+    """Extrae filas (una por item) desde un XML (ElementTree root)."""
+    extractor = _ExtractorDTE()
+    elementos = root.iter()
+    next(elementos)  # como root.find(".//..."), el propio root no cuenta
+    for elem in elementos:
+        extractor.procesar(elem)
+    return extractor.filas(file_name)
+
+def _es_miembro_xml(member: str) -> bool:
+    """Indica si una entrada del ZIP es un XML (descarta directorios y otros archivos)."""
+    return not member.endswith('/') and member.lower().endswith(".xml")
+
+def parse_xml_stream(source, file_name: str):
+    """
+    Extrae filas (una por item) leyendo el XML con iterparse.
+
+    Cada Item se procesa en cuanto se termina de leer y se libera de inmediato,
+    así el árbol completo del documento nunca queda en memoria.
+
+    Args:
+        source: Ruta o archivo abierto (binario) con el XML
+        file_name: Nombre del archivo dentro del ZIP
+
+    Returns:
+        Lista de filas con el mismo esquema que parse_xml_tree
+    """
+    encabezado, items = _parse_documento(source, file_name)
+    return [{**encabezado, **item} for item in items]
+
+def _parse_documento(source, file_name: str):
+    """Recorre el XML con iterparse y devuelve (encabezado, items) sin combinarlos."""
+    extractor = _ExtractorDTE()
+    contexto = ET.iterparse(source, events=("start", "end"))
+    _, root = next(contexto)
+
+    for evento, elem in contexto:
+        if evento == "end" and elem is not root and extractor.procesar(elem):
+            elem.clear()
+
+    encabezado = extractor.encabezado(file_name)
+    root.clear()
+    return encabezado, extractor.items
+
+def serializar_impuestos(impuestos: list) -> str:
+    """Serializa la lista de impuestos de un item a JSON (texto para la BD)."""
+    return pd.io.json.dumps(impuestos) if impuestos else "[]"
+
+class ConstructorColumnar:
+    """
+    Acumula las filas por columna en lugar de un diccionario por item.
+
+    Los campos de encabezado se guardan una sola vez por documento y cada item
+    solo guarda el índice de su documento; las columnas numéricas van en arrays
+    tipados. El DataFrame se arma directo desde las columnas, expandiendo el
+    encabezado por índice.
+    """
+
+    def __init__(self):
+        self.encabezados = {c: [] for c in COLUMNAS_ENCABEZADO}
+        self.items = {c: [] for c in COLUMNAS_ITEM if c not in COLUMNAS_NUMERICAS}
+        self.numericos = {c: array("d") for c in COLUMNAS_NUMERICAS}
+        self.indice_documento = array("q")
+        self.documentos = 0
+
+    def __len__(self) -> int:
+        return len(self.indice_documento)
+
+    def agregar_documento(self, encabezado: dict, items: list):
+        """Agrega un documento (encabezado + sus items). Los documentos sin items se omiten."""
+        if not items:
+            return
+
+        for columna, valores in self.encabezados.items():
+            valores.append(encabezado[columna])
+
+        for item in items:
+            for columna, valores in self.items.items():
+                valores.append(item[columna])
+            for columna, valores in self.numericos.items():
+                valores.append(item[columna])
+
+        self.indice_documento.extend([self.documentos] * len(items))
+        self.documentos += 1
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Construye el DataFrame (mismas columnas y orden que COLUMNAS_DTE)."""
+        if not len(self):
+            return pd.DataFrame()
+
+        indice = np.array(self.indice_documento, dtype=np.int64)
+        datos = {}
+        for columna in COLUMNAS_DTE:
+            if columna in self.encabezados:
+                datos[columna] = np.asarray(self.encabezados[columna], dtype=object)[indice]
+            elif columna in self.numericos:
+                datos[columna] = np.array(self.numericos[columna], dtype=np.float64)
+            else:
+                datos[columna] = np.asarray(self.items[columna], dtype=object)
+
+        return pd.DataFrame(datos, columns=list(COLUMNAS_DTE))
+
+def clave_miembro(info: zipfile.ZipInfo) -> tuple:
+    """
+    Identifica un XML del ZIP por nombre, CRC32 y tamaño.
+
+    Los tres datos vienen del directorio central del ZIP, así que se obtienen
+    sin descomprimir ni parsear el archivo.
+    """
+    return (info.filename, info.CRC, info.file_size)
+
+def claves_de_zip(zip_path: str) -> list:
+    """Claves (ver clave_miembro) de todos los XML del ZIP, en orden."""
+    with zipfile.ZipFile(zip_path, "r") as z:
+        return [clave_miembro(info) for info in z.infolist() if _es_miembro_xml(info.filename)]
+
+def _miembros_a_procesar(z: zipfile.ZipFile, omitir: Optional[set] = None) -> list:
+    """ZipInfo de los XML del ZIP, sin los que ya están en `omitir`."""
+    return [
+        info for info in z.infolist()
+        if _es_miembro_xml(info.filename) and not (omitir and clave_miembro(info) in omitir)
+    ]
+
+def _filas_secuenciales(zip_path: str, errores: Optional[list] = None, impuestos_json: bool = True,
+                        omitir: Optional[set] = None, procesados: Optional[list] = None):
+    """Filas del ZIP procesando un miembro a la vez en este proceso."""
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in _miembros_a_procesar(z, omitir):
+            member = info.filename
+            try:
+                with z.open(info) as f:
+                    rows = parse_xml_stream(f, member)
+            except Exception as e:
+                if errores is not None:
+                    errores.append(f"Error en {member}: {str(e)}")
+                print(f"ERROR procesando {member}: {e}")
+                continue
+
+            if procesados is not None:
+                procesados.append(clave_miembro(info))
+            for row in rows:
+                if impuestos_json:
+                    row["Impuestos"] = serializar_impuestos(row["Impuestos"])
+                yield row
+
+def iterar_filas_de_zip(zip_path: str, batch_size: Optional[int] = None, errores: Optional[list] = None,
+                        workers: int = 1, impuestos_json: bool = True, omitir: Optional[set] = None,
+                        procesados: Optional[list] = None):
+    """
+    Recorre el ZIP documento por documento y va entregando las filas como generador.
+
+    La memoria usada depende del tamaño del lote, no del tamaño del ZIP.
+
+    Args:
+        zip_path: Ruta al archivo ZIP
+        batch_size: Si se indica, entrega listas de hasta batch_size filas en vez de filas sueltas
+        errores: Lista opcional donde se acumulan los errores por archivo
+        workers: Si es mayor que 1, el parseo se reparte entre ese número de procesos
+        impuestos_json: Si es False, Impuestos queda como lista de dicts (en modo
+            secuencial); útil cuando las filas van directo a la BD y no a un DataFrame
+        omitir: Claves de miembros (ver clave_miembro) que no se abren ni se parsean
+        procesados: Lista opcional donde se agregan las claves de los miembros
+            parseados sin error
+
+    Yields:
+        Filas (dict) o lotes de filas
+    """
+    if workers > 1:
+        filas = (
+            dict(zip(COLUMNAS_DTE, fila))
+            for lote in iterar_lotes_paralelo(zip_path, workers=workers, errores=errores,
+                                              omitir=omitir, procesados=procesados)
+            for fila in lote
+        )
+    else:
+        filas = _filas_secuenciales(zip_path, errores, impuestos_json, omitir, procesados)
+
+    if batch_size is None:
+        yield from filas
+        return
+
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= batch_size:
+            yield lote
+            lote = []
+
+    if lote:
+        yield lote
+
+def _procesar_porcion_zip(args):
+    """
+    Tarea del pool: abre el ZIP por su cuenta y procesa una porción de miembros.
+
+    Devuelve las filas como tuplas en el orden de COLUMNAS_DTE (más livianas de
+    enviar entre procesos que los diccionarios) junto con los errores encontrados.
+    """
+    zip_path, members = args
+    filas = []
+    errores = []
+
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for member in members:
+            try:
+                with z.open(member) as f:
+                    rows = parse_xml_stream(f, member)
+            except Exception as e:
+                errores.append((member, str(e)))
+                continue
+
+            for row in rows:
+                row["Impuestos"] = serializar_impuestos(row["Impuestos"])
+                filas.append(tuple(row[c] for c in COLUMNAS_DTE))
+
+    return filas, errores
+
+def iterar_lotes_paralelo(zip_path: str, workers: Optional[int] = None, errores: Optional[list] = None,
+                          miembros_por_tarea: int = MIEMBROS_POR_TAREA, omitir: Optional[set] = None,
+                          procesados: Optional[list] = None):
+    """
+    Reparte los miembros del ZIP entre un pool de procesos y entrega los lotes en orden.
+
+    Los lotes llegan en el mismo orden que z.namelist(), así que las filas y la
+    lista de errores son idénticas a las del modo secuencial. Solo hay
+    TAREAS_POR_WORKER porciones por proceso en vuelo a la vez: los resultados
+    no se acumulan en memoria si el consumidor (la carga a la BD) va más lento.
+
+    Args:
+        zip_path: Ruta al archivo ZIP
+        workers: Número de procesos (por defecto, uno por CPU)
+        errores: Lista opcional donde se acumulan los errores por archivo
+        miembros_por_tarea: Cantidad de XMLs que procesa cada tarea
+        omitir: Claves de miembros (ver clave_miembro) que no se parsean
+        procesados: Lista opcional donde se agregan las claves de los miembros
+            parseados sin error
+
+    Yields:
+        Listas de tuplas en el orden de COLUMNAS_DTE
+    """
+    with zipfile.ZipFile(zip_path, "r") as z:
+        claves = {info.filename: clave_miembro(info) for info in _miembros_a_procesar(z, omitir)}
+    members = list(claves)
+
+    porciones = [
+        (zip_path, members[i:i + miembros_por_tarea])
+        for i in range(0, len(members), miembros_por_tarea)
+    ]
+    if not porciones:
+        return
+
+    workers = min(workers or os.cpu_count() or 1, len(porciones))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Ventana acotada de futuros; se entregan en el orden de las porciones
+        pendientes = deque()
+        siguientes = iter(porciones)
+        for porcion in itertools.islice(siguientes, workers * TAREAS_POR_WORKER):
+            pendientes.append((porcion[1], executor.submit(_procesar_porcion_zip, porcion)))
+
+        while pendientes:
+            miembros, futuro = pendientes.popleft()
+            filas, errores_porcion = futuro.result()
+            for porcion in itertools.islice(siguientes, 1):
+                pendientes.append((porcion[1], executor.submit(_procesar_porcion_zip, porcion)))
+
+            for member, error in errores_porcion:
+                if errores is not None:
+                    errores.append(f"Error en {member}: {error}")
+                print(f"ERROR procesando {member}: {error}")
+            if procesados is not None:
+                fallidos = {member for member, _ in errores_porcion}
+                procesados.extend(claves[m] for m in miembros if m not in fallidos)
+            yield filas
+
+def extraer_productos_de_zip(zip_path: str, workers: int = 1) -> pd.DataFrame:
     """
     Abre el ZIP, procesa todos los XML y devuelve un DataFrame con todas las filas.
-    
+
+    Las filas se acumulan por columnas (ConstructorColumnar). Para ZIPs muy grandes
+    usar iterar_filas_de_zip, que no acumula todas las filas.
+
     Args:
         zip_path: Ruta al archivo ZIP
-        
+        workers: Si es mayor que 1, reparte el parseo entre ese número de procesos
+
     Returns:
         DataFrame con todos los registros procesados
     """
-    all_rows = []
     errores = []
-    
+
+    if workers > 1:
+        filas = []
+        for lote in iterar_lotes_paralelo(zip_path, workers=workers, errores=errores):
+            filas.extend(lote)
+        df = pd.DataFrame.from_records(filas, columns=COLUMNAS_DTE) if filas else pd.DataFrame()
+        return df, errores
+
+    constructor = ConstructorColumnar()
+
     with zipfile.ZipFile(zip_path, "r") as z:
         for member in z.namelist():
-            if member.endswith('/') or not member.lower().endswith(".xml"):
+            if not _es_miembro_xml(member):
                 continue
             try:
                 with z.open(member) as f:
-                    tree = ET.parse(f)
-                    root = tree.getroot()
-                    rows = parse_xml_tree(root, member)
-                    all_rows.extend(rows)
+                    encabezado, items = _parse_documento(f, member)
             except Exception as e:
                 errores.append(f"Error en {member}: {str(e)}")
                 print(f"ERROR procesando {member}: {e}")
+                continue
 
-    df = pd.DataFrame(all_rows)
-    
-    # Serializar columna Impuestos a JSON
-    if "Impuestos" in df.columns and len(df) > 0:
-        df["Impuestos"] = df["Impuestos"].apply(
-            lambda x: pd.io.json.dumps(x) if x else "[]"
-        )
+            for item in items:
+                item["Impuestos"] = serializar_impuestos(item["Impuestos"])
+            constructor.agregar_documento(encabezado, items)
 
-    return df, errores
\ No newline at end of file
+    return constructor.to_dataframe(), errores
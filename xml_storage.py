@@ -0,0 +1,852 @@
+"""
+xml_storage.py
+Esquema normalizado (documentos / líneas / impuestos) para los datos de DTE,
+con una vista xml_data compatible con la antigua tabla ancha
+"""
+
+import json
+from contextlib import contextmanager
+from operator import itemgetter
+from sqlalchemy import Column, Integer, String, Float, MetaData, Table, Text, ForeignKey, Index, text, select
+
+from xml_processor import COLUMNAS_ENCABEZADO, COLUMNAS_ITEM, to_float_safe
+
+metadata = MetaData()
+
+# Un registro por DTE: emisor, receptor y certificación se guardan una sola vez
+documentos_table = Table(
+    'dte_documentos', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('Archivo', String(500)),
+    Column('DTE_ID', String(200)),
+    Column('TipoDocumento', String(50)),
+    Column('FechaHoraEmision', String(50)),
+    Column('CodigoMoneda', String(10)),
+    Column('NombreEmisor', String(500)),
+    Column('NombreComercial', String(500)),
+    Column('NIT_Emisor', String(50)),
+    Column('CodigoEstablecimiento', String(50)),
+    Column('DireccionEmisor', Text),
+    Column('NombreReceptor', String(500)),
+    Column('NIT_Receptor', String(50)),
+    Column('DireccionReceptor', Text),
+    Column('NumeroAutorizacion_Serie', String(50)),
+    Column('NumeroAutorizacion_Numero', String(50)),
+    Column('NumeroAutorizacion_Texto', String(200)),
+    Column('FechaHoraCertificacion', String(50)),
+    Column('NIT_Certificador', String(50)),
+    Column('Nombre_Certificador', String(500)),
+    Column('fecha_carga', String(50))  # Timestamp de cuándo se cargó
+)
+
+# Un registro por item del DTE
+lineas_table = Table(
+    'dte_lineas', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('documento_id', Integer, ForeignKey('dte_documentos.id'), nullable=False),
+    Column('Linea_Numero', String(10)),
+    Column('BienOServicio', String(50)),
+    Column('Descripcion', Text),
+    Column('Cantidad', Float),
+    Column('UnidadMedida', String(50)),
+    Column('PrecioUnitario', Float),
+    Column('Precio', Float),
+    Column('Descuento', Float),
+    Column('Total', Float)
+)
+
+# Un registro por impuesto de cada línea (antes era un JSON en la columna Impuestos)
+impuestos_table = Table(
+    'dte_impuestos', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('linea_id', Integer, ForeignKey('dte_lineas.id'), nullable=False),
+    Column('NombreCorto', String(50)),
+    Column('MontoGravable', Float),
+    Column('MontoImpuesto', Float)
+)
+
+# XMLs de los ZIP que ya se cargaron, por nombre + CRC32 + tamaño (ver
+# xml_processor.clave_miembro): al volver a subirlos no se vuelven a parsear
+miembros_table = Table(
+    'xml_miembros_procesados', metadata,
+    Column('nombre', String(500), primary_key=True),
+    Column('crc32', Integer, primary_key=True),
+    Column('tamano', Integer, primary_key=True),
+    Column('fecha_carga', String(50))
+)
+
+# Resumen de /estadisticas-xml que se mantiene en cada carga (ver _actualizar_resumen).
+# Una sola fila (id = 1) con los totales acumulados.
+resumen_table = Table(
+    'dte_resumen', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('total_registros', Integer, nullable=False, server_default='0'),
+    Column('monto_total', Float, nullable=False, server_default='0'),
+    Column('cantidad_total', Float, nullable=False, server_default='0'),
+    Column('fecha_desde', String(50)),
+    Column('fecha_hasta', String(50)),
+    Column('total_facturas', Integer, nullable=False, server_default='0'),
+    Column('emisores_unicos', Integer, nullable=False, server_default='0'),
+    Column('receptores_unicos', Integer, nullable=False, server_default='0')
+)
+
+# Valores distintos ya vistos por campo (DTE_ID, NIT_Emisor, NIT_Receptor): con
+# INSERT OR IGNORE, las filas agregadas son justo los valores nuevos a sumar al conteo
+resumen_valores_table = Table(
+    'dte_resumen_valores', metadata,
+    Column('campo', String(20), primary_key=True),
+    Column('valor', String(500), primary_key=True)
+)
+
+# Sumas acumuladas para los top-N (el índice por monto/cantidad evita ordenar todo)
+resumen_emisores_table = Table(
+    'dte_resumen_emisores', metadata,
+    Column('NombreComercial', String(500), primary_key=True),
+    Column('monto', Float, nullable=False)
+)
+
+resumen_productos_table = Table(
+    'dte_resumen_productos', metadata,
+    Column('Descripcion', Text, primary_key=True),
+    Column('cantidad', Float, nullable=False)
+)
+
+TABLAS_RESUMEN = (resumen_table, resumen_valores_table, resumen_emisores_table, resumen_productos_table)
+
+# Campo de dte_resumen que cuenta los valores distintos de cada columna del documento
+CAMPOS_DISTINTOS = {
+    'DTE_ID': 'total_facturas',
+    'NIT_Emisor': 'emisores_unicos',
+    'NIT_Receptor': 'receptores_unicos',
+}
+
+# Índices para los filtros de /consultar-xml y /exportar-xml (NIT + rango de fechas)
+# y para los joins de la vista xml_data
+INDICES = (
+    Index('ix_documentos_emisor_fecha', documentos_table.c.NIT_Emisor, documentos_table.c.FechaHoraEmision),
+    Index('ix_documentos_receptor_fecha', documentos_table.c.NIT_Receptor, documentos_table.c.FechaHoraEmision),
+    Index('ix_documentos_fecha', documentos_table.c.FechaHoraEmision),
+    Index('ix_impuestos_linea', impuestos_table.c.linea_id),
+    Index('ix_resumen_emisores_monto', resumen_emisores_table.c.monto.desc(),
+          resumen_emisores_table.c.NombreComercial),
+    Index('ix_resumen_productos_cantidad', resumen_productos_table.c.cantidad.desc(),
+          resumen_productos_table.c.Descripcion),
+)
+
+# Claves únicas para que subir el mismo ZIP dos veces no duplique datos.
+# En los DTE de SAT el atributo ID es siempre "DatosCertificados", así que el
+# documento se identifica por DTE_ID + número de autorización (UUID).
+# Las claves vacías se guardan como NULL: SQLite no considera iguales dos NULL
+# en un índice único, así que un DTE sin autorización (o una línea sin
+# NumeroLinea) nunca choca con otro ni se descarta.
+INDICES_UNICOS = (
+    Index('ux_documentos_autorizacion', documentos_table.c.NumeroAutorizacion_Texto,
+          documentos_table.c.DTE_ID, unique=True),
+    Index('ux_lineas_documento_linea', lineas_table.c.documento_id, lineas_table.c.Linea_Numero, unique=True),
+)
+
+CLAVE_DOCUMENTO = ('NumeroAutorizacion_Texto', 'DTE_ID')
+
+# Sin número de autorización, el documento se reconoce por el XML del que salió
+CLAVE_DOCUMENTO_SIN_AUTORIZACION = ('DTE_ID', 'Archivo')
+
+# Filas por lote al insertar (executemany por tabla y lote)
+TAMANO_LOTE = 5000
+
+# PRAGMAs de SQLite durante la carga masiva. WAL deja leer mientras se escribe y,
+# con WAL, synchronous=NORMAL sigue siendo seguro ante caídas del proceso.
+PRAGMAS_CARGA = {
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,  # 64 MB (negativo = KiB)
+    'temp_store': 'MEMORY',
+}
+
+# Vista de compatibilidad: mismas columnas que la antigua tabla xml_data, para que
+# /consultar-xml, /exportar-xml y /estadisticas-xml sigan consultando igual.
+# Va en su propio MetaData para que create_all no intente crearla como tabla.
+vista_metadata = MetaData()
+
+xml_table = Table(
+    'xml_data', vista_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('Archivo', String(500)),
+    Column('DTE_ID', String(200)),
+    Column('TipoDocumento', String(50)),
+    Column('FechaHoraEmision', String(50)),
+    Column('CodigoMoneda', String(10)),
+    Column('NombreEmisor', String(500)),
+    Column('NombreComercial', String(500)),
+    Column('NIT_Emisor', String(50)),
+    Column('CodigoEstablecimiento', String(50)),
+    Column('DireccionEmisor', Text),
+    Column('NombreReceptor', String(500)),
+    Column('NIT_Receptor', String(50)),
+    Column('DireccionReceptor', Text),
+    Column('NumeroAutorizacion_Serie', String(50)),
+    Column('NumeroAutorizacion_Numero', String(50)),
+    Column('NumeroAutorizacion_Texto', String(200)),
+    Column('FechaHoraCertificacion', String(50)),
+    Column('NIT_Certificador', String(50)),
+    Column('Nombre_Certificador', String(500)),
+    Column('Linea_Numero', String(10)),
+    Column('BienOServicio', String(50)),
+    Column('Descripcion', Text),
+    Column('Cantidad', Float),
+    Column('UnidadMedida', String(50)),
+    Column('PrecioUnitario', Float),
+    Column('Precio', Float),
+    Column('Descuento', Float),
+    Column('Total', Float),
+    Column('Impuestos', Text),
+    Column('fecha_carga', String(50))
+)
+
+COLUMNAS_DOCUMENTO = COLUMNAS_ENCABEZADO + ('fecha_carga',)
+COLUMNAS_LINEA = tuple(c for c in COLUMNAS_ITEM if c != 'Impuestos')
+
+_SQL_VISTA_XML_DATA = """
+CREATE VIEW IF NOT EXISTS xml_data AS
+SELECT
+    l.id AS id,
+    {columnas_documento},
+    {columnas_linea},
+    (
+        SELECT COALESCE(json_group_array(json_object(
+            'nombre', i.NombreCorto,
+            'monto_gravable', CAST(i.MontoGravable AS TEXT),
+            'monto_impuesto', CAST(i.MontoImpuesto AS TEXT)
+        )), '[]')
+        FROM (SELECT * FROM dte_impuestos WHERE linea_id = l.id ORDER BY id) i
+    ) AS Impuestos,
+    d.fecha_carga AS fecha_carga
+FROM dte_lineas l
+JOIN dte_documentos d ON d.id = l.documento_id
+""".format(
+    columnas_documento=",\n    ".join(f"d.{c} AS {c}" for c in COLUMNAS_ENCABEZADO),
+    columnas_linea=",\n    ".join(f"l.{c} AS {c}" for c in COLUMNAS_LINEA),
+)
+
+
+def _tipo_objeto(conn, nombre: str):
+    """Devuelve 'table', 'view' o None según lo que exista en sqlite_master."""
+    return conn.execute(
+        text("SELECT type FROM sqlite_master WHERE name = :nombre"), {'nombre': nombre}
+    ).scalar()
+
+
+def _migrar_tabla_ancha(conn):
+    """
+    Pasa los datos de la antigua tabla ancha xml_data al esquema normalizado.
+
+    Cada (NumeroAutorizacion_Texto, DTE_ID) distinto se convierte en un documento
+    (sin autorización, cada (DTE_ID, Archivo), como en _clave_de_fila); las
+    líneas conservan su id original (las repetidas se descartan) y los
+    impuestos se sacan del JSON de la columna Impuestos. Las claves vacías
+    pasan a NULL antes de agrupar (ver INDICES_UNICOS).
+    """
+    print("🔄 Migrando tabla xml_data al esquema normalizado...")
+    conn.execute(text("ALTER TABLE xml_data RENAME TO xml_data_legacy"))
+
+    autorizacion = "NULLIF(NumeroAutorizacion_Texto, '')"
+    columnas_doc = ", ".join(COLUMNAS_DOCUMENTO)
+    valores_doc = ", ".join(
+        f"{autorizacion} AS NumeroAutorizacion_Texto" if c == 'NumeroAutorizacion_Texto' else c
+        for c in COLUMNAS_DOCUMENTO
+    )
+    conn.execute(text(f"""
+        INSERT INTO dte_documentos ({columnas_doc})
+        SELECT {valores_doc} FROM xml_data_legacy
+        GROUP BY {autorizacion}, DTE_ID, CASE WHEN {autorizacion} IS NULL THEN Archivo END
+        ORDER BY MIN(id)
+    """))
+
+    conn.execute(text(
+        "CREATE TEMP TABLE _doc_clave AS SELECT id, NumeroAutorizacion_Texto, DTE_ID, Archivo FROM dte_documentos"
+    ))
+    conn.execute(text("CREATE INDEX temp._idx_doc_clave ON _doc_clave (NumeroAutorizacion_Texto, DTE_ID, Archivo)"))
+
+    # Las cargas repetidas del mismo DTE se descartan (queda la primera)
+    columnas_linea = ", ".join(COLUMNAS_LINEA)
+    valores_linea = ", ".join(
+        "NULLIF(x.Linea_Numero, '')" if c == 'Linea_Numero' else "x." + c for c in COLUMNAS_LINEA
+    )
+    conn.execute(text(f"""
+        INSERT OR IGNORE INTO dte_lineas (id, documento_id, {columnas_linea})
+        SELECT x.id, d.id, {valores_linea}
+        FROM xml_data_legacy x
+        JOIN _doc_clave d
+          ON d.NumeroAutorizacion_Texto IS NULLIF(x.NumeroAutorizacion_Texto, '')
+         AND d.DTE_ID IS x.DTE_ID
+         AND (d.NumeroAutorizacion_Texto IS NOT NULL OR d.Archivo IS x.Archivo)
+        ORDER BY x.id
+    """))
+
+    conn.execute(text("""
+        INSERT INTO dte_impuestos (linea_id, NombreCorto, MontoGravable, MontoImpuesto)
+        SELECT x.id,
+               json_extract(j.value, '$.nombre'),
+               CAST(REPLACE(json_extract(j.value, '$.monto_gravable'), ',', '.') AS REAL),
+               CAST(REPLACE(json_extract(j.value, '$.monto_impuesto'), ',', '.') AS REAL)
+        FROM xml_data_legacy x
+        JOIN dte_lineas l ON l.id = x.id,
+        json_each(CASE WHEN json_valid(x.Impuestos) THEN x.Impuestos ELSE '[]' END) j
+        ORDER BY x.id, j.key
+    """))
+
+    total = conn.execute(text("SELECT COUNT(*) FROM xml_data_legacy")).scalar()
+    conn.execute(text("DROP TABLE _doc_clave"))
+    conn.execute(text("DROP TABLE xml_data_legacy"))
+    print(f"✅ Migración completada: {total} registros")
+
+
+def _eliminar_duplicados(conn):
+    """
+    Deja un solo registro por documento y por línea antes de crear las claves únicas.
+
+    Se conserva el primero que se cargó (menor id) junto con sus líneas e impuestos.
+    """
+    print("🧹 Eliminando DTE duplicados antes de crear claves únicas...")
+    # Los de clave NULL no se tocan: no se sabe si son el mismo documento
+    docs_a_borrar = """
+        SELECT id FROM dte_documentos WHERE NumeroAutorizacion_Texto IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM dte_documentos GROUP BY NumeroAutorizacion_Texto, DTE_ID
+        )
+    """
+    conn.execute(text(f"""
+        DELETE FROM dte_impuestos WHERE linea_id IN (
+            SELECT id FROM dte_lineas WHERE documento_id IN ({docs_a_borrar})
+        )
+    """))
+    conn.execute(text(f"DELETE FROM dte_lineas WHERE documento_id IN ({docs_a_borrar})"))
+    docs = conn.execute(text(f"DELETE FROM dte_documentos WHERE id IN ({docs_a_borrar})")).rowcount
+
+    lineas_a_borrar = """
+        SELECT id FROM dte_lineas WHERE Linea_Numero IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM dte_lineas GROUP BY documento_id, Linea_Numero
+        )
+    """
+    conn.execute(text(f"DELETE FROM dte_impuestos WHERE linea_id IN ({lineas_a_borrar})"))
+    lineas = conn.execute(text(f"DELETE FROM dte_lineas WHERE id IN ({lineas_a_borrar})")).rowcount
+    print(f"✅ Duplicados eliminados: {docs} documento(s), {lineas} línea(s) sueltas")
+
+
+def inicializar_bd(engine):
+    """
+    Crea las tablas normalizadas, sus índices, el resumen de estadísticas y la vista xml_data.
+
+    Si la BD todavía tiene la tabla ancha xml_data (versiones anteriores), la migra.
+    En BDs existentes también crea los índices que falten (eliminando antes los
+    DTE duplicados que impedirían crear las claves únicas). Si las tablas del
+    resumen no existían o los datos cambiaron, el resumen se recalcula.
+    """
+    migrada = False
+    with engine.begin() as conn:
+        # Si el resumen es nuevo (o los datos cambian abajo) hay que calcularlo desde cero
+        reconstruir = any(_tipo_objeto(conn, tabla.name) is None for tabla in TABLAS_RESUMEN)
+
+        metadata.create_all(conn)
+        if _tipo_objeto(conn, 'xml_data') == 'table':
+            _migrar_tabla_ancha(conn)
+            migrada = reconstruir = True
+
+        # create_all no agrega índices nuevos a tablas que ya existían
+        if any(_tipo_objeto(conn, indice.name) is None for indice in INDICES_UNICOS):
+            # Claves vacías de cargas anteriores -> NULL (ver INDICES_UNICOS); una sola
+            # vez, junto con la limpieza de duplicados, y no en cada arranque
+            conn.execute(text(
+                "UPDATE dte_documentos SET NumeroAutorizacion_Texto = NULL WHERE NumeroAutorizacion_Texto = ''"
+            ))
+            conn.execute(text("UPDATE dte_lineas SET Linea_Numero = NULL WHERE Linea_Numero = ''"))
+            _eliminar_duplicados(conn)
+            reconstruir = True
+        conn.execute(text("DROP INDEX IF EXISTS ix_lineas_documento"))  # cubierto por ux_lineas_documento_linea
+        for indice in INDICES + INDICES_UNICOS:
+            indice.create(conn, checkfirst=True)
+
+        conn.execute(text(_SQL_VISTA_XML_DATA))
+
+        if reconstruir:
+            reconstruir_resumen(conn)
+
+    if migrada:
+        # Recuperar el espacio de la tabla ancha (VACUUM no puede ir en una transacción)
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+def plan_de_consulta(conn, statement) -> list:
+    """
+    Devuelve el EXPLAIN QUERY PLAN de SQLite para una consulta de SQLAlchemy
+
+    Returns:
+        Lista con el detalle de cada paso del plan (ej: 'SEARCH d USING INDEX ...')
+    """
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    return [fila[-1] for fila in conn.execute(text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def escanea_tabla_completa(plan: list, tablas=("d", "l", "dte_documentos", "dte_lineas")) -> bool:
+    """Indica si el plan recorre completa alguna de las tablas (SCAN sin índice)."""
+    for paso in plan:
+        partes = paso.split()
+        if len(partes) >= 2 and partes[0] == "SCAN" and partes[1] in tablas and "INDEX" not in paso:
+            return True
+    return False
+
+
+def reconstruir_resumen(conn):
+    """
+    Recalcula desde cero el resumen de estadísticas a partir de los datos guardados.
+
+    Normalmente no hace falta: cada carga lo actualiza. Sirve si el resumen quedó
+    desfasado (ej: se borraron datos a mano) y lo usa inicializar_bd tras migrar.
+
+    Args:
+        conn: Conexión SQLAlchemy dentro de una transacción
+    """
+    for tabla in TABLAS_RESUMEN:
+        conn.execute(tabla.delete())
+
+    for campo in CAMPOS_DISTINTOS:
+        conn.execute(text(f"""
+            INSERT INTO dte_resumen_valores (campo, valor)
+            SELECT DISTINCT '{campo}', {campo} FROM dte_documentos WHERE {campo} IS NOT NULL
+        """))
+
+    conn.execute(text("""
+        INSERT INTO dte_resumen_emisores (NombreComercial, monto)
+        SELECT d.NombreComercial, TOTAL(l.Total)
+        FROM dte_lineas l
+        JOIN dte_documentos d ON d.id = l.documento_id
+        WHERE d.NombreComercial IS NOT NULL
+        GROUP BY d.NombreComercial
+    """))
+    conn.execute(text("""
+        INSERT INTO dte_resumen_productos (Descripcion, cantidad)
+        SELECT Descripcion, TOTAL(Cantidad) FROM dte_lineas
+        WHERE Descripcion IS NOT NULL
+        GROUP BY Descripcion
+    """))
+
+    conteos = ",\n".join(
+        f"(SELECT COUNT(*) FROM dte_resumen_valores WHERE campo = '{campo}')"
+        for campo in CAMPOS_DISTINTOS
+    )
+    conn.execute(text(f"""
+        INSERT INTO dte_resumen (id, total_registros, monto_total, cantidad_total, fecha_desde, fecha_hasta,
+                                 {", ".join(CAMPOS_DISTINTOS.values())})
+        SELECT 1,
+               (SELECT COUNT(*) FROM dte_lineas),
+               (SELECT TOTAL(Total) FROM dte_lineas),
+               (SELECT TOTAL(Cantidad) FROM dte_lineas),
+               (SELECT MIN(FechaHoraEmision) FROM dte_documentos),
+               (SELECT MAX(FechaHoraEmision) FROM dte_documentos),
+               {conteos}
+    """))
+
+
+def estadisticas(conn, top_emisores: int = 5, top_productos: int = 10) -> dict:
+    """
+    Devuelve las estadísticas de /estadisticas-xml leyendo el resumen ya calculado.
+
+    El costo no depende del tamaño de la BD: una fila de totales y los top-N
+    sacados del índice por monto/cantidad (si empatan, primero el menor nombre,
+    igual que groupby().sum().nlargest()).
+
+    Args:
+        conn: Conexión SQLAlchemy
+        top_emisores: Cantidad de emisores en top_emisores
+        top_productos: Cantidad de productos en top_productos
+
+    Returns:
+        Diccionario con las estadísticas, o None si no hay datos
+    """
+    resumen = conn.execute(select(resumen_table).where(resumen_table.c.id == 1)).mappings().first()
+    if resumen is None or not resumen['total_registros']:
+        return None
+
+    e, p = resumen_emisores_table.c, resumen_productos_table.c
+    emisores_top = conn.execute(
+        select(e.NombreComercial, e.monto).order_by(e.monto.desc(), e.NombreComercial).limit(top_emisores)
+    ).all()
+    productos_top = conn.execute(
+        select(p.Descripcion, p.cantidad).order_by(p.cantidad.desc(), p.Descripcion).limit(top_productos)
+    ).all()
+
+    return {
+        'total_registros': resumen['total_registros'],
+        'total_facturas': resumen['total_facturas'],
+        'emisores_unicos': resumen['emisores_unicos'],
+        'receptores_unicos': resumen['receptores_unicos'],
+        'monto_total': resumen['monto_total'],
+        'monto_promedio': resumen['monto_total'] / resumen['total_registros'],
+        'cantidad_total_items': resumen['cantidad_total'],
+        'rango_fechas': {
+            'desde': resumen['fecha_desde'],
+            'hasta': resumen['fecha_hasta']
+        },
+        'top_emisores': dict(emisores_top),
+        'top_productos': dict(productos_top)
+    }
+
+
+def _impuestos_de_fila(valor) -> list:
+    """Convierte el JSON de la columna Impuestos (o la lista sin serializar) en filas de impuesto."""
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor) if valor else []
+        except ValueError:
+            valor = []
+    return valor if isinstance(valor, list) else []
+
+
+_SQL_SUMAR_EMISOR = (
+    "INSERT INTO dte_resumen_emisores (NombreComercial, monto) VALUES (?, ?) "
+    "ON CONFLICT (NombreComercial) DO UPDATE SET monto = monto + excluded.monto"
+)
+_SQL_SUMAR_PRODUCTO = (
+    "INSERT INTO dte_resumen_productos (Descripcion, cantidad) VALUES (?, ?) "
+    "ON CONFLICT (Descripcion) DO UPDATE SET cantidad = cantidad + excluded.cantidad"
+)
+
+# Posición de cada columna en las tuplas que arma _insertar_lote
+_POS_DOCUMENTO = {c: i + 1 for i, c in enumerate(COLUMNAS_DOCUMENTO)}
+_POS_LINEA = {c: i + 2 for i, c in enumerate(COLUMNAS_LINEA)}
+
+
+def _actualizar_resumen(cursor, documentos: list, lineas: list, montos_emisor: dict, cantidades_producto: dict):
+    """
+    Suma al resumen de estadísticas los documentos y líneas recién insertados.
+
+    Corre en la misma transacción que la inserción, así que el resumen nunca
+    queda desfasado de los datos.
+    """
+    pos_total, pos_cantidad = _POS_LINEA['Total'], _POS_LINEA['Cantidad']
+    fechas = [d[_POS_DOCUMENTO['FechaHoraEmision']] for d in documentos]
+    fechas = [f for f in fechas if f is not None]
+    desde, hasta = min(fechas, default=None), max(fechas, default=None)
+
+    nuevos = {}
+    for campo, contador in CAMPOS_DISTINTOS.items():
+        valores = {(campo, d[_POS_DOCUMENTO[campo]]) for d in documentos} - {(campo, None)}
+        cursor.executemany("INSERT OR IGNORE INTO dte_resumen_valores (campo, valor) VALUES (?, ?)", valores)
+        nuevos[contador] = cursor.rowcount if valores else 0
+
+    cursor.executemany(_SQL_SUMAR_EMISOR, montos_emisor.items())
+    cursor.executemany(_SQL_SUMAR_PRODUCTO, cantidades_producto.items())
+
+    cursor.execute("INSERT OR IGNORE INTO dte_resumen (id) VALUES (1)")
+    cursor.execute(
+        f"""
+        UPDATE dte_resumen SET
+            total_registros = total_registros + ?,
+            monto_total = monto_total + ?,
+            cantidad_total = cantidad_total + ?,
+            fecha_desde = COALESCE(MIN(fecha_desde, ?), fecha_desde, ?),
+            fecha_hasta = COALESCE(MAX(fecha_hasta, ?), fecha_hasta, ?),
+            {", ".join(f"{contador} = {contador} + ?" for contador in nuevos)}
+        WHERE id = 1
+        """,
+        (
+            len(lineas),
+            sum(l[pos_total] or 0.0 for l in lineas),
+            sum(l[pos_cantidad] or 0.0 for l in lineas),
+            desde, desde,
+            hasta, hasta,
+            *nuevos.values(),
+        )
+    )
+
+
+_SQL_INSERTAR_DOCUMENTO = "INSERT OR IGNORE INTO dte_documentos (id, {}) VALUES ({})".format(
+    ", ".join(COLUMNAS_DOCUMENTO), ", ".join("?" * (len(COLUMNAS_DOCUMENTO) + 1))
+)
+_SQL_INSERTAR_LINEA = "INSERT OR IGNORE INTO dte_lineas (id, documento_id, {}) VALUES ({})".format(
+    ", ".join(COLUMNAS_LINEA), ", ".join("?" * (len(COLUMNAS_LINEA) + 2))
+)
+_SQL_INSERTAR_IMPUESTO = (
+    "INSERT INTO dte_impuestos (linea_id, NombreCorto, MontoGravable, MontoImpuesto) VALUES (?, ?, ?, ?)"
+)
+
+
+# Extraen en C las tuplas de parámetros de cada fila (más rápido que un genexpr por columna)
+_clave_documento = itemgetter(*CLAVE_DOCUMENTO)
+_clave_sin_autorizacion = itemgetter(*CLAVE_DOCUMENTO_SIN_AUTORIZACION)
+_valores_documento = itemgetter(*COLUMNAS_DOCUMENTO)
+_valores_linea = itemgetter(*COLUMNAS_LINEA)
+
+
+def _en_porciones(valores: list, tamano: int = 500):
+    """Parte una lista para no pasar el límite de parámetros de SQLite en un IN (...)."""
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _normalizar_claves(fila: dict):
+    """Claves vacías -> None (se guardan como NULL, ver INDICES_UNICOS)."""
+    if not fila['NumeroAutorizacion_Texto']:
+        fila['NumeroAutorizacion_Texto'] = None
+    if not fila['Linea_Numero']:
+        fila['Linea_Numero'] = None
+
+
+def _clave_de_fila(fila: dict) -> tuple:
+    """
+    Clave del documento de la fila: (NumeroAutorizacion_Texto, DTE_ID), o
+    (None, DTE_ID, Archivo) si no trae número de autorización.
+    """
+    if fila['NumeroAutorizacion_Texto'] is None:
+        return (None,) + _clave_sin_autorizacion(fila)
+    return _clave_documento(fila)
+
+
+def _ids_existentes(cursor, claves: set) -> dict:
+    """Busca los documentos ya guardados para un conjunto de claves (ver _clave_de_fila)."""
+    existentes = {}
+    for porcion in _en_porciones(list({clave[0] for clave in claves if clave[0] is not None})):
+        cursor.execute(
+            "SELECT id, NumeroAutorizacion_Texto, DTE_ID FROM dte_documentos "
+            f"WHERE NumeroAutorizacion_Texto IN ({', '.join('?' * len(porcion))})",
+            porcion
+        )
+        for doc_id, autorizacion, dte_id in cursor.fetchall():
+            if (autorizacion, dte_id) in claves:
+                existentes[(autorizacion, dte_id)] = doc_id
+
+    for porcion in _en_porciones(list({clave[2] for clave in claves if clave[0] is None})):
+        cursor.execute(
+            "SELECT id, DTE_ID, Archivo FROM dte_documentos "
+            f"WHERE NumeroAutorizacion_Texto IS NULL AND Archivo IN ({', '.join('?' * len(porcion))})",
+            porcion
+        )
+        for doc_id, dte_id, archivo in cursor.fetchall():
+            if (None, dte_id, archivo) in claves:
+                existentes[(None, dte_id, archivo)] = doc_id
+    return existentes
+
+
+def _lineas_existentes(cursor, doc_ids: list) -> set:
+    """Devuelve los (documento_id, Linea_Numero) ya guardados para esos documentos."""
+    existentes = set()
+    for porcion in _en_porciones(doc_ids):
+        cursor.execute(
+            f"SELECT documento_id, Linea_Numero FROM dte_lineas WHERE documento_id IN ({', '.join('?' * len(porcion))})",
+            porcion
+        )
+        existentes.update(cursor.fetchall())
+    return existentes
+
+
+def _insertar_lote(cursor, lote: list, creados: set):
+    """
+    Inserta un lote de filas omitiendo los documentos y líneas que ya existen.
+
+    Trabaja directo sobre el cursor DBAPI (executemany con tuplas) para no pagar
+    la conversión de parámetros de SQLAlchemy fila por fila.
+
+    Las líneas sin NumeroLinea no se pueden comparar una por una: se insertan
+    si su documento es nuevo en esta carga (`creados`) y se omiten si el
+    documento ya estaba guardado de antes.
+
+    Returns:
+        Tupla (líneas insertadas, líneas omitidas por duplicadas, líneas que la
+        BD ignoró por clave repetida sin que las detectara el filtro)
+    """
+    for fila in lote:
+        _normalizar_claves(fila)
+    claves = {_clave_de_fila(fila) for fila in lote}
+    doc_por_clave = _ids_existentes(cursor, claves)
+    lineas_vistas = _lineas_existentes(cursor, list(doc_por_clave.values()))
+
+    # Los ids se asignan aquí para poder insertar cada tabla en un solo executemany
+    doc_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM dte_documentos").fetchone()[0]
+    linea_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM dte_lineas").fetchone()[0]
+
+    documentos, lineas, impuestos = [], [], []
+    montos_emisor, cantidades_producto = {}, {}
+    omitidas = 0
+
+    for fila in lote:
+        clave = _clave_de_fila(fila)
+        documento_id = doc_por_clave.get(clave)
+        if documento_id is None:
+            doc_id += 1
+            documento_id = doc_por_clave[clave] = doc_id
+            documentos.append((doc_id,) + _valores_documento(fila))
+            creados.add(doc_id)
+
+        if fila['Linea_Numero'] is None:
+            if documento_id not in creados:
+                omitidas += 1
+                continue
+        else:
+            linea_clave = (documento_id, fila['Linea_Numero'])
+            if linea_clave in lineas_vistas:
+                omitidas += 1
+                continue
+            lineas_vistas.add(linea_clave)
+
+        linea_id += 1
+        lineas.append((linea_id, documento_id) + _valores_linea(fila))
+
+        nombre, descripcion = fila['NombreComercial'], fila['Descripcion']
+        if nombre is not None:
+            montos_emisor[nombre] = montos_emisor.get(nombre, 0.0) + (fila['Total'] or 0.0)
+        if descripcion is not None:
+            cantidades_producto[descripcion] = cantidades_producto.get(descripcion, 0.0) + (fila['Cantidad'] or 0.0)
+
+        for imp in _impuestos_de_fila(fila.get('Impuestos')):
+            impuestos.append((
+                linea_id,
+                imp.get('nombre', ''),
+                to_float_safe(imp.get('monto_gravable')),
+                to_float_safe(imp.get('monto_impuesto')),
+            ))
+
+    # OR IGNORE respalda a nivel de BD lo que ya se filtró arriba con las claves únicas;
+    # si igual descarta algo, se informa (no debería pasar)
+    ignoradas = 0
+    if documentos:
+        cursor.executemany(_SQL_INSERTAR_DOCUMENTO, documentos)
+        if cursor.rowcount >= 0 and cursor.rowcount < len(documentos):
+            print(f"⚠️ {len(documentos) - cursor.rowcount} documento(s) ignorado(s) por clave repetida")
+    if lineas:
+        cursor.executemany(_SQL_INSERTAR_LINEA, lineas)
+        if cursor.rowcount >= 0:
+            ignoradas = len(lineas) - cursor.rowcount
+        if ignoradas:
+            print(f"⚠️ {ignoradas} línea(s) ignorada(s) por clave repetida")
+    if impuestos:
+        cursor.executemany(_SQL_INSERTAR_IMPUESTO, impuestos)
+    if lineas:
+        _actualizar_resumen(cursor, documentos, lineas, montos_emisor, cantidades_producto)
+
+    return len(lineas) - ignoradas, omitidas, ignoradas
+
+
+def _insertar_por_lotes(cursor, filas, tamano_lote: int):
+    """Agrupa las filas en lotes y los inserta. Devuelve (insertadas, omitidas, ignoradas)."""
+    insertadas = omitidas = ignoradas = 0
+    creados = set()  # documentos nuevos de esta carga (un DTE puede quedar entre dos lotes)
+    lote = []
+
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            nuevas, repetidas, descartadas = _insertar_lote(cursor, lote, creados)
+            insertadas += nuevas
+            omitidas += repetidas
+            ignoradas += descartadas
+            lote = []
+
+    if lote:
+        nuevas, repetidas, descartadas = _insertar_lote(cursor, lote, creados)
+        insertadas += nuevas
+        omitidas += repetidas
+        ignoradas += descartadas
+
+    return insertadas, omitidas, ignoradas
+
+
+def miembros_ya_procesados(engine, claves: list) -> set:
+    """
+    Devuelve cuáles de esas claves de miembro (nombre, crc32, tamaño) ya se cargaron.
+
+    Solo consulta los nombres del ZIP recibido, por porciones (usa la clave primaria).
+    """
+    claves = set(claves)
+    existentes = set()
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            for porcion in _en_porciones(list({clave[0] for clave in claves})):
+                cursor.execute(
+                    "SELECT nombre, crc32, tamano FROM xml_miembros_procesados "
+                    f"WHERE nombre IN ({', '.join('?' * len(porcion))})",
+                    porcion
+                )
+                existentes.update(clave for clave in cursor.fetchall() if clave in claves)
+        finally:
+            cursor.close()
+    return existentes
+
+
+def registrar_miembros(engine, claves: list, fecha_carga: str):
+    """
+    Marca los miembros como cargados para que las próximas subidas los salten.
+
+    Llamar solo después de que sus filas quedaron guardadas: si la carga falla,
+    los miembros se vuelven a parsear la próxima vez (las filas repetidas las
+    descarta la clave única de documentos y líneas).
+    """
+    if not claves:
+        return
+    with engine.begin() as conn:
+        conn.connection.cursor().executemany(
+            "INSERT OR IGNORE INTO xml_miembros_procesados (nombre, crc32, tamano, fecha_carga) VALUES (?, ?, ?, ?)",
+            [clave + (fecha_carga,) for clave in claves]
+        )
+
+
+def filas_de_dataframe(df):
+    """
+    Recorre un DataFrame como diccionarios (uno por fila) para cargar_masivo.
+
+    Convierte columna por columna con tolist(), que deja tipos nativos de Python
+    y es bastante más rápido que DataFrame.to_dict('records').
+    """
+    columnas = list(df.columns)
+    for valores in zip(*(df[c].tolist() for c in columnas)):
+        yield dict(zip(columnas, valores))
+
+
+@contextmanager
+def _conexion_carga_masiva(engine):
+    """
+    Conexión DBAPI con los PRAGMAs de carga y una única transacción (BEGIN IMMEDIATE).
+
+    Al salir se hace commit (o rollback si hubo error) y se restauran los PRAGMAs
+    de la conexión, que vuelve al pool de SQLAlchemy.
+    """
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    originales = {
+        pragma: cursor.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in PRAGMAS_CARGA
+    }
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")  # persistente: queda en el archivo de la BD
+        for pragma, valor in PRAGMAS_CARGA.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+    finally:
+        for pragma, valor in originales.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+        cursor.close()
+        raw.close()
+
+
+def cargar_masivo(engine, filas, tamano_lote: int = TAMANO_LOTE):
+    """
+    Carga rápida: toda la subida en una sola transacción, con executemany crudo
+    y los PRAGMAs de PRAGMAS_CARGA.
+
+    `filas` puede ser cualquier iterable (por ejemplo iterar_filas_de_zip), así que
+    las filas pueden ir del parser a la BD sin armar un DataFrame.
+
+    Args:
+        engine: Engine de SQLAlchemy (SQLite)
+        filas: Iterable de diccionarios con COLUMNAS_DTE + fecha_carga
+        tamano_lote: Filas por lote de inserción
+
+    Returns:
+        Tupla (líneas insertadas, líneas omitidas por duplicadas, líneas ignoradas por la BD)
+    """
+    with _conexion_carga_masiva(engine) as cursor:
+        return _insertar_por_lotes(cursor, filas, tamano_lote)